@@ -1,42 +1,126 @@
+import gc
+
 from PyQt5.QtCore import QObject, pyqtSignal
 import numpy as np
 from convolution_handler import ConvolutionHandler
+from cancellation import CancellationToken, OperationCancelled
 class ConvolutionWorker(QObject):
     progress_updated = pyqtSignal(int)
     result_ready = pyqtSignal(np.ndarray)
     error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, image, psf, scale_factor):
+    def __init__(self, image, psf, scale_factor, z_index=None, backend=None, tile_rows=None):
         super().__init__()
         self.image = image
         self.psf = psf
         self.scale_factor = scale_factor
+        self.z_index = z_index
+        self.backend = backend  # 可选进程池后端，计算不占用GUI进程的GIL
+        self.tile_rows = tile_rows  # 内存规划给出的卷积行块高度
         self._is_running = True
+        self._cancel_token = CancellationToken()
 
     def process(self):
         try:
-            # 模拟进度更新
-            self.progress_updated.emit(10)
-
-            # 执行卷积
-            result = ConvolutionHandler.convolve(
+            # 分块执行卷积，块间报告进度并检查取消
+            convolve = self.backend.convolve if self.backend is not None else ConvolutionHandler.convolve
+            result = convolve(
                 self.image,
                 self.psf,
                 self.scale_factor,
-                progress_callback=self.update_progress
+                z_index=self.z_index,
+                progress_callback=self.update_progress,
+                cancel_token=self._cancel_token,
+                tile_rows=self.tile_rows
             )
 
-            self.progress_updated.emit(100)
             self.result_ready.emit(result)
 
+        except OperationCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error_occurred.emit(str(e))
         finally:
             self._is_running = False
+            # 及时释放输入引用，取消后中间结果随之回收
+            self.image = None
+            self.psf = None
+            gc.collect()
 
     def update_progress(self, value):
         if self._is_running:
             self.progress_updated.emit(value)
 
     def stop(self):
-        self._is_running = False
\ No newline at end of file
+        self._is_running = False
+        self._cancel_token.cancel()
+
+
+class BatchWorker(QObject):
+    """目录批量处理工作对象（在QThread中运行 BatchPipeline）"""
+    progress_updated = pyqtSignal(int, int, float)  # 已完成数, 总数, 图像/秒
+    batch_finished = pyqtSignal(object)  # BatchReport
+    error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, pipeline, paths, output_dir):
+        super().__init__()
+        self.pipeline = pipeline
+        self.paths = paths
+        self.output_dir = output_dir
+        self._cancel_token = CancellationToken()
+
+    def process(self):
+        try:
+            report = self.pipeline.run(self.paths, self.output_dir,
+                                       progress_callback=self.progress_updated.emit,
+                                       cancel_token=self._cancel_token)
+            self.batch_finished.emit(report)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+
+    def stop(self):
+        self._cancel_token.cancel()
+
+
+class VolumeSaveWorker(QObject):
+    """逐层计算并写入 .psv 文件的工作对象（内存中只保留一个数据块）"""
+    progress_updated = pyqtSignal(int, int)  # 已写入层数, 总层数
+    save_finished = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, plane_source, depth, path, metadata=None, ndim=3):
+        super().__init__()
+        self.plane_source = plane_source  # (z_index, cancel_token) -> 二维结果层
+        self.depth = depth
+        self.path = path
+        self.metadata = metadata
+        self.ndim = ndim
+        self._cancel_token = CancellationToken()
+
+    def process(self):
+        from volume_file import VolumeWriter
+        writer = None
+        try:
+            for i in range(self.depth):
+                plane = self.plane_source(i if self.ndim == 3 else None, self._cancel_token)
+                if writer is None:
+                    writer = VolumeWriter(self.path, plane.shape, ndim=self.ndim, metadata=self.metadata)
+                writer.write(plane)
+                self.progress_updated.emit(i + 1, self.depth)
+            writer.close()
+            self.save_finished.emit(self.path)
+        except OperationCancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+        finally:
+            if writer is not None:
+                writer.abort()  # 未写完时删除临时文件；已完成时不做任何事
+
+    def stop(self):
+        self._cancel_token.cancel()
@@ -0,0 +1,163 @@
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from cancellation import OperationCancelled
+from preview_pipeline import OTFPyramid
+from volume_file import open_stack, save_volume
+
+IMAGE_EXTENSIONS = ('.tif', '.tiff', '.png', '.jpg', '.jpeg', '.bmp', '.psv')
+
+BatchReport = namedtuple('BatchReport', ['processed', 'failed', 'elapsed', 'images_per_second'])
+
+_DONE = object()  # 队列结束标记
+
+
+class BatchPipeline:
+    """目录批量卷积流水线
+
+    读取线程预取并解码后续文件，计算线程用缓存的OTF卷积，写出线程保存结果；
+    各阶段之间为有界队列，下游变慢时上游自动阻塞（背压），在途图像数不超过
+    读取线程数 + 2×queue_size + 计算线程数，内存占用与文件总数无关。
+    """
+
+    def __init__(self, psf, z_index=None, readers=2, workers=None, writers=1, queue_size=4,
+                 output_format='tif'):
+        if psf.ndim == 3 and z_index is None:
+            raise ValueError("三维PSF需要指定z_index参数")
+        if output_format not in ('tif', 'npy', 'psv'):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        self.psf = psf
+        self.z_index = z_index
+        self.readers = readers
+        self.workers = workers or max(1, min(4, os.cpu_count() or 1))
+        self.writers = writers
+        self.queue_size = queue_size
+        self.output_format = output_format
+        self.otf_cache = OTFPyramid()  # 同尺寸图像共用一份OTF
+
+    @staticmethod
+    def list_images(directory):
+        """按文件名顺序列出目录中的图像文件"""
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+
+    def output_path(self, path, output_dir):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(output_dir, f"{stem}_conv.{self.output_format}")
+
+    # ---------- 各阶段 ----------
+    @staticmethod
+    def load(path):
+        # """读取图像为 float32 数组（多页TIFF为三维）"""
+        stack = open_stack(path)
+        return stack.page(0) if stack.ndim == 2 else np.asarray(stack)
+
+    def process(self, image):
+        # """卷积单幅图像，结果与 ConvolutionHandler.convolve 一致"""
+        return np.clip(self.otf_cache.convolve(image, self.psf, self.z_index), 0, 1)
+
+    def save(self, result, path):
+        if self.output_format == 'npy':
+            np.save(path, result)
+        elif self.output_format == 'psv':
+            save_volume(path, result, metadata={'kind': 'result', 'z_index': self.z_index})
+        else:
+            Image.fromarray(np.ascontiguousarray(result, dtype=np.float32), mode='F').save(path)
+
+    # ---------- 运行 ----------
+    def run(self, paths, output_dir, progress_callback=None, cancel_token=None):
+        """处理全部文件，返回 BatchReport；progress_callback(已完成数, 总数, 图像/秒)"""
+        paths = list(paths)
+        os.makedirs(output_dir, exist_ok=True)
+        pending = queue.Queue()
+        for path in paths:
+            pending.put(path)
+        loaded = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=self.queue_size)
+
+        lock = threading.Lock()
+        failed = []
+        processed = [0]
+        start = time.perf_counter()
+
+        def stopped():
+            return cancel_token is not None and cancel_token.cancelled
+
+        def fail(path, error):
+            with lock:
+                failed.append((path, str(error)))
+            finished()
+
+        def finished():
+            with lock:
+                done = processed[0] + len(failed)
+            if progress_callback:
+                elapsed = time.perf_counter() - start
+                progress_callback(done, len(paths), processed[0] / elapsed if elapsed > 0 else 0.0)
+
+        def read():
+            while not stopped():
+                try:
+                    path = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    loaded.put((path, self.load(path)))
+                except Exception as e:
+                    fail(path, e)
+
+        def compute():
+            while True:
+                item = loaded.get()
+                if item is _DONE:
+                    return
+                if stopped():
+                    continue  # 取消后继续取空队列，避免读取线程阻塞
+                path, image = item
+                try:
+                    results.put((path, self.process(image)))
+                except Exception as e:
+                    fail(path, e)
+
+        def write():
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    return
+                if stopped():
+                    continue
+                path, result = item
+                try:
+                    self.save(result, self.output_path(path, output_dir))
+                except Exception as e:
+                    fail(path, e)
+                    continue
+                with lock:
+                    processed[0] += 1
+                finished()
+
+        stages = []
+        for target, count, downstream in ((read, self.readers, loaded), (compute, self.workers, results),
+                                          (write, self.writers, None)):
+            threads = [threading.Thread(target=target, daemon=True) for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            stages.append((threads, downstream))
+        # 上一阶段全部结束后向下一阶段发送结束标记
+        for threads, downstream in stages:
+            for thread in threads:
+                thread.join()
+            if downstream is not None:
+                for _ in range(self.workers if downstream is loaded else self.writers):
+                    downstream.put(_DONE)
+
+        if stopped():
+            raise OperationCancelled("批量处理已取消")
+        elapsed = time.perf_counter() - start
+        return BatchReport(processed[0], failed, elapsed, processed[0] / elapsed if elapsed > 0 else 0.0)
@@ -0,0 +1,298 @@
+"""性能基准测试（命令行）
+
+    python benchmark.py run -o bench.json [--sizes 64 128 256 512] [--groups generate convolve gui]
+    python benchmark.py compare baseline.json bench.json [--threshold 0.2]
+    python benchmark.py run -o bench.json --baseline baseline.json
+
+每个用例在独立的子进程中运行：首次运行（含惰性导入与FFT规划）单独记录，之后重复计时取中位数；
+同时记录峰值常驻内存（RSS）增量与 tracemalloc 统计的峰值分配。
+compare 对比两个结果文件，耗时或峰值分配超出阈值的用例标记为退化，存在退化时返回码为1。
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+GROUPS = ('generate', 'convolve', 'gui')
+DEFAULT_SIZES = (64, 128, 256)
+GENERATE_MODELS = ('bessel', 'gaussian', 'airy')
+CONVOLVE_METHODS = ('auto', 'direct', 'fft', 'overlap_add', 'separable', 'sparse')
+CONVOLVE_OBJECTS = ('drawing', 'volume')  # 沿z广播的绘图 / 稀疏三维体
+
+
+def list_cases(groups=GROUPS, sizes=DEFAULT_SIZES, models=GENERATE_MODELS, methods=CONVOLVE_METHODS):
+    """用例编号：组/名称/参数.../尺寸"""
+    cases = []
+    for size in sizes:
+        if 'generate' in groups:
+            cases += [f"generate/{model}/{size}" for model in models]
+        if 'convolve' in groups:
+            cases += [f"convolve/{method}/{obj}/{size}" for method in methods for obj in CONVOLVE_OBJECTS]
+        if 'gui' in groups:
+            cases += [f"gui/getImageArray/2d/{size}", f"gui/getImageArray/3d/{size}", f"gui/floodFill/{size}"]
+    return cases
+
+
+# ---------- 用例（在子进程中构造） ----------
+def _build_generate(model, size):
+    import simulation_engine
+    params = {'size': size} if model == 'airy' else {'size': size, 'size_z': size}
+    return lambda: simulation_engine.generate_psf(model, params), None
+
+
+def _build_convolve(method, obj, size):
+    # """N×N×N 物体与 (N/4)×(N/4)×N 高斯衍射PSF，计算中间层；返回 (运行函数, 预计耗时)"""
+    from convolution_handler import ConvolutionHandler
+    from psf_generator import PSFGenerator
+    rng = np.random.default_rng(0)
+    psf = PSFGenerator.generate_gaussian(size=max(size // 4, 3), size_z=size)
+    if obj == 'drawing':
+        plane = np.zeros((size, size), dtype=np.float32)
+        plane[size // 4:3 * size // 4, size // 4] = 1
+        plane[size // 4, size // 4:3 * size // 4] = 1
+        image = np.broadcast_to(plane[:, :, None], plane.shape + (size,))
+    else:
+        image = (rng.random((size, size, size)) < 0.01).astype(np.float32)
+    z_index = size // 2
+
+    dispatcher = ConvolutionHandler.dispatcher
+    estimate = 0.0
+    for plane, kernel in ConvolutionHandler.plane_pairs(image, psf, z_index):
+        costs = dispatcher.estimate(plane, kernel)
+        estimate += min(costs.values()) if method == 'auto' else costs[method]
+
+    def run():
+        return ConvolutionHandler.convolve(image, psf, z_index=z_index, method=method)
+    return run, estimate
+
+
+_app = None
+
+
+def _qt_app():
+    # 界面用例需要 QApplication；无显示环境时使用 offscreen 平台
+    global _app
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    _app = QApplication.instance() or QApplication([])
+
+
+def _build_get_image_array(mode, size):
+    _qt_app()
+    from drawing_widget import DrawingWidget
+    widget = DrawingWidget(size)
+    widget.set_3d_params(mode == '3d', size)
+    widget.canvas[size // 4:3 * size // 4, size // 2] = 0
+    return widget.getImageArray, None
+
+
+def _build_flood_fill(size):
+    # """矩形边框内部填充；每次运行前恢复画布（一次内存复制）"""
+    _qt_app()
+    from PyQt5.QtCore import QPoint
+    from drawing_widget import DrawingWidget
+    widget = DrawingWidget(size)
+    lo, hi = size // 8, 7 * size // 8
+    widget.canvas[lo:hi, [lo, hi - 1]] = 0
+    widget.canvas[[lo, hi - 1], lo:hi] = 0
+    template = widget.canvas.copy()
+    seed = QPoint(size // 2, size // 2)
+
+    def run():
+        widget.canvas[...] = template
+        widget.floodFill(seed)
+    return run, None
+
+
+def _build(case):
+    group, name, *params = case.split('/')
+    size = int(params.pop())
+    if group == 'generate':
+        return _build_generate(name, size)
+    if group == 'convolve':
+        return _build_convolve(name, params[0], size)
+    if name == 'getImageArray':
+        return _build_get_image_array(params[0], size)
+    if name == 'floodFill':
+        return _build_flood_fill(size)
+    raise ValueError(f"未知的用例: {case}")
+
+
+def _peak_rss():
+    # """进程峰值常驻内存（字节）；Windows 上无 resource 模块时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(case, repeats=5, max_seconds=30.0):
+    """在当前进程中测量一个用例"""
+    try:
+        run, estimate = _build(case)
+    except ValueError as e:
+        return {'skipped': str(e)}
+    if estimate is not None and not np.isfinite(estimate):
+        return {'skipped': "该方法不适用于此卷积核"}
+    if estimate is not None and estimate > max_seconds:
+        return {'skipped': f"预计耗时 {estimate:.1f} s，超过 {max_seconds:g} s"}
+
+    rss_before = _peak_rss()
+    try:
+        start = time.perf_counter()
+        run()
+        first = time.perf_counter() - start
+        times = []
+        # 首次运行已超过单用例时限时不再重复
+        for _ in range(repeats if first <= max_seconds else 0):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+    except ValueError as e:  # 如卷积核不可分离
+        return {'skipped': str(e)}
+    rss_after = _peak_rss()
+
+    alloc_peak = None
+    if first <= max_seconds:
+        tracemalloc.start()
+        run()
+        alloc_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    times = times or [first]
+    return {
+        'first': first,
+        'median': statistics.median(times),
+        'min': min(times),
+        'times': times,
+        'rss_growth': None if rss_before is None else rss_after - rss_before,
+        'peak_rss': rss_after,
+        'alloc_peak': alloc_peak,
+    }
+
+
+def run_suite(cases, repeats=5, max_seconds=30.0, log=None):
+    """逐个用例在新的子进程中测量，返回结果字典"""
+    results = {}
+    for i, case in enumerate(cases):
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as executor:
+            results[case] = executor.submit(measure, case, repeats, max_seconds).result()
+        if log:
+            log(i + 1, len(cases), case, results[case])
+    return {'meta': _meta(repeats, max_seconds), 'results': results}
+
+
+def _meta(repeats, max_seconds):
+    import scipy
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeats': repeats,
+        'max_seconds': max_seconds,
+    }
+
+
+# ---------- 对比 ----------
+def compare(baseline, current, threshold=0.2, min_delta=1e-3):
+    """对比两次结果：中位耗时或峰值分配增加超过 threshold（且耗时差超过 min_delta 秒）记为退化"""
+    rows = []
+    base_results, cur_results = baseline['results'], current['results']
+    for case in sorted(set(base_results) & set(cur_results)):
+        base, cur = base_results[case], cur_results[case]
+        if 'median' not in base or 'median' not in cur:
+            continue
+        ratio = cur['median'] / base['median'] if base['median'] > 0 else float('inf')
+        reasons = []
+        if ratio > 1 + threshold and cur['median'] - base['median'] > min_delta:
+            reasons.append(f"耗时 ×{ratio:.2f}")
+        if base.get('alloc_peak') and cur.get('alloc_peak') is not None:
+            alloc_ratio = cur['alloc_peak'] / base['alloc_peak']
+            if alloc_ratio > 1 + threshold and cur['alloc_peak'] - base['alloc_peak'] > 1 << 20:
+                reasons.append(f"峰值分配 ×{alloc_ratio:.2f}")
+        status = 'regression' if reasons else ('improved' if ratio < 1 / (1 + threshold) else 'ok')
+        rows.append({'case': case, 'baseline': base['median'], 'current': cur['median'], 'ratio': ratio,
+                     'status': status, 'reasons': reasons})
+    return rows
+
+
+def _print_comparison(rows, file=sys.stdout):
+    labels = {'regression': "退化", 'improved': "改善", 'ok': ""}
+    print(f"{'用例':40s} {'基线(ms)':>10} {'当前(ms)':>10} {'比值':>7}", file=file)
+    for row in rows:
+        note = labels[row['status']] + (f"（{'，'.join(row['reasons'])}）" if row['reasons'] else "")
+        print(f"{row['case']:40s} {row['baseline'] * 1000:10.2f} {row['current'] * 1000:10.2f} "
+              f"{row['ratio']:7.2f}  {note}", file=file)
+    n = sum(row['status'] == 'regression' for row in rows)
+    print(f"共 {len(rows)} 个用例，{n} 个退化", file=file)
+    return n
+
+
+def _log(done, total, case, result):
+    if 'skipped' in result:
+        text = f"跳过：{result['skipped']}"
+    else:
+        alloc = result['alloc_peak']
+        text = f"中位 {result['median'] * 1000:.2f} ms，首次 {result['first'] * 1000:.2f} ms" + \
+            (f"，峰值分配 {alloc / 2 ** 20:.1f} MB" if alloc is not None else "")
+    print(f"[{done}/{total}] {case}: {text}", file=sys.stderr, flush=True)
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PSF仿真性能基准测试")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="运行基准测试")
+    run_parser.add_argument('-o', '--output', required=True, help="结果 JSON 路径")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                            help="网格尺寸 N（PSF为 N³，图像为 N²；可到 512）")
+    run_parser.add_argument('--groups', nargs='+', choices=GROUPS, default=list(GROUPS))
+    run_parser.add_argument('--models', nargs='+', choices=GENERATE_MODELS, default=list(GENERATE_MODELS))
+    run_parser.add_argument('--methods', nargs='+', choices=CONVOLVE_METHODS, default=list(CONVOLVE_METHODS))
+    run_parser.add_argument('--filter', help="只运行编号包含该字符串的用例")
+    run_parser.add_argument('--repeats', type=int, default=5)
+    run_parser.add_argument('--max-seconds', type=float, default=30.0,
+                            help="单次运行的耗时上限，预计超出的用例跳过")
+    run_parser.add_argument('--baseline', help="运行后与该结果文件对比")
+    run_parser.add_argument('--threshold', type=float, default=0.2)
+    compare_parser = commands.add_parser('compare', help="对比两个结果文件")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help="相对退化阈值（0.2 即 20%%）")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        cases = list_cases(args.groups, args.sizes, args.models, args.methods)
+        if args.filter:
+            cases = [case for case in cases if args.filter in case]
+        report = run_suite(cases, args.repeats, args.max_seconds, log=_log)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        if not args.baseline:
+            return 0
+        baseline, current = _load(args.baseline), report
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+    return 1 if _print_comparison(compare(baseline, current, args.threshold)) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
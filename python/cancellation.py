@@ -0,0 +1,23 @@
+import threading
+
+
+class OperationCancelled(Exception):
+    """运算被用户取消"""
+
+
+class CancellationToken:
+    """协作式取消令牌：计算引擎在分块之间检查，收到取消请求后尽快退出"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("运算已取消")
@@ -0,0 +1,182 @@
+"""PSF仿真命令行入口（无需图形界面）
+
+    python cli.py run job.toml [--set psf.wavelength=6e-7] [--workers 4] [--processes] [--memory-budget 2G]
+    python cli.py plan job.toml [--memory-budget 2G]
+    python cli.py sweep sweep.toml results/ [--workers 8]
+    python cli.py serve [--port 8765] [--output-dir results/]
+    python cli.py models
+
+任务文件格式见 simulation_engine.run_job，扫描任务另含 sweep 表（见 sweep_runner.expand_axes）；
+运行前按内存预算规划（见 memory_planner），超出预算时自动改用分块、单精度或磁盘临时文件；
+Ctrl+C 在分块之间取消运算，扫描中断后以相同命令续算；serve 启动本机仿真服务（见 simulation_service）。
+"""
+import argparse
+import json
+import signal
+import sys
+
+from cancellation import CancellationToken, OperationCancelled
+import simulation_engine
+
+
+def _override(job, assignment):
+    # """--set a.b=值：值按 JSON 解析，失败时作为字符串"""
+    key, sep, text = assignment.partition('=')
+    if not sep:
+        raise ValueError(f"--set 需要 键=值 形式: {assignment}")
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = text
+    *parents, leaf = key.split('.')
+    node = job
+    for name in parents:
+        node = node.setdefault(name, {})
+    node[leaf] = value
+
+
+def _progress(percent):
+    print(f"\r进度 {percent:3d}%", end='', file=sys.stderr, flush=True)
+
+
+def _load(args):
+    job = simulation_engine.load_job(args.job)
+    for assignment in args.set:
+        _override(job, assignment)
+    return job
+
+
+def _plan(job, args):
+    from memory_planner import parse_size, plan_job
+    budget = parse_size(args.memory_budget) if args.memory_budget else None
+    return plan_job(job, budget, workers=args.workers, processes=args.processes)
+
+
+def run(args):
+    job = _load(args)
+    plan = _plan(job, args)
+    if not args.quiet:
+        print(plan.describe(), file=sys.stderr)
+
+    token = CancellationToken()
+    signal.signal(signal.SIGINT, lambda *_: token.cancel())
+    backend = None
+    if args.processes:
+        from process_pool import get_backend
+        backend = get_backend()
+    try:
+        summary = simulation_engine.run_job(job, progress_callback=None if args.quiet else _progress,
+                                            cancel_token=token, backend=backend, workers=args.workers, plan=plan)
+    finally:
+        if not args.quiet:
+            print(file=sys.stderr)
+        if backend is not None:
+            backend.shutdown()
+    summary['memory'] = plan.to_dict()
+    print(json.dumps(summary, ensure_ascii=False, default=list))
+
+
+def show_plan(args):
+    print(_plan(_load(args), args).describe())
+
+
+def sweep(args):
+    from sweep_runner import SweepRunner, SweepStore
+    job = _load(args)
+    store = SweepStore(args.store, job, chunk_size=args.chunk_size)
+    print(f"扫描共 {store.n_tasks} 个点，已完成 {len(store.completed)} 个", file=sys.stderr)
+
+    token = CancellationToken()
+    signal.signal(signal.SIGINT, lambda *_: token.cancel())
+    backend = None
+    if not args.in_process:
+        from process_pool import ProcessPoolBackend
+        backend = ProcessPoolBackend(max_workers=args.workers)
+    progress = None if args.quiet else lambda done, total: _progress(int(100 * done / total))
+    try:
+        summary = SweepRunner(store, backend, workers=args.workers).run(progress, token)
+    finally:
+        if not args.quiet:
+            print(file=sys.stderr)
+        if backend is not None:
+            backend.shutdown()
+    for failure in summary['failures']:
+        print(f"扫描点 {failure['task']} {failure['params']} 失败: {failure['error']}", file=sys.stderr)
+    print(json.dumps(summary, ensure_ascii=False))
+    # 有失败的点时以非零状态退出，再次运行同一命令只重算失败与未完成的点
+    return 1 if summary['failed'] else 0
+
+
+def serve(args):
+    from simulation_service import make_server
+    server = make_server(args.host, args.port, output_dir=args.output_dir, batch_window=args.batch_window / 1000,
+                         psf_cache_bytes=args.cache_mb * 1024 ** 2, otf_cache_bytes=args.cache_mb * 1024 ** 2)
+    host, port = server.server_address[:2]
+    print(f"仿真服务监听 {host}:{port}（Ctrl+C 停止）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+
+
+def models(args):
+    for key, (method, label, _) in simulation_engine.PSF_MODELS.items():
+        print(f"{key:12s} {label:14s} {', '.join(simulation_engine.model_params(key))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PSF卷积仿真（命令行）")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="执行 JSON/TOML 任务文件")
+    run_parser.add_argument('job', help="任务文件路径（.json 或 .toml）")
+    run_parser.add_argument('--set', action='append', default=[], metavar='键=值',
+                            help="覆盖任务中的字段，如 psf.wavelength=6e-7（可重复）")
+    run_parser.add_argument('--workers', type=int, default=1, help="并行计算的z层数")
+    run_parser.add_argument('--processes', action='store_true', help="在进程池中计算")
+    run_parser.add_argument('--memory-budget', metavar='大小', help="内存预算，如 2G（默认取环境变量 "
+                            "PSF_SIM_MEMORY_BUDGET 或可用内存的一半）")
+    run_parser.add_argument('--quiet', action='store_true', help="不显示进度与内存规划")
+    run_parser.set_defaults(func=run)
+    plan_parser = commands.add_parser('plan', help="只显示任务的内存规划，不运行")
+    plan_parser.add_argument('job', help="任务文件路径")
+    plan_parser.add_argument('--set', action='append', default=[], metavar='键=值', help="覆盖任务中的字段")
+    plan_parser.add_argument('--workers', type=int, default=1, help="并行计算的z层数")
+    plan_parser.add_argument('--processes', action='store_true', help="在进程池中计算")
+    plan_parser.add_argument('--memory-budget', metavar='大小', help="内存预算，如 2G")
+    plan_parser.set_defaults(func=show_plan)
+    sweep_parser = commands.add_parser('sweep', help="执行参数扫描（可续算）")
+    sweep_parser.add_argument('job', help="含 sweep 表的任务文件")
+    sweep_parser.add_argument('store', help="结果目录（已存在时续算）")
+    sweep_parser.add_argument('--set', action='append', default=[], metavar='键=值', help="覆盖任务中的字段")
+    sweep_parser.add_argument('--chunk-size', type=int, default=64, help="每个结果分块文件的扫描点数")
+    sweep_parser.add_argument('--workers', type=int, default=None, help="工作进程数")
+    sweep_parser.add_argument('--in-process', action='store_true', help="不使用进程池")
+    sweep_parser.add_argument('--quiet', action='store_true', help="不显示进度")
+    sweep_parser.set_defaults(func=sweep)
+    serve_parser = commands.add_parser('serve', help="启动本机仿真服务（共享PSF/OTF缓存，合并批量FFT）")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认仅本机）")
+    serve_parser.add_argument('--port', type=int, default=8765, help="端口（0 为自动分配）")
+    serve_parser.add_argument('--batch-window', type=float, default=5.0, help="合并请求的等待时间（毫秒）")
+    serve_parser.add_argument('--output-dir', metavar='目录', help="允许客户端写入结果文件的目录（默认不写文件，"
+                              "结果只经共享内存返回）")
+    serve_parser.add_argument('--cache-mb', type=int, default=512, help="PSF与OTF缓存各自的内存上限（MB）")
+    serve_parser.set_defaults(func=serve)
+    commands.add_parser('models', help="列出PSF模型及参数").set_defaults(func=models)
+
+    args = parser.parse_args(argv)
+    try:
+        status = args.func(args)
+    except OperationCancelled:
+        print("运算已取消", file=sys.stderr)
+        return 130
+    except (ValueError, KeyError, OSError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 1
+    return status or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
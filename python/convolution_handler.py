@@ -1,13 +1,32 @@
 import numpy as np
-from scipy.signal import fftconvolve
+
+from convolution_dispatcher import ConvolutionDispatcher
+from profiling import span
 
 
 class ConvolutionHandler:
+    # 全局卷积方法调度器（按代价模型自动选择方法）
+    dispatcher = ConvolutionDispatcher()
+    last_method = None
+
+    # 分块参数：单块约 2^18 像素，最多 16 块；超过 2^16 像素的图像至少分 4 块，
+    # 使常见尺寸（如 512×512 画布）也能报告中间进度并及时响应取消
+    TILE_PIXELS = 1 << 18
+    MAX_TILES = 16
+    MIN_TILES = 4
+    MIN_TILED_PIXELS = 1 << 16
+
     @staticmethod
-    def convolve(image, psf, scale_factor=1.0, z_index=None, progress_callback=None):
+    def plane_pairs(image, psf, z_index=None):
+        """把输出第z_index层的计算拆为二维 (物体层, PSF层) 对，结果为各对卷积之和
+
+        输出始终为二维的一层：三维物体与三维PSF时等于三维 fftconvolve(image, psf, 'same')
+        的第 z_index + depth//2 - (kz-1)//2 层（z_index 为PSF层索引，物体中间层位于焦面）；
+        三维物体与二维PSF时物体先沿z求和再卷积。
+        """
         # 验证输入
-        # if image.ndim != 2:
-        #     raise ValueError("输入图像必须是二维灰度图")
+        if image.ndim not in [2, 3]:
+            raise ValueError("输入图像必须是二维或三维数组")
         if psf.ndim not in [2, 3]:
             raise ValueError("PSF必须是二维或三维数组")
         if psf.ndim == 3 and z_index is None:
@@ -24,12 +43,83 @@ class ConvolutionHandler:
         else:
             current_psf = scaled_psf
 
-        # 使用FFT加速卷积
-        result = fftconvolve(image, scaled_psf, mode='same')
+        # 组织 (物体层, PSF层) 对
+        if image.ndim == 2:
+            return [(image, current_psf)]
+        if psf.ndim == 2:
+            # 二维PSF视为轴向不变：各层物体投影后成像（惰性图像栈逐页累加）
+            return [(image.sum(axis=2), current_psf)]
+        # 三维物体：第j层位于焦面偏移 j - depth//2 处，对应PSF层 z_index - (j - depth//2)
+        depth = image.shape[2]
+        layers = [(j, z_index - (j - depth // 2)) for j in range(depth)]
+        layers = [(j, k) for j, k in layers if 0 <= k < psf.shape[2]]
+        if isinstance(image, np.ndarray) and image.strides[2] == 0 and layers:
+            # 各层相同（如沿z广播的绘图）：按线性先叠加有效PSF层，只卷积一次
+            return [(image[:, :, 0], scaled_psf[:, :, [k for _, k in layers]].sum(axis=2))]
+        return [(image[:, :, j], scaled_psf[:, :, k]) for j, k in layers]
+
+    @staticmethod
+    def convolve(image, psf, scale_factor=1.0, z_index=None, progress_callback=None, method='auto',
+                 cancel_token=None, tile_rows=None):
+        with span('convolve', image=image.shape, psf=psf.shape, z_index=z_index) as s:
+            pairs = ConvolutionHandler.plane_pairs(image, psf, z_index)
 
-        if progress_callback:
-            progress_callback(50)  # 模拟进度
+            # 按z层与行块分块计算，块间报告真实进度并检查取消
+            # tile_rows 限定每块输出行数（内存预算规划给出），否则按像素数自动分块
+            tiles = [ConvolutionHandler._row_tiles(obj.shape, kernel.shape, tile_rows) for obj, kernel in pairs]
+            total = sum(len(t) for t in tiles)
+            done = 0
+            result = np.zeros(image.shape[:2], dtype=np.float32)
+            for (obj, kernel), row_ranges in zip(pairs, tiles):
+                for r0, r1 in row_ranges:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    result[r0:r1] += ConvolutionHandler._convolve_rows(obj, kernel, r0, r1, method)
+                    done += 1
+                    if progress_callback:
+                        progress_callback(int(100 * done / total))
+            ConvolutionHandler.last_method = ConvolutionHandler.dispatcher.last_method
+            s.set(pairs=len(pairs), tiles=total, method=ConvolutionHandler.last_method)
 
         # 后处理
         result = np.clip(result, 0, 1)
-        return result
\ No newline at end of file
+        return result
+
+    @staticmethod
+    def convolve_line(image, psf, z_index=None, index=0, axis=0, method='auto'):
+        """只计算第z_index层输出的一行（axis=0）或一列（axis=1），只读取对其有贡献的输入行/列带"""
+        line = np.zeros(image.shape[1 - axis], dtype=np.float32)
+        for obj, kernel in ConvolutionHandler.plane_pairs(image, psf, z_index):
+            if axis == 1:
+                # 'same' 卷积各轴独立对齐：转置后按行计算即为原结果的列
+                obj, kernel = obj.T, kernel.T
+            line += ConvolutionHandler._convolve_rows(obj, kernel, index, index + 1, method)[0]
+        return np.clip(line, 0, 1)
+
+    @staticmethod
+    def _row_tiles(image_shape, kernel_shape, tile_rows=None):
+        # """按行划分输出块，块高不小于核高的2倍以控制重叠开销（保证最少块数时不小于核高）；
+        # 给出 tile_rows 时按该行数划分"""
+        rows, cols = image_shape
+        if tile_rows is not None:
+            bounds = list(range(0, rows, max(1, int(tile_rows)))) + [rows]
+            return list(zip(bounds[:-1], bounds[1:]))
+        n_tiles = int(np.clip(rows * cols // ConvolutionHandler.TILE_PIXELS, 1, ConvolutionHandler.MAX_TILES))
+        n_tiles = min(n_tiles, rows // max(2 * kernel_shape[0], 1))
+        if rows * cols > ConvolutionHandler.MIN_TILED_PIXELS:
+            n_tiles = max(n_tiles, min(ConvolutionHandler.MIN_TILES, rows // max(kernel_shape[0], 1)))
+        n_tiles = max(1, n_tiles)
+        bounds = np.linspace(0, rows, n_tiles + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @staticmethod
+    def _convolve_rows(image, kernel, r0, r1, method='auto'):
+        # """计算 'same' 卷积输出的 [r0, r1) 行：只取对这些行有贡献的输入行带"""
+        if r0 == 0 and r1 == image.shape[0]:
+            return ConvolutionHandler.dispatcher.convolve(np.asarray(image), kernel, method)
+        kh = kernel.shape[0]
+        s = (kh - 1) // 2
+        b0 = max(r0 + s - kh + 1, 0)
+        b1 = min(r1 + s, image.shape[0])
+        band = ConvolutionHandler.dispatcher.convolve(np.asarray(image[b0:b1]), kernel, method)
+        return band[r0 - b0:r1 - b0]
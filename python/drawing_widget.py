@@ -1,11 +1,18 @@
 from PyQt5.QtWidgets import QWidget, QSizePolicy
-from PyQt5.QtCore import Qt, QPoint, QSize, pyqtSignal, QRect
-from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QImage, QCursor
+from PyQt5.QtCore import Qt, QPoint, QSize, pyqtSignal, QRect, QElapsedTimer
+from PyQt5.QtGui import QPainter, QPen, QBrush, QImage, QCursor
+from PyQt5 import sip
 import numpy as np
 
+from profiling import traced
+from vector_scene import VectorScene
+
 
 class DrawingWidget(QWidget):
     imageUpdated = pyqtSignal(np.ndarray)  # 当绘图更新时发射信号
+    strokeChanged = pyqtSignal(np.ndarray)  # 绘制过程中（节流）发射，用于实时预览
+
+    STROKE_INTERVAL_MS = 30  # 笔画过程中预览信号的最小间隔
 
     def __init__(self, size=512, parent=None):
         super().__init__(parent)
@@ -16,9 +23,14 @@ class DrawingWidget(QWidget):
         self._3d_enabled = False
         self._z_depth = 1
 
-        # 初始化画布（白底黑笔）
-        self.image = QImage(QSize(size, size), QImage.Format_RGB32)
-        self.image.fill(Qt.white)
+        # 初始化画布（白底黑笔）：画布模型为NumPy灰度缓冲区（白255、黑0），
+        # QImage直接包装该缓冲区用于绘制，行宽按4字节对齐
+        stride = (size + 3) & ~3
+        self._buffer = np.full((size, stride), 255, dtype=np.uint8)
+        self.canvas = self._buffer[:, :size]
+        self.image = QImage(sip.voidptr(self._buffer.ctypes.data), size, size, stride, QImage.Format_Grayscale8)
+        # 同步记录矢量场景，可按任意分辨率重新栅格化
+        self.scene = VectorScene(size, size)
 
         # 绘图参数
         self.drawing = False
@@ -26,6 +38,7 @@ class DrawingWidget(QWidget):
         self.current_tool = "pen"  # pen/line/rect/fill
         self.pen_width = 2
         self._init_pens()
+        self._stroke_clock = QElapsedTimer()
 
         # 在初始化时启用抗锯齿
         self.setAttribute(Qt.WA_TranslucentBackground)
@@ -49,27 +62,29 @@ class DrawingWidget(QWidget):
         self._3d_enabled = is_3d
         self._z_depth = z_depth
 
+    @traced('convert/getImageArray')
     def getImageArray(self):
-        # """将QImage转换为numpy数组（HxW）"""
-        h, w = self.image.height(), self.image.width()
-        arr = np.zeros((h, w), dtype=np.float32)
-
-        # 将QImage转换为灰度数组（1为黑，0为白）
-        for y in range(h):
-            for x in range(w):
-                color = QColor(self.image.pixel(x, y))
-                arr[y, x] = 1.0 if color == Qt.black else 0.0
+        # """将画布转换为numpy数组（HxW，1为黑，0为白）"""
+        arr = (self.canvas == 0).astype(np.float32)
 
         # 三维数组生成
         if self._3d_enabled:
-            # 创建三维数组
-            depth = self._z_depth
-            # 沿第三轴复制二维图像
-            return np.stack([arr] * depth, axis=2)
+            # 沿第三轴广播二维图像（只读视图，不复制）
+            return np.broadcast_to(arr[:, :, np.newaxis], arr.shape + (self._z_depth,))
         else:
             return arr
 
+    def getSceneArray(self, shape=None, pixel_size=None, supersample=4):
+        # """按目标分辨率或物理像素尺寸栅格化矢量场景（抗锯齿覆盖率，1为黑）"""
+        arr = self.scene.rasterize(shape=shape, pixel_size=pixel_size, supersample=supersample)
+        if self._3d_enabled:
+            return np.broadcast_to(arr[:, :, np.newaxis], arr.shape + (self._z_depth,))
+        return arr
 
+    @staticmethod
+    def _scenePoint(point):
+        # 控件像素坐标 -> 场景坐标（像素中心）
+        return point.x() + 0.5, point.y() + 0.5
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -92,8 +107,13 @@ class DrawingWidget(QWidget):
                 painter.setPen(self.black_pen)
                 painter.drawLine(self.last_point, current_point)
                 painter.end()
+                self.scene.add_segment(self._scenePoint(self.last_point), self._scenePoint(current_point),
+                                       self.pen_width)
                 self.last_point = current_point
                 self.update()
+                if not self._stroke_clock.isValid() or self._stroke_clock.elapsed() >= self.STROKE_INTERVAL_MS:
+                    self._stroke_clock.restart()
+                    self.strokeChanged.emit(self.getImageArray())
             else:
                 # 实时预览
                 self.update()
@@ -108,6 +128,7 @@ class DrawingWidget(QWidget):
                 painter.setPen(self.black_pen)
                 self._drawShape(painter, event.pos())
                 painter.end()
+                self._recordShape(event.pos())
                 self.temp_pixmap = None
                 self.update()
 
@@ -147,6 +168,16 @@ class DrawingWidget(QWidget):
             painter.drawEllipse(ellipse)
 
 
+    def _recordShape(self, end_point):
+        # """将完成的形状记录到矢量场景"""
+        start, end = self._scenePoint(self.last_point), self._scenePoint(end_point)
+        if self.current_tool == "line":
+            self.scene.add_segment(start, end, self.pen_width)
+        elif self.current_tool == "rect":
+            self.scene.add_rect(start, end, self.pen_width)
+        elif self.current_tool == "ellipse":
+            self.scene.add_ellipse(start, end, self.pen_width)
+
     def _getNormalizedRect(self, p1, p2):
         # """获取标准化矩形（处理任意方向）"""
         return QRect(
@@ -162,57 +193,26 @@ class DrawingWidget(QWidget):
         )
 
     def floodFill(self, pos):
-        # """泛洪填充算法（使用扫描线算法）"""
-        target_color = self.image.pixelColor(pos)
-        if target_color == Qt.black:
+        # """泛洪填充：在NumPy画布上做4邻域连通域标记，结果一次性写回画布"""
+        x, y = pos.x(), pos.y()
+        h, w = self.canvas.shape
+        if not (0 <= x < w and 0 <= y < h):
+            return
+        target = self.canvas[y, x]
+        if target == 0:
             return  # 已经是黑色
 
-        # 初始化队列
-        stack = [(pos.x(), pos.y())]
-        visited = set()
-
-        # 边界检查
-        w, h = self.image.width(), self.image.height()
-
-        # 开始填充
-        painter = QPainter(self.image)
-        painter.setPen(Qt.NoPen)
-        painter.setBrush(self.fill_brush)
-
-        while stack:
-            x, y = stack.pop()
-            if (x, y) in visited:
-                continue
-            visited.add((x, y))
-
-            # 向左扩展
-            left = x
-            while left >= 0 and self.image.pixelColor(left, y) == target_color:
-                left -= 1
-            left += 1
-
-            # 向右扩展
-            right = x
-            while right < w and self.image.pixelColor(right, y) == target_color:
-                right += 1
-
-            # 绘制水平线
-            painter.drawRect(left, y, right - left, 1)
-
-            # 检查上下行
-            for dy in [-1, 1]:
-                ny = y + dy
-                if 0 <= ny < h:
-                    for nx in range(left, right):
-                        if self.image.pixelColor(nx, ny) == target_color:
-                            stack.append((nx, ny))
-
-        painter.end()
+        from scipy.ndimage import label  # 首次填充时导入
+        labels, _ = label(self.canvas == target)
+        self.canvas[labels == labels[y, x]] = 0
+        self.scene.add_fill(self._scenePoint(pos))
+
         self.update()
         self.imageUpdated.emit(self.getImageArray())
 
     def clear(self):
         # 清空画布
         self.image.fill(Qt.white)
+        self.scene.clear()
         self.update()
         self.imageUpdated.emit(self.getImageArray())
\ No newline at end of file
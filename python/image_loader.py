@@ -1,11 +1,12 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 import numpy as np
-from PIL import Image
+
+from volume_file import open_stack
 
 
 class ImageLoader(QWidget):
-    imageLoaded = pyqtSignal(np.ndarray)
+    imageLoaded = pyqtSignal(object)  # np.ndarray 或 ImageStack / VolumeFile（惰性图像栈）
 
     def __init__(self):
         super().__init__()
@@ -27,15 +28,21 @@ class ImageLoader(QWidget):
         self._z_depth = z_depth
 
     def loadImage(self):
-        path, _ = QFileDialog.getOpenFileName()
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择图像", "", "图像文件 (*.tif *.tiff *.png *.jpg *.jpeg *.bmp *.psv);;所有文件 (*)")
 
         if path:
-            img = np.array(Image.open(path).convert('L')) / 255.0
-            if self._3d_enabled:
-                # 创建三维数组
-                depth = self._z_depth
-                # 沿第三轴复制二维图像
-                img = np.stack([img] * depth, axis=2)
+            try:
+                stack = open_stack(path)
+            except (OSError, ValueError) as e:
+                QMessageBox.critical(self, "错误", f"无法读取图像: {e}")
+                return
+            if stack.ndim == 3:
+                # 多页TIFF：各页即z层，保持惰性读取（不整体载入内存）
+                img = stack
             else:
-                pass
+                img = stack.page(0)
+                if self._3d_enabled:
+                    # 沿第三轴广播二维图像（只读视图，不复制）
+                    img = np.broadcast_to(img[:, :, None], img.shape + (self._z_depth,))
             self.imageLoaded.emit(img)
\ No newline at end of file
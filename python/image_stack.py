@@ -0,0 +1,215 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from profiling import span
+
+# PIL 原始数据模式 -> NumPy 数据类型（可直接内存映射的未压缩格式）
+_RAW_DTYPES = {
+    'L': np.dtype('u1'),
+    'I;16': np.dtype('<u2'),
+    'I;16B': np.dtype('>u2'),
+    'I;16N': np.dtype('=u2'),
+    'I;16S': np.dtype('<i2'),
+    'I;16BS': np.dtype('>i2'),
+    'I;32': np.dtype('<u4'),
+    'I;32S': np.dtype('<i4'),
+    'I;32BS': np.dtype('>i4'),
+    'F;32F': np.dtype('<f4'),
+    'F;32BF': np.dtype('>f4'),
+    'F;64F': np.dtype('<f8'),
+    'F;64BF': np.dtype('>f8'),
+}
+
+# 需要解码时转换到的模式（彩色等转为灰度，高位深保持不变）
+_KEEP_MODES = ('L', 'I', 'F', 'I;16', 'I;16B', 'I;16L', 'I;16N', 'I;16S')
+
+
+class ImageStack:
+    """惰性图像栈
+
+    多页TIFF按页构成z体（形状 (行, 列, 页数)，与PSF的z轴在最后一致），单页图像为二维。
+    未压缩的页直接内存映射，压缩页在访问时整页解码并按内存上限缓存（多线程读取同一栈时缓存加锁）；
+    读取的区域才转换为 float32：整数按其数据类型最大值归一化（8位与原先的 /255 一致），
+    浮点数据保持原值。对象可被pickle（只记录路径），工作进程中重新映射文件。
+    """
+
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, path, cache_bytes=256 * 1024 ** 2):
+        self.path = path
+        self.cache_bytes = cache_bytes
+        self._pages = []  # 每页: (源数据类型, 内存映射偏移 或 None)
+        with Image.open(path) as img:
+            self._size = (img.height, img.width)
+            for index in range(getattr(img, 'n_frames', 1)):
+                img.seek(index)
+                if (img.height, img.width) != self._size:
+                    raise ValueError("多页图像各页尺寸必须一致")
+                self._pages.append(self._page_layout(img))
+        self._init_cache()
+
+    def _init_cache(self):
+        self._maps = {}
+        self._decoded = OrderedDict()
+        self._decoded_bytes = 0
+        self._cache_lock = threading.Lock()
+
+    def _cached(self, key):
+        # """取解码缓存中的条目（并标记为最近使用），没有时返回 None"""
+        with self._cache_lock:
+            value = self._decoded.get(key)
+            if value is not None:
+                self._decoded.move_to_end(key)
+            return value
+
+    def _store(self, key, value):
+        # """放入解码缓存并按内存上限淘汰；其他线程已放入同一条目时沿用已有的，不重复计数"""
+        with self._cache_lock:
+            existing = self._decoded.get(key)
+            if existing is not None:
+                self._decoded.move_to_end(key)
+                return existing
+            self._decoded[key] = value
+            self._decoded_bytes += value.nbytes
+            while self._decoded_bytes > self.cache_bytes and len(self._decoded) > 1:
+                _, old = self._decoded.popitem(last=False)
+                self._decoded_bytes -= old.nbytes
+            return value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_maps', '_decoded', '_decoded_bytes', '_cache_lock'):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_cache()
+
+    @staticmethod
+    def _page_layout(img):
+        # """判断当前页能否内存映射：单一原始模式、自上而下的整行条带且在文件中连续存放
+        # （自下而上存放的页，如多数BMP，行方向参数为 -1，交由解码器处理）"""
+        rows, cols = img.height, img.width
+        tiles = img.tile
+        dtype = None
+        if tiles and all(t[0] == 'raw' for t in tiles):
+            rawmodes = {t[3][0] if isinstance(t[3], tuple) else t[3] for t in tiles}
+            dtype = _RAW_DTYPES.get(rawmodes.pop()) if len(rawmodes) == 1 else None
+        if dtype is not None:
+            row_bytes = cols * dtype.itemsize
+            start = tiles[0][2]
+            contiguous = all(
+                t[1][0] == 0 and t[1][2] == cols
+                and (not isinstance(t[3], tuple)
+                     or (len(t[3]) < 2 or t[3][1] in (0, row_bytes)) and (len(t[3]) < 3 or t[3][2] == 1))
+                and t[2] == start + t[1][1] * row_bytes
+                for t in tiles)
+            if contiguous and sum(t[1][3] - t[1][1] for t in tiles) == rows:
+                return dtype, start
+
+        mode = img.mode if img.mode in _KEEP_MODES else 'L'
+        return np.dtype(np.array(Image.new(mode, (1, 1))).dtype), None
+
+    # ---------- 基本属性 ----------
+    @property
+    def shape(self):
+        if len(self._pages) == 1:
+            return self._size
+        return self._size + (len(self._pages),)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        # """完整转换为 float32 后的字节数"""
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def source_dtype(self):
+        return self._pages[0][0]
+
+    @property
+    def memory_mapped(self):
+        # """是否所有页都以内存映射方式读取"""
+        return all(offset is not None for _, offset in self._pages)
+
+    # ---------- 读取 ----------
+    def _raw_page(self, index):
+        # """返回第index页的原始数据（内存映射视图或解码结果）"""
+        dtype, offset = self._pages[index]
+        if offset is not None:
+            page = self._maps.get(index)
+            if page is None:
+                page = np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=self._size)
+                self._maps[index] = page
+            return page
+
+        page = self._cached(index)
+        if page is not None:
+            return page
+        # 解码在锁外进行，不同页可并行解码
+        with span('convert/decode_page', index=index), Image.open(self.path) as img:
+            img.seek(index)
+            if img.mode not in _KEEP_MODES:
+                img = img.convert('L')
+            page = np.array(img)
+        return self._store(index, page)
+
+    @staticmethod
+    def _to_float(region):
+        # """整数按数据类型最大值归一化到 [0, 1]，浮点保持原值"""
+        if np.issubdtype(region.dtype, np.integer):
+            scale = np.float32(1.0 / np.iinfo(region.dtype).max)
+            return np.multiply(region, scale, dtype=np.float32)
+        return np.asarray(region, dtype=np.float32)
+
+    def page(self, index):
+        """返回第index页（float32，二维）"""
+        return self._to_float(self._raw_page(index))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = next(i for i, k in enumerate(key) if k is Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        if len(key) > self.ndim:
+            raise IndexError("索引维数超过图像维数")
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        if self.ndim == 2:
+            return self._to_float(self._raw_page(0)[key])
+        rows, cols, pages = key
+        indices = np.arange(len(self._pages))[pages]
+        if np.ndim(indices) == 0:
+            return self._to_float(self._raw_page(int(indices))[rows, cols])
+        planes = [self._to_float(self._raw_page(int(j))[rows, cols]) for j in indices]
+        if not planes:
+            return np.zeros(np.zeros(self._size)[rows, cols].shape + (0,), dtype=self.dtype)
+        return np.stack(planes, axis=-1)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[...]
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def sum(self, axis=None, dtype=None, out=None):
+        """逐页累加求和；沿z轴投影时不需要整体读入"""
+        if self.ndim == 3 and axis in (2, -1):
+            result = np.zeros(self._size, dtype=dtype or self.dtype)
+            for j in range(len(self._pages)):
+                result += self.page(j)
+            if out is not None:
+                out[...] = result
+                return out
+            return result
+        return np.asarray(self).sum(axis=axis, dtype=dtype, out=out)
+
+    def __repr__(self):
+        kind = 'memmap' if self.memory_mapped else 'decoded'
+        return f"ImageStack({self.path!r}, shape={self.shape}, source={self.source_dtype}, {kind})"
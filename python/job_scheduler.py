@@ -0,0 +1,71 @@
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class JobScheduler(QObject):
+    """后台重算调度器
+
+    每个任务分配递增的代号；同一时刻最多一个任务运行、一个任务等待，
+    新提交的任务覆盖等待中的任务（后到者优先），已过期任务的结果直接丢弃。
+    """
+    result_ready = pyqtSignal(int, object)  # 代号, 结果
+    error_occurred = pyqtSignal(int, str)
+    busy_changed = pyqtSignal(bool)
+    _job_finished = pyqtSignal(int, object, object)  # 工作线程 -> GUI线程
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._latest_id = 0
+        self._running_id = None
+        self._pending = None  # (代号, 函数, 参数)
+        self._job_finished.connect(self._on_job_finished)
+
+    @property
+    def latest_id(self):
+        return self._latest_id
+
+    def is_busy(self):
+        return self._running_id is not None
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务，返回其代号"""
+        self._latest_id += 1
+        job = (self._latest_id, fn, args, kwargs)
+        if self._running_id is None:
+            self._start(job)
+        else:
+            # 覆盖尚未开始的旧任务
+            self._pending = job
+        return self._latest_id
+
+    def _start(self, job):
+        job_id, fn, args, kwargs = job
+        was_busy = self._running_id is not None
+        self._running_id = job_id
+        if not was_busy:
+            self.busy_changed.emit(True)
+        thread = threading.Thread(target=self._run, args=job, daemon=True)
+        thread.start()
+
+    def _run(self, job_id, fn, args, kwargs):
+        try:
+            result, error = fn(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+        self._job_finished.emit(job_id, result, error)
+
+    def _on_job_finished(self, job_id, result, error):
+        # 只发布最新任务的结果
+        if job_id == self._latest_id:
+            if error is not None:
+                self.error_occurred.emit(job_id, str(error))
+            else:
+                self.result_ready.emit(job_id, result)
+
+        if self._pending is not None:
+            job, self._pending = self._pending, None
+            self._start(job)
+        else:
+            self._running_id = None
+            self.busy_changed.emit(False)
@@ -1,31 +1,138 @@
+import os
 import sys
+import threading
+
+import startup_profile
+if startup_profile.requested():
+    startup_profile.install()
 
-import matplotlib.font_manager
 import numpy as np
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
-from psf_generator import PSFGenerator
 from drawing_widget import DrawingWidget
 from image_loader import ImageLoader
-from convolution_handler import ConvolutionHandler
-from Convolution_Worker import ConvolutionWorker
+from Convolution_Worker import ConvolutionWorker, BatchWorker, VolumeSaveWorker
+from batch_pipeline import BatchPipeline
+from process_pool import get_backend, share
+from job_scheduler import JobScheduler
+from z_plane_cache import ZPlaneCache
+from preview_pipeline import PreviewPipeline
+from orthogonal_sections import ResultSections, volume_section, AXIS_XZ, AXIS_YZ
+from simulation_engine import generate_psf, model_params, convolve_plane, psf_metadata, auto_size_psf, MAX_AUTO_SIZE
+from psf_support import DEFAULT_FRACTION, describe_report
+from memory_planner import plan_memory, psf_shape, object_footprint
+from volume_file import open_stack, save_volume
+import profiling
+
+
+# 窗口显示后在后台线程预先导入的重模块（matplotlib 结果区、SciPy 生成与卷积、FFT）
+WARM_UP_MODULES = ('matplotlib.pyplot', 'matplotlib.backends.backend_qt5agg', 'result_view',
+                   'scipy.fft', 'scipy.signal', 'scipy.special', 'scipy.ndimage')
 
 
 class MainWindow(QMainWindow):
+    _warm_up_done = pyqtSignal()
+
     def __init__(self):
         super().__init__()
+        self._plots_ready = False
         self.initUI()
         self.initConnections()
 
         self.current_psf = None
+        self.psf_metadata = None  # 生成参数，保存为 .psv 时写入文件
         self.input_image = None
         self.psf_params = {}
         self.scale_factor = 1.0  # 微米/像素
         self.worker_thread = None
+        self.process_backend = None
+        self._convolution_plan = None  # (规划依据, MemoryPlan)：PSF与输入尺寸不变时复用
+        self.result_scheduler = JobScheduler(self)
+        self.preview_pipeline = PreviewPipeline()
+        self.result_scheduler.result_ready.connect(self.showResult)
+        self.result_scheduler.error_occurred.connect(self.handleResultError)
+        # 三维PSF的各z层结果缓存（滑动时直接查表）
+        self.z_cache = ZPlaneCache(parent=self)
+        self.z_cache.plane_ready.connect(self.handlePlaneReady)
+        self.z_cache.error_occurred.connect(self.handleResultError)
+        # 结果体正交切面（十字线位置按需计算）
+        self.crosshair = None  # (行, 列)
+        self.result_sections = ResultSections()
+        self.section_scheduler = JobScheduler(self)
+        self.section_scheduler.result_ready.connect(self.showSections)
+        self.section_scheduler.error_occurred.connect(self.handleResultError)
+        # 事件循环启动（窗口已显示）后再预热常驻进程池与重模块
+        self._warm_up_done.connect(self._onWarmUpDone)
+        QTimer.singleShot(0, self._start_process_backend)
+        QTimer.singleShot(0, self._start_warm_up)
+        startup_profile.mark("主窗口构造完成")
+
+    def _start_process_backend(self):
+        self.process_backend = get_backend()
+
+    def _start_warm_up(self):
+        startup_profile.mark("事件循环开始")
+        threading.Thread(target=self._warm_up, daemon=True, name="warm-up").start()
+
+    def _warm_up(self):
+        # 后台线程：导入重模块并执行一次小FFT；GUI线程若先用到，导入锁保证只加载一次
+        import importlib
+        for name in WARM_UP_MODULES:
+            importlib.import_module(name)
+        from scipy import fft
+        fft.rfft2(np.zeros((8, 8)))
+        self._warm_up_done.emit()
+
+    def _onWarmUpDone(self):
+        self._ensurePlots()
+        startup_profile.mark("后台预热完成，结果区就绪")
+        startup_profile.report()
+
+    # ---------- 结果区（matplotlib，首次使用时创建） ----------
+    def _ensurePlots(self):
+        if self._plots_ready:
+            return
+        self._plots_ready = True
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        import matplotlib.pyplot as plt
+        from result_view import ResultView, SectionView
+
+        self.figure = plt.figure(figsize=(8, 6))
+        self.canvas = FigureCanvas(self.figure)
+        self.plot_layout.addWidget(self.canvas)
+        self._result_view = ResultView(self.figure, self.canvas)
+        # 点击或拖动结果图设置切面十字线
+        self.canvas.mpl_connect('button_press_event', self._onResultClick)
+        self.canvas.mpl_connect('motion_notify_event', self._onResultClick)
+
+        # x-z / y-z 正交切面（三维PSF时显示）
+        self.section_figure = plt.figure(figsize=(8, 3.5))
+        self._section_canvas = FigureCanvas(self.section_figure)
+        self._section_canvas.setVisible(False)
+        self.plot_layout.addWidget(self._section_canvas)
+        self._section_view = SectionView(self.section_figure, self._section_canvas)
+        self.plot_placeholder.setVisible(False)
+
+    @property
+    def result_view(self):
+        self._ensurePlots()
+        return self._result_view
+
+    @property
+    def section_view(self):
+        self._ensurePlots()
+        return self._section_view
+
+    @property
+    def section_canvas(self):
+        self._ensurePlots()
+        return self._section_canvas
+
+    def closeEvent(self, event):
+        if self.process_backend is not None:
+            self.process_backend.shutdown()
+        super().closeEvent(event)
 
     def initUI(self):
         self.setWindowTitle("光学成像模拟器 v1.2")
@@ -41,6 +148,10 @@ class MainWindow(QMainWindow):
         self.setupPSFTab(control_panel)
         self.setupDrawingTab(control_panel)
         self.setupImageTab(control_panel)
+        if profiling.enabled():
+            # 耗时采集开启时（PSF_SIM_TRACE）显示耗时统计页
+            from timing_panel import TimingPanel
+            control_panel.addTab(TimingPanel(), "耗时")
 
         # 右侧结果显示
         right_container = QWidget()
@@ -48,9 +159,13 @@ class MainWindow(QMainWindow):
         result_panel = QVBoxLayout(right_container)
 
 
-        self.figure = plt.figure(figsize=(8, 6))
-        self.canvas = FigureCanvas(self.figure)
-        result_panel.addWidget(self.canvas)
+        # 结果图区：matplotlib 画布在窗口显示后创建（见 _ensurePlots），此前显示占位
+        self.plot_layout = QVBoxLayout()
+        self.plot_placeholder = QLabel("正在加载绘图组件...")
+        self.plot_placeholder.setAlignment(Qt.AlignCenter)
+        self.plot_placeholder.setMinimumHeight(400)
+        self.plot_layout.addWidget(self.plot_placeholder)
+        result_panel.addLayout(self.plot_layout, 1)
 
         # main_layout.addWidget(control_panel, stretch=1)
         # main_layout.addWidget(right_container, stretch=1)
@@ -71,6 +186,10 @@ class MainWindow(QMainWindow):
 
         result_panel.addWidget(self.progress)
         result_panel.addWidget(self.apply_btn)
+        self.volume_btn = QPushButton("三维显示")
+        result_panel.addWidget(self.volume_btn)
+        self.save_result_btn = QPushButton("保存结果…")
+        result_panel.addWidget(self.save_result_btn)
 
         main_layout.addWidget(control_panel, 1)
         main_layout.addWidget(right_container, 1)
@@ -92,6 +211,14 @@ class MainWindow(QMainWindow):
         self.psf_dz = QLineEdit("0.05e-6")
         self.wavelength = QLineEdit("500e-9")
         self.amplitude = QLineEdit("1")
+        # 按能量确定PSF尺寸：横向不足时加大生成尺寸，再裁剪到包含所需能量比例的范围
+        self.support_checkbox = QCheckBox("按能量确定尺寸")
+        self.support_fraction = QLineEdit(repr(DEFAULT_FRACTION))
+        self.support_label = QLabel()
+        self.support_label.setWordWrap(True)
+        # 最近一次生成或卷积的内存规划（运行前显示）
+        self.plan_label = QLabel()
+        self.plan_label.setWordWrap(True)
         # 私有参数初始化
         self.n_bessel = QLineEdit("0")
         self.phase_shift = QLineEdit("90.0")
@@ -110,6 +237,9 @@ class MainWindow(QMainWindow):
         public_layout.addRow("PSF单位像素高度(m):", self.psf_dz)
         public_layout.addRow("波长(m):", self.wavelength)
         public_layout.addRow("放大倍数:", self.amplitude)
+        public_layout.addRow(self.support_checkbox, self.support_fraction)
+        public_layout.addRow(self.support_label)
+        public_layout.addRow(self.plan_label)
         public_group.setLayout(public_layout)
         main_layout.addWidget(public_group)
 
@@ -121,7 +251,7 @@ class MainWindow(QMainWindow):
 
         # 区域尺寸设计
         public_group.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)  # 垂直方向保持最小必要高度
-        public_group.setMaximumHeight(200)
+        public_group.setMaximumHeight(260)
         main_layout.addWidget(public_group, stretch=1)
 
         private_group.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
@@ -180,6 +310,12 @@ class MainWindow(QMainWindow):
         # 生成按钮
         self.generate_psf_btn = QPushButton("生成PSF")
         main_layout.addWidget(self.generate_psf_btn)
+        file_layout = QHBoxLayout()
+        self.save_psf_btn = QPushButton("保存PSF…")
+        self.load_psf_btn = QPushButton("载入PSF…")
+        file_layout.addWidget(self.save_psf_btn)
+        file_layout.addWidget(self.load_psf_btn)
+        main_layout.addLayout(file_layout)
 
         # 连接信号
         self.psf_type.currentIndexChanged.connect(self.param_stack.setCurrentIndex)
@@ -213,6 +349,16 @@ class MainWindow(QMainWindow):
         dimension_layout.addStretch()
         layout.addLayout(dimension_layout)
 
+        # 矢量栅格化：按PSF像素尺寸重新栅格化绘图，仿真网格与控件尺寸解耦
+        raster_layout = QHBoxLayout()
+        self.vector_raster_checkbox = QCheckBox("按PSF像素尺寸栅格化")
+        self.canvas_width_input = QLineEdit("51.2e-6")
+        raster_layout.addWidget(self.vector_raster_checkbox)
+        raster_layout.addWidget(QLabel("画布宽度(m):"))
+        raster_layout.addWidget(self.canvas_width_input)
+        raster_layout.addStretch()
+        layout.addLayout(raster_layout)
+
         self.drawing_widget = DrawingWidget(512)
         layout.addWidget(self.drawing_widget)
         # 创建工具栏
@@ -261,6 +407,9 @@ class MainWindow(QMainWindow):
         self.scale_input = QLineEdit("1.0")
         layout.addRow("比例(微米/像素):", self.scale_input)
 
+        self.batch_btn = QPushButton("批量处理文件夹")
+        layout.addRow(self.batch_btn)
+
         image_tab.setLayout(layout)
         tab_widget.addTab(image_tab, "图像上传")
 
@@ -268,77 +417,86 @@ class MainWindow(QMainWindow):
         self.generate_psf_btn.clicked.connect(self.generatePSF)
         self.delay_update_timer.timeout.connect(self.handleDrawingUpdate)
         self.drawing_widget.imageUpdated.connect(self.handleDrawingUpdate_Delay)
+        self.drawing_widget.strokeChanged.connect(self.handleDrawingPreview)
         self.image_loader.imageLoaded.connect(self.handleImageLoad)
         self.psf_type.currentIndexChanged.connect(self.updateParamVisibility)
         self.apply_btn.clicked.connect(self.startConvolution)
+        self.batch_btn.clicked.connect(self.startBatch)
+        self.volume_btn.clicked.connect(self.showVolumeView)
+        self.save_psf_btn.clicked.connect(self.savePSF)
+        self.load_psf_btn.clicked.connect(self.loadPSF)
+        self.save_result_btn.clicked.connect(self.saveResult)
 
     def updateParamVisibility(self):
         # 根据PSF类型显示/隐藏参数（目前不需要完善）
         pass
 
     def generatePSF(self):
+        # 界面参数按模型筛选后交给仿真引擎（与命令行共用同一映射）
         psf_type = self.psf_type.currentText()
-        size_xy = self.psf_xy.value()
-        size_z = float(self.psf_z.text())
-        size_dxdy = float(self.psf_dxdy.text())
-        size_dz = float(self.psf_dz.text())
-        amplitude = float(self.amplitude.text())
-
-
-        if psf_type == "Bessel 衍射":
-            self.current_psf = PSFGenerator.generate_bessel(
-                size = size_xy,
-                size_z = size_z,
-                size_dxdy =size_dxdy,
-                size_dz = size_dz,
-                amplitude = amplitude,
-                wavelength = float(self.wavelength.text()),
-                n_bessel = float(self.n_bessel.text()),
-                phase_shift = float(self.phase_shift.text())
-            )
-        elif psf_type == "Gaussian 衍射":
-            self.current_psf = PSFGenerator.generate_gaussian(
-                size = size_xy,
-                size_z = size_z,
-                size_dxdy = size_dxdy,
-                size_dz = size_dz,
-                amplitude = amplitude,
-                wavelength = float(self.wavelength.text()),
-            )
-        elif psf_type == "艾里斑":
-            self.current_psf = PSFGenerator.generate_airy(
-                size=size_xy,
-                size_z=size_z,
-                size_dxdy=size_dxdy,
-                size_dz=size_dz,
-                amplitude=amplitude,
-                wavelength=float(self.wavelength.text()),
-                D=float(self.aperture.text()),
-            )
-        elif psf_type == "高斯":
-            self.current_psf = PSFGenerator.generate_gaussian_old(
-                size=size_xy,
-                # size_z=size_z,
-                # size_dxdy=size_dxdy,
-                # size_dz=size_dz,
-                # amplitude=amplitude,
-                # wavelength=float(self.wavelength.text()),
-                sigma=float(self.sigma.text())
-            )
-        elif psf_type == "运动模糊":
-            self.current_psf = PSFGenerator.generate_motion_blur(
-                size=size_xy,
-                # size_z=size_z,
-                # size_dxdy=size_dxdy,
-                # size_dz=size_dz,
-                # amplitude=amplitude,
-                # wavelength=float(self.wavelength.text()),
-                length=int(self.motion_length.text()),
-                angle=float(self.motion_angle.text()),
-            )
+        fields = {
+            'size': self.psf_xy.value(),
+            'size_z': self.psf_z.text(),
+            'size_dxdy': self.psf_dxdy.text(),
+            'size_dz': self.psf_dz.text(),
+            'amplitude': self.amplitude.text(),
+            'wavelength': self.wavelength.text(),
+            'n_bessel': self.n_bessel.text(),
+            'phase_shift': self.phase_shift.text(),
+            'D': self.aperture.text(),
+            'sigma': self.sigma.text(),
+            'length': self.motion_length.text(),
+            'angle': self.motion_angle.text(),
+        }
+        params = {name: fields[name] for name in model_params(psf_type)}
+        # 运行前按内存预算规划并显示；需要降级（如PSF生成到磁盘）或仍超出预算时先请用户确认
+        plan = self._memoryPlan(psf_shape(psf_type, params), self.input_image, psf_type,
+                                self.support_checkbox.isChecked())
+        self._showPlan(plan)
+        if plan.fallbacks or not plan.fits:
+            answer = QMessageBox.question(self, "内存规划", plan.describe() + "\n\n是否按此方案生成？")
+            if answer != QMessageBox.Yes:
+                return
+        if self.support_checkbox.isChecked():
+            try:
+                fraction = float(self.support_fraction.text())
+                psf, report, params = auto_size_psf(psf_type, params, fraction, allocate=plan.allocate_psf,
+                                                    max_size=plan.support_size or MAX_AUTO_SIZE,
+                                                    max_size_z=plan.support_size_z or MAX_AUTO_SIZE)
+            except ValueError as e:
+                QMessageBox.warning(self, "错误", str(e))
+                return
+            self.current_psf = psf
+            self.psf_metadata = psf_metadata(psf_type, params)
+            self.psf_metadata['support'] = report._asdict()
+            self.support_label.setText(describe_report(report))
+        else:
+            self.current_psf = generate_psf(psf_type, params, allocate=plan.allocate_psf)
+            self.psf_metadata = psf_metadata(psf_type, params)
+            self.support_label.clear()
 
         self.updateResult()
 
+    def _memoryPlan(self, shape, image, model=None, support=False):
+        # """按输入图像规划内存（界面逐层计算，每次一层）；卷积行块高度为 None 时按默认分块"""
+        image_shape, image_bytes, itemsize = object_footprint(image)
+        return plan_memory(shape, model, image_shape, image_bytes, itemsize, processes=self.process_backend is not None,
+                           support=support, max_size=MAX_AUTO_SIZE, max_size_z=MAX_AUTO_SIZE)
+
+    def _convolutionPlan(self):
+        # """当前PSF与输入图像的卷积规划；PSF形状、输入尺寸与是否使用进程池不变时复用，重新规划时显示"""
+        key = (tuple(self.current_psf.shape), object_footprint(self.input_image), self.process_backend is not None)
+        if self._convolution_plan is None or self._convolution_plan[0] != key:
+            plan = self._memoryPlan(self.current_psf.shape, self.input_image)
+            self._convolution_plan = (key, plan)
+            self._showPlan(plan)
+        return self._convolution_plan[1]
+
+    def _showPlan(self, plan):
+        # 立即重绘：生成在界面线程中进行，否则要到生成结束后才显示
+        self.plan_label.setText(plan.describe())
+        self.plan_label.repaint()
+
     def startConvolution(self):
         if self.input_image is None:
             QMessageBox.warning(self, "错误", "请先绘制图形或上传图像!")
@@ -357,7 +515,10 @@ class MainWindow(QMainWindow):
         self.worker = ConvolutionWorker(
             self.input_image,
             self.current_psf,
-            self.scale_factor
+            self.scale_factor,
+            z_index=self.current_z_layer if self.current_psf.ndim == 3 else None,
+            backend=self.process_backend,
+            tile_rows=self._convolutionPlan().tile_rows
         )
         self.worker.moveToThread(self.worker_thread)
 
@@ -365,7 +526,10 @@ class MainWindow(QMainWindow):
         self.worker.progress_updated.connect(self.updateProgress)
         self.worker.result_ready.connect(self.handleResult)
         self.worker.error_occurred.connect(self.handleError)
+        self.worker.cancelled.connect(self.handleCancelled)
         self.worker_thread.started.connect(self.worker.process)
+        # 直接连接：取消令牌线程安全，无需等待工作线程事件循环
+        self.progress_dialog.canceled.connect(self.worker.stop, Qt.DirectConnection)
 
         # 启动线程
         self.worker_thread.start()
@@ -379,24 +543,186 @@ class MainWindow(QMainWindow):
         self.worker_thread.wait()
         self.progress_dialog.close()
 
-        # 显示结果
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        ax.imshow(result, cmap='gray')
-        self.canvas.draw()
+        # 显示结果（灰度，按数据范围）
+        self.result_view.set_data(result, title=f"{self.psf_type.currentText()} PSF", cmap='gray', clim=None)
 
     def handleError(self, message):
         self.worker_thread.quit()
         self.progress_dialog.close()
         QMessageBox.critical(self, "错误", message)
 
+    def handleCancelled(self):
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.progress_dialog.close()
+
+    def showVolumeView(self):
+        volumes = {}
+        if self.current_psf is not None and self.current_psf.ndim == 3:
+            volumes["PSF"] = self.current_psf
+        if self.input_image is not None and self.input_image.ndim == 3:
+            volumes["输入图像体"] = self.input_image
+        if not volumes:
+            QMessageBox.warning(self, "错误", "请先生成三维PSF或载入三维图像!")
+            return
+        from volume_view import VolumeViewDialog
+        self.volume_dialog = VolumeViewDialog(volumes, self)
+        self.volume_dialog.show()
+
+    # ---------- 保存与载入（原生 .psv 格式） ----------
+    def savePSF(self):
+        if self.current_psf is None:
+            QMessageBox.warning(self, "错误", "请先生成PSF核!")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "保存PSF", "psf.psv", "PSF体数据 (*.psv)")
+        if not path:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            save_volume(path, self.current_psf, metadata=self.psf_metadata)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "错误", f"保存失败: {e}")
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def loadPSF(self):
+        path, _ = QFileDialog.getOpenFileName(self, "载入PSF", "", "PSF体数据 (*.psv);;图像文件 (*.tif *.tiff)")
+        if not path:
+            return
+        try:
+            stack = open_stack(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "错误", f"无法读取PSF: {e}")
+            return
+        # 三维PSF保持惰性读取，卷积时只读取用到的层
+        self.current_psf = stack if stack.ndim == 3 else stack.page(0)
+        self.psf_metadata = getattr(stack, 'metadata', None) or {'kind': 'psf', 'path': path}
+        self.support_label.clear()
+        self.updateResult()
+
+    def saveResult(self):
+        # 三维PSF时逐层计算全部z层（已缓存的层直接复用）并流式写入文件
+        if self.input_image is None or self.current_psf is None:
+            QMessageBox.warning(self, "错误", "请先准备输入图像与PSF!")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "保存结果", "result.psv", "结果体数据 (*.psv)")
+        if not path:
+            return
+        compute = self._planeComputer()
+        is_3d = self.current_psf.ndim == 3
+        cached = self.z_cache.peek if is_3d else (lambda z: None)
+
+        def plane_source(z_index, cancel_token):
+            plane = cached(z_index)
+            return plane if plane is not None else compute(z_index, cancel_token)
+
+        depth = self.current_psf.shape[2] if is_3d else 1
+        metadata = {'kind': 'result', 'psf': self.psf_metadata, 'scale': self.scale_factor}
+        self.save_dialog = QProgressDialog("正在保存结果...", "取消", 0, depth, self)
+        self.save_dialog.setWindowTitle("保存结果")
+        self.save_dialog.setWindowModality(Qt.WindowModal)
+
+        self.save_thread = QThread()
+        self.save_worker = VolumeSaveWorker(plane_source, depth, path, metadata, ndim=3 if is_3d else 2)
+        self.save_worker.moveToThread(self.save_thread)
+        self.save_worker.progress_updated.connect(lambda done, total: self.save_dialog.setValue(done))
+        self.save_worker.save_finished.connect(self._closeSave)
+        self.save_worker.error_occurred.connect(self.handleSaveError)
+        self.save_worker.cancelled.connect(self._closeSave)
+        self.save_thread.started.connect(self.save_worker.process)
+        self.save_dialog.canceled.connect(self.save_worker.stop, Qt.DirectConnection)
+        self.save_thread.start()
+        self.save_dialog.show()
+
+    def _closeSave(self, *args):
+        self.save_thread.quit()
+        self.save_thread.wait()
+        self.save_dialog.close()
+
+    def handleSaveError(self, message):
+        self._closeSave()
+        QMessageBox.critical(self, "错误", f"保存失败: {message}")
+
+    def startBatch(self):
+        if self.current_psf is None:
+            QMessageBox.warning(self, "错误", "请先生成PSF核!")
+            return
+        input_dir = QFileDialog.getExistingDirectory(self, "选择输入文件夹")
+        if not input_dir:
+            return
+        paths = BatchPipeline.list_images(input_dir)
+        if not paths:
+            QMessageBox.warning(self, "错误", "文件夹中没有图像文件!")
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, "选择输出文件夹")
+        if not output_dir:
+            return
+
+        pipeline = BatchPipeline(self.current_psf,
+                                 z_index=self.current_z_layer if self.current_psf.ndim == 3 else None)
+        self.batch_dialog = QProgressDialog("正在批量处理...", "取消", 0, len(paths), self)
+        self.batch_dialog.setWindowTitle("批量处理")
+        self.batch_dialog.setWindowModality(Qt.WindowModal)
+
+        self.batch_thread = QThread()
+        self.batch_worker = BatchWorker(pipeline, paths, output_dir)
+        self.batch_worker.moveToThread(self.batch_thread)
+        self.batch_worker.progress_updated.connect(self.updateBatchProgress)
+        self.batch_worker.batch_finished.connect(self.handleBatchFinished)
+        self.batch_worker.error_occurred.connect(self.handleBatchError)
+        self.batch_worker.cancelled.connect(self.handleBatchCancelled)
+        self.batch_thread.started.connect(self.batch_worker.process)
+        self.batch_dialog.canceled.connect(self.batch_worker.stop, Qt.DirectConnection)
+
+        self.batch_thread.start()
+        self.batch_dialog.show()
+
+    def updateBatchProgress(self, done, total, rate):
+        self.batch_dialog.setValue(done)
+        self.batch_dialog.setLabelText(f"正在批量处理... {done}/{total}（{rate:.1f} 张/秒）")
+
+    def _closeBatch(self):
+        self.batch_thread.quit()
+        self.batch_thread.wait()
+        self.batch_dialog.close()
+
+    def handleBatchFinished(self, report):
+        self._closeBatch()
+        message = f"已处理 {report.processed} 张，用时 {report.elapsed:.1f} 秒（{report.images_per_second:.1f} 张/秒）"
+        if report.failed:
+            details = "\n".join(f"{os.path.basename(path)}: {error}" for path, error in report.failed[:10])
+            message += f"\n失败 {len(report.failed)} 张:\n{details}"
+        QMessageBox.information(self, "批量处理完成", message)
+
+    def handleBatchError(self, message):
+        self._closeBatch()
+        QMessageBox.critical(self, "错误", message)
+
+    def handleBatchCancelled(self):
+        self._closeBatch()
+
     # 延时更新（v0.2.3 目前绘图会立马更新（包括之前版本））当前只针对z轴做了延迟更新
     def handleDrawingUpdate_Delay(self, image):
         self.input_image = image
         self.delay_update_timer.start(300)
 
+    def handleDrawingPreview(self, image):
+        # 绘制过程中：以降采样画布与降采样OTF快速计算近似结果，停笔后由延时更新计算全分辨率结果
+        self.input_image = image
+        self.delay_update_timer.start(300)
+        if self.current_psf is None:
+            return
+        z_index = self.current_z_layer if self.current_psf.ndim == 3 else None
+        self.result_scheduler.submit(self._computePreview, image, self.current_psf, z_index,
+                                     self.z_cache.version)
+
     def handleDrawingUpdate(self):
         # self.input_image = image
+        if self.vector_raster_checkbox.isChecked():
+            # 以PSF物理采样重新栅格化矢量场景（抗锯齿）
+            scene = self.drawing_widget.scene
+            scene.unit_size = float(self.canvas_width_input.text()) / scene.width
+            self.input_image = self.drawing_widget.getSceneArray(pixel_size=float(self.psf_dxdy.text()))
         self.updateResult()
 
     def handleImageLoad(self, image):
@@ -418,67 +744,136 @@ class MainWindow(QMainWindow):
         self.image_loader.set_3d_params(params['is_3d'], params['z_depth'])
 
     def _update_z_layer(self, value):
-        # """更新当前显示的Z层索引"""
+        # """更新当前显示的Z层索引：已缓存的层直接显示，否则请求优先计算"""
         self.current_z_layer = value
+        if self.current_psf is None or self.current_psf.ndim != 3:
+            return
+        self.section_view.set_z(value)
+        plane = self.z_cache.request(value)
+        if plane is not None:
+            self.displayResult(plane, value)
 
     def enable_3d_visualization(self, depth):
         # """激活三维可视化组件"""
+        if self.slider.isEnabled() and self.slider.maximum() == depth - 1:
+            return  # 保持用户当前选择的层
+        self.slider.blockSignals(True)
         self.slider.setRange(0, depth - 1)
         self.slider.setEnabled(True)
         self.current_z_layer = depth // 2
         self.slider.setValue(self.current_z_layer)
+        self.slider.blockSignals(False)
+        self.section_canvas.setVisible(True)
 
     def disable_3d_visualization(self):
         # """禁用三维可视化组件"""
         self.current_z_layer = 32
         self.slider.setEnabled(False)
+        self.section_canvas.setVisible(False)
+        self.result_view.set_crosshair(None, None)
 
 
     def updateResult(self):
         if self.input_image is None or self.current_psf is None:
             return
 
-        # 执行卷积，并根据输入维度调整处理逻辑
-        if self.input_image.ndim == 3:
-            # 处理三维输入的逻辑
-            result = ConvolutionHandler.convolve(
-                self.input_image,
-                self.current_psf,
-                scale_factor=self.scale_factor,
-                z_index=self.current_z_layer
-            )
-
-            self.enable_3d_visualization(int(self.psf_z.text()))
-        else:
-            # 原有二维处理逻辑
-            result = ConvolutionHandler.convolve(
-                self.input_image,
-                self.current_psf,
-                scale_factor=self.scale_factor,
-            )
-
-            self.disable_3d_visualization()
-
-        # 更新绘图
-        font1 = matplotlib.font_manager.FontProperties(fname= r"C:\Windows\Fonts\msyh.ttc")
-
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        image = ax.imshow(result,
-                  cmap='viridis', #inferno
-                  vmin=0,
-                  vmax=1,
-                  )
-        ax_cb = inset_axes(ax, width="3%", height="100%", loc='lower left', bbox_to_anchor=(1.02, 0., 1, 1),bbox_transform=ax.transAxes, borderpad=0)
-        self.figure.colorbar(image, ax=ax, cax=ax_cb, label = 'Intensity')
-        ax.set_title(f"{self.psf_type.currentText()} PSF (z={self.current_z_layer})",fontproperties=font1)
-        ax.set_xlabel("X position (μm)")
-        ax.set_ylabel("Y position (μm)")
-        self.canvas.draw()
+        if self.current_psf.ndim == 3:
+            # 三维PSF：先算当前层，再由缓存在后台预取邻近层
+            self.enable_3d_visualization(self.current_psf.shape[2])
+            self.z_cache.set_source(self._planeComputer(), self.current_psf.shape[2], focus=self.current_z_layer)
+            self._updateSectionSource()
+            return
+
+        # 二维PSF：快照当前输入，交由后台调度器计算（过期结果自动丢弃）
+        self.z_cache.clear()
+        self.disable_3d_visualization()
+        self.result_scheduler.submit(self._computeResult, self.input_image, self.current_psf,
+                                     self.scale_factor, None, self._convolutionPlan().tile_rows)
+
+    def _planeComputer(self):
+        # 绑定当前输入快照的逐层计算函数；有进程池时图像与PSF只放入共享内存一次
+        image, psf, scale_factor = self.input_image, self.current_psf, self.scale_factor
+        backend, tile_rows = self.process_backend, self._convolutionPlan().tile_rows
+        if backend is not None:
+            image, psf = share(image)[1], share(psf)[1]
+
+        def compute(z_index, cancel_token):
+            return convolve_plane(image, psf, scale_factor, z_index, backend=backend, cancel_token=cancel_token,
+                                  tile_rows=tile_rows)
+        return compute
+
+    def _updateSectionSource(self):
+        # PSF切面经过PSF横向中心（跨步视图）；结果切面跟随十字线，已缓存的z层直接复用
+        psf = self.current_psf
+        self.result_sections.set_source(self.input_image, psf, self.z_cache.peek)
+        self.section_view.set_psf(volume_section(psf, AXIS_XZ, (psf.shape[0] - 1) // 2),
+                                  volume_section(psf, AXIS_YZ, (psf.shape[1] - 1) // 2))
+        self.section_view.set_z(self.current_z_layer)
+        self._requestSections()
+
+    def _requestSections(self):
+        rows, cols = self.input_image.shape[:2]
+        row, col = self.crosshair or (rows // 2, cols // 2)
+        self.crosshair = (min(max(row, 0), rows - 1), min(max(col, 0), cols - 1))
+        self.result_view.set_crosshair(*self.crosshair)
+        row, col = self.crosshair
+        xz, yz = self.result_sections.get(AXIS_XZ, row), self.result_sections.get(AXIS_YZ, col)
+        if xz is not None and yz is not None:
+            self.section_view.set_result(xz, yz)
+            return
+        self.section_scheduler.submit(self._computeSections, row, col, self.result_sections.version)
+
+    def _computeSections(self, row, col, version):
+        # 后台线程执行：只做单行/单列卷积
+        return (version, self.result_sections.compute(AXIS_XZ, row),
+                self.result_sections.compute(AXIS_YZ, col))
+
+    def showSections(self, job_id, payload):
+        version, xz, yz = payload
+        if version == self.result_sections.version:
+            self.section_view.set_result(xz, yz)
+
+    def _onResultClick(self, event):
+        if (event.button != 1 or event.inaxes is None or event.inaxes is not self.result_view.ax
+                or self.current_psf is None or self.current_psf.ndim != 3 or self.input_image is None):
+            return
+        self.crosshair = (int(round(event.ydata)), int(round(event.xdata)))
+        self._requestSections()
+
+    def handlePlaneReady(self, version, z_index, plane):
+        if version == self.z_cache.version and z_index == self.current_z_layer:
+            self.displayResult(plane, z_index)
+
+    def _computeResult(self, image, psf, scale_factor, z_index, tile_rows=None):
+        # 后台线程执行；有进程池时计算在工作进程中进行（tile_rows 由界面线程按规划给出）
+        result = convolve_plane(image, psf, scale_factor, z_index, backend=self.process_backend,
+                                tile_rows=tile_rows)
+        return result, z_index, None
+
+    def _computePreview(self, image, psf, z_index, cache_version):
+        # 后台线程执行；记录提交时的z层缓存版本，全分辨率结果到达后过期的预览不再显示
+        return self.preview_pipeline.preview(image, psf, z_index), z_index, cache_version
+
+    def handleResultError(self, job_id, message):
+        QMessageBox.critical(self, "错误", message)
+
+    def showResult(self, job_id, payload):
+        result, z_index, preview_version = payload
+        if preview_version is not None and preview_version != self.z_cache.version:
+            return
+        self.displayResult(result, z_index, approximate=preview_version is not None)
+
+    def displayResult(self, result, z_index, approximate=False):
+        # 更新绘图：复用已有的坐标轴与图像对象，只更新数据与标题
+        title = f"{self.psf_type.currentText()} PSF (z={z_index if z_index is not None else '-'})"
+        if approximate:
+            title += " [预览·近似]"
+        self.result_view.set_data(result, title=title, cmap='viridis', clim=(0, 1))  # inferno
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    startup_profile.mark("窗口显示")
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,324 @@
+"""内存预算规划：运行前估计PSF生成与卷积的峰值内存，超出预算时依次采用降级措施
+
+    plan = plan_job(job)          # 或 plan_memory(psf_shape, ...)
+    print(plan.describe())
+    simulation_engine.run_job(job, plan=plan)
+
+降级顺序（代价由低到高）：物体转换为 float32（卷积随之使用 complex64）→ 缩小卷积行块 →
+结果写入磁盘临时文件 → 减少并行层数 → PSF生成到磁盘临时文件（逐z分块写入，内存映射读取）。
+估计值是按主要数组与FFT缓冲区计算的近似上限，不含解释器与界面本身的占用。
+"""
+import os
+import re
+import tempfile
+
+import numpy as np
+
+from convolution_handler import ConvolutionHandler
+from image_stack import ImageStack
+from psf_generator import PSFGenerator
+import simulation_engine
+
+ENV_VAR = 'PSF_SIM_MEMORY_BUDGET'  # 如 2G、512M
+SPILL_ENV_VAR = 'PSF_SIM_SPILL_DIR'  # 磁盘临时文件目录，默认系统临时目录
+BUDGET_FRACTION = 0.5  # 未设置预算时取可用内存的比例
+FALLBACK_BUDGET = 2 << 30  # 无法读取可用内存时的预算
+MIN_TILE_ROWS = 16
+# 按z分块生成的模型：可直接写入磁盘映射输出
+_SLAB_MODELS = ('bessel', 'gaussian')
+# 各二维模型生成时同时存在的 size×size float64 数组个数（网格、中间量与结果）
+_GRID_ARRAYS = {'bessel': 5, 'gaussian': 5, 'airy': 8, 'gaussian2d': 5, 'motion_blur': 4}
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+    """解析内存大小：字节数或带单位（K/M/G/T，可带 B/iB），如 '1.5G'"""
+    match = re.fullmatch(r'\s*([0-9.]+)\s*([KMGT]?)(?:I?B)?\s*', str(text).upper())
+    if not match:
+        raise ValueError(f"无法解析内存大小: {text}")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def format_size(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024 or unit == 'GB':
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def available_memory():
+    """当前可用物理内存（字节）；无法读取时返回 None"""
+    try:
+        import psutil
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def default_budget():
+    """环境变量 PSF_SIM_MEMORY_BUDGET 给出的预算，否则为可用内存的一半"""
+    setting = os.environ.get(ENV_VAR)
+    if setting:
+        return parse_size(setting)
+    available = available_memory()
+    return int(available * BUDGET_FRACTION) if available else FALLBACK_BUDGET
+
+
+def disk_array(shape, dtype=np.float32, directory=None):
+    """在磁盘临时文件上分配数组（内存映射；文件已匿名，映射释放后自动删除）"""
+    directory = directory or os.environ.get(SPILL_ENV_VAR) or None
+    return np.memmap(tempfile.TemporaryFile(dir=directory), dtype=dtype, mode='w+', shape=tuple(shape))
+
+
+# ---------- 各阶段估计 ----------
+def psf_shape(model, params):
+    """按生成参数（含默认值）给出PSF形状"""
+    full = simulation_engine.psf_metadata(model, params)['params']
+    size = int(full['size'])
+    if simulation_engine.model_key(model) in _SLAB_MODELS:
+        return size, size, int(full['size_z'])
+    return size, size
+
+
+def generation_bytes(model, shape, on_disk=False):
+    """生成阶段峰值：二维网格与中间量、z分块临时量，以及（在内存中时）整个输出体"""
+    key = simulation_engine.model_key(model)
+    grid = shape[0] * shape[1] * 8
+    total = _GRID_ARRAYS[key] * grid
+    if key in _SLAB_MODELS:
+        # 分块内：float64 乘积与取绝对值各一份
+        step = min(shape[2], max(1, PSFGenerator.SLAB_VOXELS // (shape[0] * shape[1])))
+        total += 2 * step * grid
+        if not on_disk:
+            total += int(np.prod(shape)) * 4
+    return total
+
+
+def convolution_bytes(image_shape, kernel_shape, tile_rows=None, itemsize=4):
+    """计算一个输出层的峰值：最大行块的输入带、FFT缓冲区、块结果与整层累加结果"""
+    from scipy import fft as sp_fft
+    rows, cols = image_shape[:2]
+    kh, kw = kernel_shape[:2]
+    tiles = ConvolutionHandler._row_tiles((rows, cols), (kh, kw), tile_rows)
+    tile = max(r1 - r0 for r0, r1 in tiles)
+    band = rows if len(tiles) == 1 else min(rows, tile + kh - 1)
+    padded = sp_fft.next_fast_len(band + kh - 1, real=True) * sp_fft.next_fast_len(cols + kw - 1, real=True)
+    # 补零输入、两份半长复数频谱与逆变换输出，约为每点 4 个实数
+    fft = 4 * padded * itemsize
+    return fft + (band + tile) * cols * itemsize + 2 * rows * cols * 4
+
+
+class MemoryPlan:
+    """内存规划：各阶段峰值估计（字节）、预算与采用的降级措施
+
+    object_dtype 非 None 时卷积前把物体转换为该类型；tile_rows 为卷积行块高度；
+    result_on_disk / psf_on_disk 表示结果或PSF分配在磁盘临时文件上；workers 为并行计算的z层数；
+    support_size / support_size_z 为按能量确定尺寸时允许加倍到的横向尺寸与z层数（auto_size_psf 的
+    max_size / max_size_z），None 表示不加倍。
+    """
+
+    def __init__(self, budget, workers=1):
+        self.budget = int(budget)
+        self.workers = workers
+        self.object_dtype = None
+        self.tile_rows = None
+        self.result_on_disk = False
+        self.psf_on_disk = False
+        self.support_size = None
+        self.support_size_z = None
+        self.stages = {}
+        self.fallbacks = []
+
+    @property
+    def peak(self):
+        return int(max(self.stages.values(), default=0))
+
+    @property
+    def fits(self):
+        return self.peak <= self.budget
+
+    def allocate_psf(self, shape):
+        # """PSF输出分配（供 generate_psf 的 allocate 参数）；在内存中时返回 None 由生成器自行分配"""
+        return disk_array(shape) if self.psf_on_disk else None
+
+    def describe(self):
+        """多行说明，运行前展示给用户"""
+        names = {'generate': "生成PSF", 'support': "能量裁剪", 'convolve': "卷积", 'write': "写出结果"}
+        lines = [f"内存预算 {format_size(self.budget)}，预计峰值 {format_size(self.peak)}"]
+        lines += [f"  {names.get(stage, stage)}: {format_size(nbytes)}" for stage, nbytes in self.stages.items()]
+        if self.fallbacks:
+            lines.append("为满足预算将采用：")
+            lines += [f"  · {text}" for text in self.fallbacks]
+        if not self.fits:
+            lines.append("已无可用的降级措施，运行仍可能超出预算")
+        return '\n'.join(lines)
+
+    def to_dict(self):
+        return {'budget': self.budget, 'peak': self.peak, 'fits': self.fits,
+                'stages': {stage: int(nbytes) for stage, nbytes in self.stages.items()},
+                'fallbacks': list(self.fallbacks), 'object_dtype': self.object_dtype, 'tile_rows': self.tile_rows,
+                'result_on_disk': self.result_on_disk, 'psf_on_disk': self.psf_on_disk, 'workers': self.workers,
+                'support_size': self.support_size, 'support_size_z': self.support_size_z}
+
+
+def plan_memory(psf_shape, model=None, image_shape=None, image_bytes=0, image_itemsize=4, n_planes=1,
+                workers=1, processes=False, support=False, output_ext=None, budget=None, max_size=None,
+                max_size_z=None):
+    """估计峰值内存并在超出预算时依次采用降级措施，返回 MemoryPlan
+
+    model 为生成PSF的模型（None 表示读取已保存的PSF，按惰性读取计）；image_shape 为 None 时只规划生成；
+    image_bytes 为物体常驻内存的字节数；processes 表示在进程池中计算（PSF与物体放入共享内存）。
+    support 为 True 时按能量裁剪；对可加倍尺寸的模型，max_size / max_size_z 为横向与z层数的加倍上限
+    （max_size_z 为 None 时不加倍z层数），规划取预算内能加倍到的最大尺寸（plan.support_size / support_size_z），
+    各阶段按该尺寸的核估计。
+    """
+    plan = MemoryPlan(default_budget() if budget is None else budget, max(1, min(workers, n_planes)))
+    if support and model is not None and max_size and \
+            simulation_engine.model_key(model) in simulation_engine._EXTENDABLE_MODELS:
+        psf_shape = _support_shape(model, psf_shape, max_size, max_size_z, plan)
+    psf_bytes = int(np.prod(psf_shape)) * 4
+    lazy_psf = model is None
+    image_itemsize = max(int(image_itemsize), 4)
+
+    def estimate():
+        plan.stages = {}
+        resident = 0 if (plan.psf_on_disk or lazy_psf) and not processes else psf_bytes
+        if model is not None:
+            plan.stages['generate'] = generation_bytes(model, psf_shape, plan.psf_on_disk)
+        if support:
+            # 逐层统计能量，裁剪结果在内存中（最坏情况不裁剪）
+            plan.stages['support'] = resident + psf_bytes
+        if image_shape is None:
+            return
+        itemsize = 4 if plan.object_dtype else image_itemsize
+        objects = image_bytes * itemsize // image_itemsize
+        per_plane = convolution_bytes(image_shape, psf_shape, plan.tile_rows, itemsize)
+        if len(image_shape) == 3:
+            # 三维物体：沿z广播时叠加的有效核（最多全部PSF层），二维PSF时物体沿z投影
+            per_plane += int(np.prod(psf_shape)) * 4 if len(psf_shape) == 3 else image_shape[0] * image_shape[1] * 4
+        result = image_shape[0] * image_shape[1] * 4 * n_planes
+        results = plan.workers * image_shape[0] * image_shape[1] * 4 if plan.result_on_disk else 2 * result
+        plan.stages['convolve'] = resident + objects + plan.workers * per_plane + results
+        if output_ext in ('.tif', '.tiff'):
+            # 多页TIFF写出时各页同时在内存中
+            plan.stages['write'] = (0 if plan.result_on_disk else result) + result
+
+    def over(stage):
+        return plan.stages.get(stage, 0) > plan.budget
+
+    estimate()
+    if over('convolve') and image_itemsize > 4:
+        plan.object_dtype = 'float32'
+        plan.fallbacks.append("物体转换为 float32，卷积使用 complex64")
+        estimate()
+    if over('convolve'):
+        # 逐次减半行块高度，直到满足预算或收效甚微（不足5%）
+        rows = int(max(r1 - r0 for r0, r1 in ConvolutionHandler._row_tiles(image_shape[:2], psf_shape[:2])))
+        while over('convolve') and rows > MIN_TILE_ROWS:
+            before, previous = plan.stages['convolve'], plan.tile_rows
+            rows = max(MIN_TILE_ROWS, rows // 2)
+            plan.tile_rows = rows
+            estimate()
+            if plan.stages['convolve'] > 0.95 * before:
+                plan.tile_rows = previous
+                estimate()
+                break
+        if plan.tile_rows is not None:
+            plan.fallbacks.append(f"卷积按 {plan.tile_rows} 行分块")
+    if (over('convolve') or over('write')) and n_planes > 1:
+        plan.result_on_disk = True
+        plan.fallbacks.append("结果逐层写入磁盘临时文件")
+        estimate()
+    if over('convolve') and plan.workers > 1:
+        while over('convolve') and plan.workers > 1:
+            plan.workers = max(1, plan.workers // 2)
+            estimate()
+        plan.fallbacks.append(f"并行层数降为 {plan.workers}")
+    if not plan.fits and model is not None and not processes and \
+            simulation_engine.model_key(model) in _SLAB_MODELS:
+        plan.psf_on_disk = True
+        plan.fallbacks.append("PSF逐z分块生成到磁盘临时文件（内存映射读取）")
+        estimate()
+    return plan
+
+
+def _support_shape(model, shape, max_size, max_size_z, plan):
+    # """按能量确定尺寸时核可能加倍到的最大形状：横向（轴向可加大的模型还有z层数）逐次加倍，
+    # 直到达到上限或生成与裁剪超出预算"""
+    shape = list(shape)
+    deeper = len(shape) == 3 and bool(max_size_z) and \
+        simulation_engine.model_key(model) in simulation_engine._AXIAL_EXTENDABLE_MODELS
+    directions = [((0, 1), max_size, "横向尺寸")] + ([((2,), max_size_z, "z层数")] if deeper else [])
+    while directions:
+        for direction in list(directions):
+            axes, limit, name = direction
+            if shape[axes[0]] >= limit:
+                directions.remove(direction)
+                continue
+            bigger = list(shape)
+            for axis in axes:
+                bigger[axis] = min(2 * shape[axis], limit)
+            # 生成峰值加上裁剪时的核与裁剪结果
+            if generation_bytes(model, tuple(bigger)) + int(np.prod(bigger)) * 4 > plan.budget:
+                plan.fallbacks.append(f"按能量确定尺寸时核的{name}至多加倍到 {shape[axes[0]]}")
+                directions.remove(direction)
+            else:
+                shape = bigger
+    plan.support_size = shape[0]
+    plan.support_size_z = shape[2] if deeper else None
+    return tuple(shape)
+
+
+def object_footprint(image):
+    """物体的 (形状, 常驻字节数, 元素字节数)；None 表示没有物体"""
+    if image is None:
+        return None, 0, 4
+    if isinstance(image, ImageStack):
+        # 惰性图像栈逐页读取，常驻约一页
+        return image.shape, image.shape[0] * image.shape[1] * 4, 4
+    # 沿z广播的物体只占一层
+    base = image[:, :, 0] if image.ndim == 3 and image.strides[2] == 0 else image
+    return image.shape, base.nbytes, image.dtype.itemsize
+
+
+def spec_footprint(spec):
+    """按任务中的 object 描述估计物体的 (形状, 常驻字节数, 元素字节数)，不载入物体（见 object_footprint）"""
+    if spec is None:
+        return None, 0, 4
+    shape = simulation_engine.object_shape(spec)
+    # 二维物体在内存中为 float32；惰性图像栈逐页读取、沿z广播的物体只占一层，也都按一层计
+    return shape, shape[0] * shape[1] * 4, 4
+
+
+def plan_job(job, budget=None, workers=1, processes=False):
+    """按任务描述规划（物体与已保存的PSF只读取文件头，场景不栅格化，PSF只按参数计算形状，不生成）"""
+    psf_spec = dict(job['psf'])
+    support = psf_spec.pop('support', None)
+    options = simulation_engine.support_options(support) if support else {}
+    max_size = options.get('max_size')
+    max_size_z = options['max_size_z'] if options.get('axial') else None
+    if 'path' in psf_spec:
+        from volume_file import open_stack
+        model, shape = None, open_stack(psf_spec['path']).shape
+    else:
+        model = psf_spec.pop('model')
+        shape = psf_shape(model, psf_spec)
+    object_spec = job['object']
+    if 'directory' in object_spec:
+        from batch_pipeline import BatchPipeline
+        paths = BatchPipeline.list_images(object_spec['directory'])
+        object_spec = {'path': paths[0]} if paths else None
+    image_shape, image_bytes, itemsize = spec_footprint(object_spec)
+    planes = simulation_engine.resolve_planes(job.get('z_planes', 'all'), np.broadcast_to(np.float32(0), shape))
+    output_ext = os.path.splitext(job.get('output', {}).get('path', ''))[1].lower() or None
+    return plan_memory(shape, model, image_shape, image_bytes, itemsize, len(planes), workers=workers,
+                       processes=processes, support=bool(support), output_ext=output_ext, budget=budget,
+                       max_size=max_size, max_size_z=max_size_z)
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from convolution_handler import ConvolutionHandler
+
+AXIS_XZ = 0  # 固定行（y），沿列（x）与z展开
+AXIS_YZ = 1  # 固定列（x），沿行（y）与z展开
+
+
+def volume_section(volume, axis, index):
+    """从三维体（数组或内存映射，z轴在最后）取正交切面的跨步视图，形状 (z, 长度)，不复制数据"""
+    if axis == AXIS_XZ:
+        return volume[index, :, :].T
+    return volume[:, index, :].T
+
+
+class ResultSections:
+    """结果体的正交切面
+
+    按需计算：已缓存的z层直接取其对应行/列，其余层只做单行/单列卷积求值，
+    无需计算完整三维结果。最近的切面按 (方向, 位置) 缓存，更换数据源时清空。
+    """
+
+    def __init__(self, max_sections=16):
+        self.max_sections = max_sections
+        self._source = None  # (图像, PSF, 已缓存层查询函数)
+        self._version = 0
+        self._sections = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def set_source(self, image, psf, cached_plane=None):
+        """设置数据源；cached_plane(z) 返回已计算的第z层结果或 None"""
+        if psf.ndim != 3:
+            raise ValueError("正交切面需要三维PSF")
+        with self._lock:
+            self._source = (image, psf, cached_plane)
+            self._version += 1
+            self._sections.clear()
+            return self._version
+
+    def get(self, axis, index):
+        with self._lock:
+            section = self._sections.get((axis, index))
+            if section is not None:
+                self._sections.move_to_end((axis, index))
+            return section
+
+    def compute(self, axis, index, cancel_token=None):
+        """返回切面 (z, 长度)；在后台线程调用"""
+        section = self.get(axis, index)
+        if section is not None:
+            return section
+        with self._lock:
+            image, psf, cached_plane = self._source
+            version = self._version
+
+        n_planes = psf.shape[2]
+        section = np.empty((n_planes, image.shape[1 - axis]), dtype=np.float32)
+        for z in range(n_planes):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            plane = cached_plane(z) if cached_plane is not None else None
+            if plane is not None:
+                section[z] = plane[index] if axis == AXIS_XZ else plane[:, index]
+            else:
+                section[z] = ConvolutionHandler.convolve_line(image, psf, z, index, axis)
+
+        with self._lock:
+            if version == self._version:
+                self._sections[(axis, index)] = section
+                while len(self._sections) > self.max_sections:
+                    self._sections.popitem(last=False)
+        return section
@@ -0,0 +1,119 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from convolution_handler import ConvolutionHandler
+from profiling import traced
+
+
+def _fft():
+    # """首次使用时导入 scipy.fft（缩短程序启动时间）"""
+    from scipy import fft
+    return fft
+
+
+def _block_reduce(array, factor, reducer):
+    # """按 factor×factor 块归约（不足一块的边缘补零）"""
+    if factor == 1:
+        return np.asarray(array, dtype=np.float32)
+    rows, cols = array.shape
+    pr, pc = -rows % factor, -cols % factor
+    padded = np.pad(np.asarray(array, dtype=np.float32), ((0, pr), (0, pc)))
+    blocks = padded.reshape(padded.shape[0] // factor, factor, padded.shape[1] // factor, factor)
+    return reducer(blocks, axis=(1, 3))
+
+
+def _anchor(kernel_length, factor):
+    # """降采样网格上 'same' 卷积的裁剪起点与剩余偏移（降采样像素）：
+    # 全分辨率核中心 (k-1)//2 在块归约后位于 ((k-1)//2 - (factor-1)/2) / factor，取最近的整数作为起点"""
+    center = ((kernel_length - 1) // 2 - (factor - 1) / 2) / factor
+    start = int(np.clip(np.rint(center), 0, -(-kernel_length // factor) - 1))
+    return start, center - start
+
+
+class OTFPyramid:
+    """PSF多分辨率金字塔：缓存各降采样级别的卷积核及其在给定FFT尺寸下的OTF（线程安全）"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._otfs = OrderedDict()  # (核摘要, 级别, FFT尺寸) -> (OTF, 降采样核尺寸)
+        self._lock = threading.Lock()
+
+    def otf(self, kernel, factor, image_shape):
+        """返回 (OTF, FFT尺寸, 降采样核尺寸)；image_shape 为降采样后的图像尺寸"""
+        sp_fft = _fft()
+        kernel_shape = tuple(-(-n // factor) for n in kernel.shape)
+        fft_shape = tuple(sp_fft.next_fast_len(a + b - 1, real=True)
+                          for a, b in zip(image_shape, kernel_shape))
+        key = (hash(np.ascontiguousarray(kernel).tobytes()), kernel.shape, factor, fft_shape)
+        with self._lock:
+            entry = self._otfs.get(key)
+            if entry is not None:
+                self._otfs.move_to_end(key)
+        if entry is None:
+            # 块求和保持能量：降采样图像（块均值）与之卷积约等于结果的块均值
+            small = _block_reduce(kernel, factor, np.sum)
+            entry = (sp_fft.rfft2(small, fft_shape), small.shape)
+            with self._lock:
+                self._otfs[key] = entry
+                while len(self._otfs) > self.max_entries:
+                    self._otfs.popitem(last=False)
+        return entry[0], fft_shape, entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._otfs.clear()
+
+    def convolve(self, image, psf, z_index=None, factor=1):
+        """以缓存的OTF计算 'same' 卷积，结果为降采样 factor 倍的尺寸（factor=1 即全分辨率结果，未截断到[0,1]）
+
+        结果第 i 个像素对应全分辨率位置 (i + 0.5)·factor - 0.5 - offset·factor，
+        offset 为 _anchor 给出的剩余偏移（factor=1 时为0）。
+        """
+        rows, cols = image.shape[:2]
+        small_shape = (-(-rows // factor), -(-cols // factor))
+        sp_fft = _fft()
+
+        spectrum = None
+        fft_shape = kernel = None
+        for obj, kernel in ConvolutionHandler.plane_pairs(image, psf, z_index):
+            otf, fft_shape, _ = self.otf(kernel, factor, small_shape)
+            term = sp_fft.rfft2(_block_reduce(obj, factor, np.mean), fft_shape) * otf
+            spectrum = term if spectrum is None else spectrum + term
+        if spectrum is None:
+            return np.zeros(small_shape, dtype=np.float32)
+
+        full = sp_fft.irfft2(spectrum, fft_shape)
+        r0, c0 = _anchor(kernel.shape[0], factor)[0], _anchor(kernel.shape[1], factor)[0]
+        return full[r0:r0 + small_shape[0], c0:c0 + small_shape[1]].astype(np.float32)
+
+
+class PreviewPipeline:
+    """绘制过程中的多分辨率快速预览：降采样画布与降采样OTF卷积后放大回原尺寸（近似结果）"""
+
+    def __init__(self):
+        self.pyramid = OTFPyramid()
+
+    @staticmethod
+    def choose_factor(image_shape):
+        # """按画布尺寸选择降采样倍数（2×或4×）"""
+        return 4 if image_shape[0] * image_shape[1] >= 512 * 512 else 2
+
+    @traced('preview')
+    def preview(self, image, psf, z_index=None, factor=None):
+        """计算近似结果，返回与 ConvolutionHandler.convolve 同尺寸、同取值范围的数组"""
+        factor = factor or self.choose_factor(image.shape[:2])
+        from scipy.ndimage import map_coordinates
+        rows, cols = image.shape[:2]
+        small = self.pyramid.convolve(image, psf, z_index, factor)
+        if factor == 1:
+            return np.clip(small, 0, 1)
+
+        # 按像素中心线性插值放大回原尺寸，并补偿裁剪起点的剩余偏移，使预览与全分辨率结果对齐
+        kernel_shape = psf.shape[:2]
+        r = (np.arange(rows) + 0.5) / factor - 0.5 + _anchor(kernel_shape[0], factor)[1]
+        c = (np.arange(cols) + 0.5) / factor - 0.5 + _anchor(kernel_shape[1], factor)[1]
+        rr, cc = np.meshgrid(r.astype(np.float32), c.astype(np.float32), indexing='ij')
+        result = map_coordinates(small, [rr, cc], order=1, mode='nearest')
+        return np.clip(result, 0, 1)
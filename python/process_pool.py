@@ -0,0 +1,248 @@
+import multiprocessing as mp
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cancellation import OperationCancelled
+from image_stack import ImageStack
+from profiling import span
+
+
+# ---------- 共享内存数组 ----------
+class _SharedBlock:
+    # """持有一段共享内存；最后一个引用释放时关闭，创建方同时负责删除"""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.address = np.frombuffer(shm.buf, np.uint8).ctypes.data
+        self._finalizer = weakref.finalize(self, _SharedBlock._release, shm, owner)
+
+    @staticmethod
+    def _release(shm, owner):
+        shm.close()
+        if owner:
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedNDArray(np.ndarray):
+    """以共享内存为缓冲区的数组，可零拷贝地在进程间传递"""
+
+    def __array_finalize__(self, obj):
+        # 只有落在同一段共享内存内的视图才继承；运算结果是普通内存
+        block = getattr(obj, '_block', None)
+        if block is not None and not block.address <= self.ctypes.data < block.address + block.shm.size:
+            block = None
+        self._block = block
+
+    @property
+    def descriptor(self):
+        # 仅从缓冲区起点开始的连续数组可直接按名称传递
+        block = self._block
+        if block is None or self.ctypes.data != block.address or not self.flags.c_contiguous:
+            return None
+        return block.shm.name, self.shape, self.dtype.str
+
+
+def _wrap(shm, shape, dtype, owner):
+    block = _SharedBlock(shm, owner)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf).view(SharedNDArray)
+    array._block = block
+    return array
+
+
+def empty_shared(shape, dtype=np.float32):
+    """在共享内存中分配数组（本进程负责删除）"""
+    dtype = np.dtype(dtype)
+    nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    return _wrap(shm, tuple(shape), dtype, owner=True)
+
+
+def share(array):
+    """返回数组的共享内存描述；已在共享内存中的数组不复制"""
+    if isinstance(array, SharedNDArray) and array.descriptor is not None:
+        return array.descriptor, array
+    if isinstance(array, ImageStack):
+        # 文件支持的惰性图像栈：直接传递（只序列化路径），工作进程自行映射文件
+        return array, array
+    if isinstance(array, np.ndarray) and array.ndim == 3 and array.shape[2] > 1 and array.strides[2] == 0:
+        # 沿z广播的物体（各层相同）：只共享一层，挂载时重新广播，保留单次卷积的路径
+        descriptor, layer = share(array[:, :, :1])
+        return descriptor + (array.shape,), np.broadcast_to(layer, array.shape, subok=True)
+    array = np.asarray(array)
+    shared = empty_shared(array.shape, array.dtype)
+    shared[...] = array
+    return shared.descriptor, shared
+
+
+def attach(descriptor, owner=False):
+    """按描述挂载共享内存数组"""
+    if isinstance(descriptor, ImageStack):
+        return descriptor
+    name, shape, dtype = descriptor[:3]
+    shm = shared_memory.SharedMemory(name=name)
+    array = _wrap(shm, tuple(shape), np.dtype(dtype), owner)
+    if len(descriptor) > 3:
+        # 沿z广播的描述：(名称, 单层形状, 类型, 广播后形状)
+        array = np.broadcast_to(array, tuple(descriptor[3]), subok=True)
+    return array
+
+
+# ---------- 跨进程进度与取消 ----------
+class _SharedControl:
+    # """子进程侧：进度写入与取消检查，接口与 CancellationToken 一致"""
+
+    def __init__(self, block):
+        self._block = block  # [进度, 取消标志]
+
+    def progress(self, value):
+        self._block[0] = value
+
+    @property
+    def cancelled(self):
+        return self._block[1] != 0
+
+    def raise_if_cancelled(self):
+        if self._block[1] != 0:
+            raise OperationCancelled("运算已取消")
+
+
+# ---------- 子进程任务 ----------
+def _warm_up():
+    # 预先导入重型模块，导入开销在进程启动时只付一次
+    import scipy.signal  # noqa: F401
+    import scipy.special  # noqa: F401
+    import scipy.ndimage  # noqa: F401
+    import psf_generator  # noqa: F401
+    import convolution_handler  # noqa: F401
+
+
+def _ping():
+    return os.getpid()
+
+
+def _publish(result):
+    # 结果写入新建的共享内存，由父进程接管并负责删除
+    result = np.ascontiguousarray(result)
+    shm = shared_memory.SharedMemory(create=True, size=max(result.nbytes, 1))
+    np.ndarray(result.shape, dtype=result.dtype, buffer=shm.buf)[...] = result
+    descriptor = (shm.name, result.shape, result.dtype.str)
+    shm.close()
+    return descriptor
+
+
+def _run_generate(method, kwargs, control_desc):
+    from psf_generator import PSFGenerator
+    control_array = attach(control_desc)
+    control = _SharedControl(control_array)
+    generator = getattr(PSFGenerator, method)
+    if method in ('generate_bessel', 'generate_gaussian'):
+        kwargs = dict(kwargs, progress_callback=control.progress, cancel_token=control)
+    return _publish(generator(**kwargs))
+
+
+def _run_convolve(image_desc, psf_desc, scale_factor, z_index, control_desc, tile_rows=None):
+    from convolution_handler import ConvolutionHandler
+    control_array = attach(control_desc)
+    control = _SharedControl(control_array)
+    image = attach(image_desc)
+    psf = attach(psf_desc)
+    result = ConvolutionHandler.convolve(image, psf, scale_factor, z_index=z_index, progress_callback=control.progress,
+                                         cancel_token=control, tile_rows=tile_rows)
+    return _publish(result)
+
+
+def _run_simulation(job, control_desc):
+    import simulation_engine
+    control_array = attach(control_desc)
+    control = _SharedControl(control_array)
+    _, _, result = simulation_engine.simulate(job, progress_callback=control.progress, cancel_token=control)
+    return _publish(result)
+
+
+# ---------- 进程池后端 ----------
+class ProcessPoolBackend:
+    """常驻进程池执行后端：PSF、图像与结果经共享内存交换，避免大数组序列化"""
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        # spawn 启动：避免在已有Qt线程的进程中 fork
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=mp.get_context('spawn'),
+                                             initializer=_warm_up)
+
+    def warm_up(self):
+        """预热全部工作进程（异步），返回 futures"""
+        return [self._executor.submit(_ping) for _ in range(self.max_workers)]
+
+    def generate(self, method, progress_callback=None, cancel_token=None, **kwargs):
+        """在工作进程中调用 PSFGenerator.<method>(**kwargs)"""
+        control = empty_shared((2,), np.float64)
+        control[:] = 0
+        future = self._executor.submit(_run_generate, method, kwargs, control.descriptor)
+        with span('pool/' + method, **kwargs):
+            return self._collect(future, control, progress_callback, cancel_token)
+
+    def convolve(self, image, psf, scale_factor=1.0, z_index=None, progress_callback=None, cancel_token=None,
+                 tile_rows=None):
+        """在工作进程中执行 ConvolutionHandler.convolve"""
+        image_desc, image_shared = share(image)
+        psf_desc, psf_shared = share(psf)
+        control = empty_shared((2,), np.float64)
+        control[:] = 0
+        future = self._executor.submit(_run_convolve, image_desc, psf_desc, scale_factor, z_index,
+                                       control.descriptor, tile_rows)
+        try:
+            with span('pool/convolve', image=image.shape, psf=psf.shape, z_index=z_index):
+                return self._collect(future, control, progress_callback, cancel_token)
+        finally:
+            del image_shared, psf_shared
+
+    def simulate(self, job, progress_callback=None, cancel_token=None):
+        """在一个工作进程中完整执行 simulation_engine.simulate(job)，返回结果"""
+        control = empty_shared((2,), np.float64)
+        control[:] = 0
+        future = self._executor.submit(_run_simulation, job, control.descriptor)
+        with span('pool/simulate'):
+            return self._collect(future, control, progress_callback, cancel_token)
+
+    def _collect(self, future, control, progress_callback, cancel_token):
+        # """等待任务完成，转发进度与取消请求，接管结果共享内存"""
+        last = -1
+        while True:
+            done, _ = wait([future], timeout=self.POLL_INTERVAL)
+            if cancel_token is not None and cancel_token.cancelled:
+                control[1] = 1
+                future.cancel()
+            value = int(control[0])
+            if progress_callback and value != last:
+                last = value
+                progress_callback(value)
+            if done:
+                break
+        if future.cancelled():
+            raise OperationCancelled("运算已取消")
+        return attach(future.result(), owner=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_backend = None
+
+
+def get_backend():
+    """进程内共享的常驻后端（首次调用时创建并预热）"""
+    global _backend
+    if _backend is None:
+        _backend = ProcessPoolBackend()
+        _backend.warm_up()
+    return _backend
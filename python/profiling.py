@@ -0,0 +1,159 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# 运行耗时采集：环境变量 PSF_SIM_TRACE=1 开启；值为 .json 路径时退出前自动导出 Chrome Trace。
+# PSF_SIM_TRACE_ALLOC=1 时另用 tracemalloc 记录每个区段的内存分配（开销较大）。
+# 未开启时 span() 返回共享的空上下文，几乎没有开销。
+ENV_VAR = 'PSF_SIM_TRACE'
+ALLOC_ENV_VAR = 'PSF_SIM_TRACE_ALLOC'
+MAX_EVENTS = 200000  # 超出后丢弃最早的事件
+
+_enabled = False
+_trace_alloc = False
+_origin = time.perf_counter()
+_events = []  # (名称, 开始秒, 持续秒, 线程号, 参数)
+_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(trace_alloc=False):
+    global _enabled, _trace_alloc
+    _enabled = True
+    _trace_alloc = trace_alloc
+    if trace_alloc and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def clear():
+    with _lock:
+        _events.clear()
+
+
+class _NullSpan:
+    # """未开启采集时的空区段"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+class _Span:
+    # """一个计时区段；set() 追加参数（如输出形状与字节数）"""
+    __slots__ = ('name', 'args', 'start', 'alloc')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        if _trace_alloc:
+            self.alloc = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        if _trace_alloc:
+            self.args['alloc_bytes'] = tracemalloc.get_traced_memory()[0] - self.alloc
+        with _lock:
+            if len(_events) >= MAX_EVENTS:
+                del _events[:MAX_EVENTS // 10]
+            _events.append((self.name, self.start - _origin, end - self.start, threading.get_ident(), self.args))
+        return False
+
+
+def span(name, **args):
+    """计时区段：with span("convolve", shape=image.shape) as s: ...; s.set(bytes=result.nbytes)"""
+    if not _enabled:
+        return _NULL
+    return _Span(name, args)
+
+
+def traced(name):
+    """函数计时装饰器（未开启采集时直接调用原函数）"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def describe(array):
+    """数组参数的简要描述：形状与字节数"""
+    return {'shape': list(getattr(array, 'shape', ())), 'bytes': int(getattr(array, 'nbytes', 0))}
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def summary():
+    """按名称汇总：{名称: (次数, 总秒, 最大秒, 最近一次秒)}"""
+    stats = {}
+    for name, _, duration, _, _ in events():
+        count, total, longest, _ = stats.get(name, (0, 0.0, 0.0, 0.0))
+        stats[name] = (count + 1, total + duration, max(longest, duration), duration)
+    return stats
+
+
+def export_chrome_trace(path):
+    """导出为 Chrome Trace 事件格式（chrome://tracing 或 Perfetto 打开）"""
+    pid = os.getpid()
+    trace = [{'name': name, 'cat': name.split('/')[0], 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6,
+              'pid': pid, 'tid': tid, 'args': _jsonable(args)}
+             for name, start, duration, tid, args in events()]
+    trace += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident,
+               'args': {'name': thread.name}} for thread in threading.enumerate()]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return len(trace)
+
+
+def _jsonable(args):
+    # """参数转为可序列化形式（元组、NumPy标量等）"""
+    def convert(value):
+        if isinstance(value, (str, int, float, bool, type(None), list, dict)):
+            return value
+        if isinstance(value, tuple):
+            return [convert(v) for v in value]
+        if hasattr(value, 'item') and getattr(value, 'ndim', None) == 0:
+            return value.item()
+        return str(value)
+    return {key: convert(value) for key, value in args.items()}
+
+
+_setting = os.environ.get(ENV_VAR, '')
+if _setting and _setting != '0':
+    enable(trace_alloc=os.environ.get(ALLOC_ENV_VAR, '') not in ('', '0'))
+    if _setting.lower().endswith('.json'):
+        atexit.register(export_chrome_trace, _setting)
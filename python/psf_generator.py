@@ -1,6 +1,6 @@
 import numpy as np
-from scipy.special import j1, jn
-from scipy.ndimage import rotate
+
+# scipy.special / scipy.ndimage 在生成函数中按需导入，缩短程序启动时间
 
 class PSFGenerator:
 
@@ -11,43 +11,71 @@ class PSFGenerator:
             'n_bessel': 0, 'amplitude': 1.0,
             'wavelength': 633e-9, 'phase_shift': np.pi / 4
         }
+    # 生成时每个z分块的目标体素数
+    SLAB_VOXELS = 1 << 20
+
+    @staticmethod
+    def _z_slabs(size_xy, size_z):
+        # """按体素数划分z分块"""
+        step = max(1, PSFGenerator.SLAB_VOXELS // max(size_xy * size_xy, 1))
+        return [(z0, min(z0 + step, size_z)) for z0 in range(0, size_z, step)]
+
     @staticmethod
     def generate_bessel(size=128,size_z=64,size_dxdy = 0.1e-6,size_dz=0.05e-6,amplitude = 1,wavelength=500e-9,
-                        n_bessel = 0,phase_shift = 90.0):
-        # 贝塞尔干涉模式
+                        n_bessel = 0,phase_shift = 90.0, progress_callback=None, cancel_token=None, out=None):
+        # 贝塞尔干涉模式；out 为预先分配的 (size, size, size_z) float32 输出（如磁盘内存映射）
+        size, size_z = int(size), int(size_z)
         x = (np.arange(size) - size // 2) * size_dxdy
         y = (np.arange(size) - size // 2) * size_dxdy
         z = (np.arange(size_z) - size_z // 2) * size_dz
-        X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
+        X, Y = np.meshgrid(x, y, indexing='ij')
         r_xy = np.sqrt(X ** 2 + Y ** 2)  # 横向径向距离
         k = 2 * np.pi / wavelength
 
-        # 贝塞尔函数（二维）与轴向干涉的组合
-        bessel = jn(n_bessel, k * r_xy)
-        interference = np.cos(k * Z + phase_shift/180.0 * np.pi)
-        psf = amplitude * bessel * interference
-        psf = np.abs(psf)  # 取绝对值保证非负
-        psf /= psf.max()  # 归一化到[0,1]
+        # 贝塞尔函数（二维）与轴向干涉的组合：横向项只计算一次，按z分块组合
+        from scipy.special import jn
+        bessel = amplitude * jn(n_bessel, k * r_xy)
+        interference = np.cos(k * z + phase_shift/180.0 * np.pi)
+        psf = np.empty((size, size, size_z), dtype=np.float32) if out is None else out
+        slabs = PSFGenerator._z_slabs(size, size_z)
+        for i, (z0, z1) in enumerate(slabs):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            psf[:, :, z0:z1] = np.abs(bessel[:, :, None] * interference[None, None, z0:z1])  # 取绝对值保证非负
+            if progress_callback:
+                progress_callback(int(100 * (i + 1) / len(slabs)))
+        peak = max(float(psf[:, :, z0:z1].max()) for z0, z1 in slabs)
+        for z0, z1 in slabs:
+            psf[:, :, z0:z1] /= peak  # 归一化到[0,1]（逐块，磁盘映射输出不整体读入）
         # psf = psf / psf.sum() #再均分强度
-        return psf.astype(np.float32)
+        return psf
 
     @staticmethod
     def generate_gaussian(size=128,size_z=64,size_dxdy = 0.1e-6,size_dz=0.05e-6,amplitude = 1,wavelength=500e-9,
-                          f=1.0):
-        # 高斯衍射模式
-        x,y = (np.arange(size) - size // 2) * size_dxdy
+                          f=1.0, progress_callback=None, cancel_token=None, out=None):
+        # 高斯衍射模式；out 同 generate_bessel
+        size, size_z = int(size), int(size_z)
+        x = y = (np.arange(size) - size // 2) * size_dxdy
         z = (np.arange(size_z) - size_z // 2) * size_dz
-        X, Y, Z = np.meshgrid(x, y, z, indexing='ij')
-        r = np.sqrt(X ** 2 + Y ** 2 + Z ** 2)  # 三维径向距离
+        X, Y = np.meshgrid(x, y, indexing='ij')
 
         # 根据阿贝衍射极限计算标准差
         fwhm = wavelength / 2
         sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))  # FWHM = 2.355σ
-        psf = np.exp(-r ** 2 / (2 * sigma ** 2))
-        psf = np.abs(psf)  # 取绝对值保证非负
+        # 三维径向高斯可分解为横向项与轴向项之积
+        lateral = np.exp(-(X ** 2 + Y ** 2) / (2 * sigma ** 2))
+        axial = np.exp(-z ** 2 / (2 * sigma ** 2))
+        psf = np.empty((size, size, size_z), dtype=np.float32) if out is None else out
+        slabs = PSFGenerator._z_slabs(size, size_z)
+        for i, (z0, z1) in enumerate(slabs):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            psf[:, :, z0:z1] = lateral[:, :, None] * axial[None, None, z0:z1]
+            if progress_callback:
+                progress_callback(int(100 * (i + 1) / len(slabs)))
         # psf /= psf.max()  # 归一化到[0,1]
         # psf = psf / psf.sum()  # 再均分强度
-        return psf.astype(np.float32)
+        return psf
 
     @staticmethod
     def generate_airy(size=128,size_z=64,size_dxdy = 0.1e-6,size_dz=0.05e-6,amplitude = 1,wavelength=500e-9,
@@ -58,6 +86,7 @@ class PSFGenerator:
         xx, yy = np.meshgrid(x, y)
         r = np.sqrt(xx**2 + yy**2)
         kr = k * r
+        from scipy.special import j1
         psf = (2 * j1(kr) / kr)**2
         psf[np.isnan(psf)] = 1.0
         return psf / psf.sum()
@@ -74,5 +103,6 @@ class PSFGenerator:
         kernel = np.zeros((size, size))
         center = size//2
         kernel[center-length//2:center+length//2, center] = 1
+        from scipy.ndimage import rotate
         kernel = rotate(kernel, angle, reshape=False)
         return kernel / kernel.sum()
\ No newline at end of file
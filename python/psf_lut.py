@@ -0,0 +1,125 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.ndimage import spline_filter, map_coordinates
+
+
+class PSFLookupTable:
+    """PSF亚像素插值查找表
+
+    由任意 PSFGenerator 输出（二维或 (x, y, z) 三维数组）构建，三次样条系数只计算一次。
+    横向按 oversample 倍过采样、轴向按 z_oversample 倍细分的查找表按需生成并缓存
+    （按最近使用顺序淘汰，总内存不超过 max_cache_bytes），
+    供拟合、印章渲染、轨迹模拟等批量查询。
+    坐标约定与卷积核一致：dy 对应PSF第0轴（图像行），dx 对应第1轴（图像列），
+    z 为PSF层索引（可为小数）。
+    """
+
+    _PAD = 4  # 横向补零宽度（像素）
+
+    def __init__(self, psf, oversample=4, z_oversample=4, max_cache_bytes=256 * 1024 ** 2):
+        if psf.ndim not in [2, 3]:
+            raise ValueError("PSF必须是二维或三维数组")
+        if oversample < 1 or z_oversample < 1:
+            raise ValueError("过采样倍数必须不小于1")
+
+        psf = np.asarray(psf, dtype=np.float64)
+        if psf.ndim == 2:
+            psf = psf[:, :, np.newaxis]
+        self.shape = psf.shape
+        self.oversample = int(oversample)
+        self.z_oversample = int(z_oversample)
+        # 与 fftconvolve(mode='same') 相同的中心
+        self.center = ((psf.shape[0] - 1) // 2, (psf.shape[1] - 1) // 2)
+
+        # 三次样条系数：横向补零边，使支撑外的插值严格衰减到0（单层PSF退化为二维样条）
+        padded = np.pad(psf, ((self._PAD, self._PAD), (self._PAD, self._PAD), (0, 0)))
+        if psf.shape[2] == 1:
+            padded = padded[:, :, 0]
+        self._coeffs = spline_filter(padded, order=3, mode='mirror')
+        self.max_cache_bytes = max_cache_bytes
+        self._planes = OrderedDict()  # 细分z层索引 -> 过采样横向平面（LRU顺序）
+        self._cache_bytes = 0
+
+    @property
+    def nz(self):
+        return self.shape[2]
+
+    def _evaluate(self, rows, cols, z):
+        # """在PSF数组坐标处计算样条值，补零区之外取0"""
+        rows = np.asarray(rows, dtype=np.float64) + self._PAD
+        cols = np.asarray(cols, dtype=np.float64) + self._PAD
+        if self._coeffs.ndim == 2:
+            coords = np.array([rows, cols])
+        else:
+            coords = np.array([rows, cols, np.asarray(z, dtype=np.float64)])
+        values = map_coordinates(self._coeffs, coords, order=3, prefilter=False, mode='mirror')
+        outside = ((rows < 0) | (rows > self._coeffs.shape[0] - 1) |
+                   (cols < 0) | (cols > self._coeffs.shape[1] - 1))
+        values[outside] = 0.0
+        return values
+
+    def sample(self, dx, dy, z=0.0):
+        """在任意 (dx, dy, z) 偏移处向量化采样PSF（三次样条插值）
+
+        dx, dy 为相对PSF中心的像素偏移，z 为PSF层索引；返回与广播后输入同形状的数组。
+        """
+        dx, dy, z = np.broadcast_arrays(np.asarray(dx, dtype=np.float64),
+                                        np.asarray(dy, dtype=np.float64),
+                                        np.asarray(z, dtype=np.float64))
+        values = self._evaluate(dy.ravel() + self.center[0], dx.ravel() + self.center[1],
+                                np.clip(z.ravel(), 0, self.nz - 1))
+        return values.reshape(dx.shape)
+
+    def _plane(self, kz):
+        # """获取（必要时生成）某一细分z层的过采样横向平面"""
+        plane = self._planes.get(kz)
+        if plane is not None:
+            self._planes.move_to_end(kz)
+        else:
+            s = self.oversample
+            h, w = self.shape[:2]
+            # 过采样网格覆盖 [-1, h)，以支持 [0, 1) 像素的亚像素平移
+            rows = (np.arange((h + 1) * s) - s) / s
+            cols = (np.arange((w + 1) * s) - s) / s
+            rr, cc = np.meshgrid(rows, cols, indexing='ij')
+            zz = np.full(rr.size, kz / self.z_oversample)
+            plane = self._evaluate(rr.ravel(), cc.ravel(), zz).reshape(rr.shape).astype(np.float32)
+            self._planes[kz] = plane
+            self._cache_bytes += plane.nbytes
+            while self._cache_bytes > self.max_cache_bytes and len(self._planes) > 1:
+                _, old = self._planes.popitem(last=False)
+                self._cache_bytes -= old.nbytes
+        return plane
+
+    def stamps(self, fx, fy, z=0.0):
+        """取亚像素相位印章，返回 (N, h, w) 数组
+
+        fx, fy ∈ [0, 1) 为发射体相对整数像素的亚像素偏移（按过采样网格取最近相位），
+        z 为PSF层索引，在相邻细分层之间线性插值。
+        印章第 k 行对应图像行 iy + k - center[0]。
+        """
+        s = self.oversample
+        h, w = self.shape[:2]
+        fx, fy, z = np.broadcast_arrays(np.atleast_1d(fx), np.atleast_1d(fy), np.atleast_1d(z))
+        px = np.clip(np.rint(fx * s).astype(np.int64), 0, s)
+        py = np.clip(np.rint(fy * s).astype(np.int64), 0, s)
+
+        # 过采样网格中的行列索引：像素 k、相位 p 对应 s*(k+1) - p
+        r_idx = s * (np.arange(h)[None, :] + 1) - py[:, None]
+        c_idx = s * (np.arange(w)[None, :] + 1) - px[:, None]
+
+        kz = np.clip(np.asarray(z, dtype=np.float64), 0, self.nz - 1) * self.z_oversample
+        k0 = np.floor(kz).astype(np.int64)
+        t = (kz - k0).astype(np.float32)
+        out = np.empty((len(px), h, w), dtype=np.float32)
+        for k in np.unique(k0):
+            sel = np.nonzero(k0 == k)[0]
+            lower = self._plane(int(k))[r_idx[sel, :, None], c_idx[sel, None, :]]
+            frac = t[sel]
+            if np.any(frac > 0):
+                upper = self._plane(int(min(k + 1, (self.nz - 1) * self.z_oversample)))
+                upper = upper[r_idx[sel, :, None], c_idx[sel, None, :]]
+                lower = lower + frac[:, None, None] * (upper - lower)
+            out[sel] = lower
+        return out
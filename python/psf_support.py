@@ -0,0 +1,155 @@
+from collections import namedtuple
+
+import numpy as np
+
+# PSF支撑范围：按能量（核值之和）确定保留给定比例所需的横向与轴向范围，裁剪并估计引入的误差。
+# 容许丢弃的能量 (1 - fraction) 平均分给各轴（横向两轴按每个z层分别计算，轴向按总能量），
+# 三轴各自满足时总保留比例不低于 fraction（并集界）。
+# 裁剪后的尺寸与原尺寸奇偶相同：'same' 卷积的核中心 (k-1)//2 与生成器的物理中心 k//2 均保持对齐，
+# 未被裁掉的核值对结果的贡献不变。
+DEFAULT_FRACTION = 1 - 1e-6
+
+# fraction: 要求的能量比例；generated_shape/shape: 裁剪前后形状；
+# retained: 实际保留的能量比例；energy_error = 1 - retained；
+# max_error: 被丢弃核值的绝对值之和，即物体取值在 [0, 1] 时结果每个像素的误差上限；
+# contained: 横向范围是否落在生成的核以内（为 False 时核本身可能过小，截断了能量）；
+# axial_contained: 按两端层能量的衰减外推，生成的z范围之外的能量是否在容许范围内，
+# axial_tail 为外推得到的范围外能量与总能量之比（两端不衰减、无从估计时为 None）；
+# extendable: 截断的方向能否通过加大尺寸扩展（由 auto_size_psf 填写，读取已保存的PSF时为 None）
+SupportReport = namedtuple('SupportReport', 'fraction generated_shape shape retained energy_error max_error contained '
+                           'axial_contained axial_tail extendable', defaults=(True, 0.0, None))
+
+
+def _band(marginal, budget):
+    # """与原长度奇偶相同的最短中心对齐区间 [lo, hi)，使各列（z层）区间外能量不超过 budget；
+    # 返回 (lo, hi, 是否短于原长度)"""
+    n = marginal.shape[0]
+    prefix = np.concatenate([np.zeros((1,) + marginal.shape[1:]), np.cumsum(marginal, axis=0)])
+    sizes = np.arange(2 - n % 2, n + 1, 2)
+    lo = (n - 1) // 2 - (sizes - 1) // 2
+    hi = lo + sizes
+    outside = prefix[-1] - (prefix[hi] - prefix[lo])
+    ok = np.all(outside.reshape(len(sizes), -1) <= np.reshape(budget, (1, -1)), axis=1)
+    i = int(np.argmax(ok)) if ok.any() else len(sizes) - 1
+    return int(lo[i]), int(hi[i]), bool(ok[i]) and sizes[i] < n
+
+
+def _marginals(psf):
+    # """逐z层累计行、列方向的能量分布 (行, 层)、(列, 层)（不整体复制PSF，适用于惰性与磁盘映射的核）"""
+    depth = psf.shape[2] if psf.ndim == 3 else 1
+    rows = np.empty((psf.shape[0], depth))
+    cols = np.empty((psf.shape[1], depth))
+    for z in range(depth):
+        plane = np.abs(psf[:, :, z] if psf.ndim == 3 else np.asarray(psf))
+        rows[:, z] = plane.sum(axis=1, dtype=np.float64)
+        cols[:, z] = plane.sum(axis=0, dtype=np.float64)
+    return rows, cols
+
+
+def axial_tail(plane_totals):
+    """按两端层能量向外的衰减比（几何级数）外推生成的z范围之外的能量，返回与总能量之比
+
+    各层能量向外单调衰减得比几何级数快（如高斯）时外推值偏大，即偏保守；
+    末层不比相邻层小（如贝塞尔光束沿z不衰减）时返回 None；不足两层时无从外推，返回 0。
+    """
+    plane_totals = np.asarray(plane_totals, dtype=np.float64)
+    total = plane_totals.sum()
+    if len(plane_totals) < 2 or total <= 0:
+        return 0.0
+    tail = 0.0
+    for end, inner in ((plane_totals[0], plane_totals[1]), (plane_totals[-1], plane_totals[-2])):
+        if end == 0:
+            continue
+        if end >= inner:
+            return None
+        ratio = end / inner
+        tail += end * ratio / (1 - ratio)
+    return float(tail / total)
+
+
+def energy_extent(psf, fraction=DEFAULT_FRACTION, axial=True):
+    """保留 fraction 能量所需的范围，返回 (各轴切片元组, 横向是否在核以内, 总能量, 轴向范围外能量比例)
+
+    横向对每个z层分别要求（二维物体只使用单个z层）；axial 为 False 时保留全部z层，也不估计轴向范围外的能量（为 0）。
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("能量比例必须在 (0, 1] 之间")
+    rows, cols = _marginals(psf)
+    share = (1 - fraction) / (3 if axial and rows.shape[1] > 1 else 2)
+    plane_totals = rows.sum(axis=0)
+    bounds, contained = [], True
+    for marginal in (rows, cols):
+        lo, hi, smaller = _band(marginal, share * plane_totals)
+        # 范围达到核边界且边界上仍有能量：生成的核可能不足以包含所需范围
+        contained &= smaller or not marginal[[0, -1]].any()
+        bounds.append(slice(lo, hi))
+    tail = 0.0
+    if psf.ndim == 3:
+        if axial:
+            lo, hi, _ = _band(plane_totals, share * plane_totals.sum())
+            bounds.append(slice(lo, hi))
+            tail = axial_tail(plane_totals)
+        else:
+            bounds.append(slice(None))
+    return tuple(bounds), bool(contained), float(plane_totals.sum()), tail
+
+
+def border_energy(psf, core_shape=None):
+    """核最外一圈行列上的能量与中心 core_shape 区域能量之比（core_shape 为 None 时相对总能量）
+
+    以首次生成的核尺寸作为中心区域，加倍 size 重新生成后该比值应迅速减小；
+    比值不再明显减小（如贝塞尔光束各环能量相近）说明能量不随范围收敛。
+    core_shape 含z长度且核为三维时，z两端的整层也计入边缘（加倍 size_z 时同样应减小）。
+    """
+    rows, cols = psf.shape[:2]
+    depth = psf.shape[2] if psf.ndim == 3 else 1
+    core_shape = tuple(core_shape or psf.shape[:2])
+    core_rows, core_cols = core_shape[:2]
+    core_depth = core_shape[2] if len(core_shape) == 3 and psf.ndim == 3 else depth
+    r0, c0, z0 = (rows - core_rows) // 2, (cols - core_cols) // 2, (depth - core_depth) // 2
+    ends = (0, depth - 1) if len(core_shape) == 3 and psf.ndim == 3 else ()
+    edge = core = 0.0
+    for z in range(depth):
+        plane = np.abs(psf[:, :, z] if psf.ndim == 3 else np.asarray(psf))
+        if z in ends:
+            edge += plane.sum(dtype=np.float64)
+        else:
+            edge += plane[[0, -1]].sum(dtype=np.float64) + plane[1:-1, [0, -1]].sum(dtype=np.float64)
+        if z0 <= z < z0 + core_depth:
+            core += plane[r0:r0 + core_rows, c0:c0 + core_cols].sum(dtype=np.float64)
+    return float(edge / core) if core > 0 else 0.0
+
+
+def truncate_psf(psf, fraction=DEFAULT_FRACTION, axial=True):
+    """按能量比例裁剪PSF，返回 (裁剪后的核, SupportReport)"""
+    bounds, contained, total, tail = energy_extent(psf, fraction, axial)
+    cropped = np.ascontiguousarray(psf[bounds])
+    if cropped.shape == tuple(psf.shape):
+        kept = total
+    else:
+        planes = [cropped[:, :, z] for z in range(cropped.shape[2])] if cropped.ndim == 3 else [cropped]
+        kept = sum(float(np.abs(plane).sum(dtype=np.float64)) for plane in planes)
+    retained = kept / total if total > 0 else 1.0
+    # 轴向容许丢弃的能量与 energy_extent 中分给z轴的份额相同
+    axial_contained = tail is not None and tail <= (1 - fraction) / 3
+    report = SupportReport(fraction, tuple(psf.shape), cropped.shape, retained, 1 - retained, total - kept,
+                           contained, axial_contained, tail)
+    return cropped, report
+
+
+def describe_report(report):
+    """简要说明，如“支撑 37×37×20（原 128×128×64），能量误差 3.1e-07，结果误差上限 2.4e-04”"""
+    shape = '×'.join(str(n) for n in report.shape)
+    generated = '×'.join(str(n) for n in report.generated_shape)
+    text = f"支撑 {shape}（原 {generated}），能量误差 {report.energy_error:.1e}，结果误差上限 {report.max_error:.1e}"
+    if not report.contained:
+        text += "；横向核尺寸不足，边界处仍有能量"
+    if not report.axial_contained:
+        text += "；轴向层数不足，" + ("两端层能量不随z衰减" if report.axial_tail is None else
+                                       f"生成的z范围外估计还有 {report.axial_tail:.1e} 的能量")
+    if not (report.contained and report.axial_contained):
+        if report.extendable is False:
+            text += "（该模型的生成范围不随尺寸加大，只在生成的核内裁剪，误差未计入范围外的能量）"
+        elif report.extendable:
+            text += "（已加大到尺寸上限或边缘能量不再随尺寸减小）"
+    return text
@@ -0,0 +1,250 @@
+import math
+from functools import lru_cache
+
+import numpy as np
+from matplotlib import font_manager
+from matplotlib.transforms import Bbox
+from mpl_toolkits.axes_grid1.inset_locator import inset_axes
+
+from profiling import traced
+
+# 常见中文字体（Windows / macOS / Linux），按顺序回退
+CJK_FONT_FAMILIES = ['Microsoft YaHei', 'SimHei', 'PingFang SC', 'Hiragino Sans GB', 'Heiti SC',
+                     'Noto Sans CJK SC', 'Source Han Sans SC', 'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei',
+                     'Droid Sans Fallback', 'Arial Unicode MS']
+
+
+@lru_cache(maxsize=None)
+def cjk_font():
+    """返回可显示中文的字体属性：只查找一次，缺少中文字体时回退到默认无衬线字体"""
+    installed = {f.name for f in font_manager.fontManager.ttflist}
+    families = [name for name in CJK_FONT_FAMILIES if name in installed]
+    return font_manager.FontProperties(family=families + ['sans-serif'])
+
+
+class ResultView:
+    """结果显示层
+
+    坐标轴、图像与色标只创建一次，之后用 set_data / set_clim 更新；图像与标题为动画对象，
+    数据更新时恢复缓存的背景并只重绘、刷新（blit）坐标轴区域（标题变化时加上方标题区域）。
+    尺寸、色图或显示范围变化时才整体重绘。大于屏幕像素的结果先按块平均降采样再绘制。
+    """
+
+    def __init__(self, figure, canvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.ax = None
+        self.image = None
+        self.colorbar = None
+        self.title = None
+        self.crosshair = None  # (水平线, 竖直线)
+        self._crosshair_pos = (None, None)
+        self._extent = None
+        self._background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _build(self, cmap, clim):
+        self.figure.clear()
+        self.ax = self.figure.add_subplot(111)
+        self.image = self.ax.imshow(np.zeros((1, 1), dtype=np.float32), cmap=cmap, vmin=clim[0], vmax=clim[1],
+                                    interpolation='nearest', animated=True)
+        ax_cb = inset_axes(self.ax, width="3%", height="100%", loc='lower left', bbox_to_anchor=(1.02, 0., 1, 1),
+                           bbox_transform=self.ax.transAxes, borderpad=0)
+        self.colorbar = self.figure.colorbar(self.image, ax=self.ax, cax=ax_cb, label='Intensity')
+        self.title = self.ax.set_title("", fontproperties=cjk_font())
+        self.title.set_animated(True)
+        self.ax.set_xlabel("X position (μm)")
+        self.ax.set_ylabel("Y position (μm)")
+        self.crosshair = (self.ax.axhline(0, color='w', lw=0.8, alpha=0.8, animated=True, visible=False),
+                          self.ax.axvline(0, color='w', lw=0.8, alpha=0.8, animated=True, visible=False))
+        self._place_crosshair()
+        self._extent = None
+
+    def _animated(self):
+        return [self.image, self.title, *self.crosshair]
+
+    def _display_size(self):
+        # """坐标轴在屏幕上的像素尺寸 (高, 宽)"""
+        bbox = self.ax.get_window_extent()
+        return max(int(bbox.height), 1), max(int(bbox.width), 1)
+
+    def _downsample(self, data):
+        # """按屏幕分辨率块平均降采样，返回 (显示数据, 图像范围)；范围保持原像素坐标，
+        # 末尾不足一块的行列按实际像素数求平均（范围按整块计，略超出原图边缘）"""
+        rows, cols = data.shape[:2]
+        height, width = self._display_size()
+        factor = max(1, math.ceil(max(rows / height, cols / width)))
+        if factor > 1:
+            row_starts, col_starts = np.arange(0, rows, factor), np.arange(0, cols, factor)
+            # 先沿行、再沿列求块和（每步都在连续内存上归约）
+            block = np.add.reduceat(np.asarray(data, dtype=np.float32), row_starts, axis=0)
+            block = np.add.reduceat(block, col_starts, axis=1)
+            row_counts = np.diff(np.append(row_starts, rows)).astype(np.float32)
+            col_counts = np.diff(np.append(col_starts, cols)).astype(np.float32)
+            data = block / np.outer(row_counts, col_counts)
+            rows, cols = len(row_starts) * factor, len(col_starts) * factor
+        return data, (-0.5, cols - 0.5, rows - 0.5, -0.5)
+
+    @traced('render/result')
+    def set_data(self, data, title=None, cmap='viridis', clim=(0, 1)):
+        """显示二维结果；clim 为 None 时按数据范围"""
+        if self.image is None:
+            self._build(cmap, clim or (0, 1))
+        if clim is None:
+            clim = (float(np.min(data)), float(np.max(data)))
+        display, extent = self._downsample(np.asarray(data))
+        # 坐标轴只显示原图范围
+        limits = (-0.5, data.shape[1] - 0.5, data.shape[0] - 0.5, -0.5)
+
+        full_redraw = self._background is None
+        if (extent, limits) != self._extent:
+            self.image.set_extent(extent)
+            self.ax.set_xlim(limits[0], limits[1])
+            self.ax.set_ylim(limits[2], limits[3])
+            self._extent = (extent, limits)
+            full_redraw = True
+        if cmap != self.image.get_cmap().name:
+            self.image.set_cmap(cmap)
+            full_redraw = True
+        if tuple(clim) != self.image.get_clim():
+            self.image.set_clim(*clim)
+            full_redraw = True
+        self.image.set_data(display)
+        title_changed = title is not None and title != self.title.get_text()
+        if title_changed:
+            self.title.set_text(title)
+
+        if full_redraw:
+            self.canvas.draw_idle()
+        else:
+            self._blit(title_changed)
+
+    def set_clim(self, vmin, vmax):
+        """调整显示范围（色标随之更新，需要整体重绘）"""
+        if self.image is not None:
+            self.image.set_clim(vmin, vmax)
+            self.canvas.draw_idle()
+
+    def set_crosshair(self, row, col):
+        """在结果图上显示十字线（原像素坐标）；row 为 None 时隐藏"""
+        self._crosshair_pos = (row, col)
+        if self.image is None:
+            return
+        self._place_crosshair()
+        if self._background is None:
+            self.canvas.draw_idle()
+        else:
+            self._blit(False)
+
+    def _place_crosshair(self):
+        row, col = self._crosshair_pos
+        hline, vline = self.crosshair
+        hline.set_visible(row is not None)
+        vline.set_visible(row is not None)
+        if row is not None:
+            hline.set_ydata([row, row])
+            vline.set_xdata([col, col])
+
+    @traced('render/blit')
+    def _blit(self, title_changed):
+        # """恢复背景，只重绘动画对象并刷新变化区域"""
+        self.canvas.restore_region(self._background)
+        for artist in self._animated():
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.ax.bbox)
+        if title_changed:
+            fig_box = self.figure.bbox
+            self.canvas.blit(Bbox.from_extents(fig_box.x0, self.ax.bbox.y1, fig_box.x1, fig_box.y1))
+
+    def _on_draw(self, event):
+        # 整体重绘（含窗口缩放）后缓存不含动画对象的背景，再补画动画对象
+        if self.image is None:
+            return
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        for artist in self._animated():
+            self.ax.draw_artist(artist)
+
+
+class SectionView:
+    """正交切面显示（x-z、y-z）：上行为PSF、下行为结果
+
+    与 ResultView 相同，图像与z层指示线为动画对象，只在尺寸或显示范围变化时整体重绘，
+    切换z层或十字线位置时只重绘动画对象并刷新画布。
+    """
+
+    PANELS = (('psf', 0), ('psf', 1), ('result', 0), ('result', 1))
+    TITLES = {('psf', 0): "PSF x-z", ('psf', 1): "PSF y-z", ('result', 0): "结果 x-z", ('result', 1): "结果 y-z"}
+
+    def __init__(self, figure, canvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.axes = {}
+        self.images = {}
+        self.z_lines = {}
+        self._background = None
+        font = cjk_font()
+        for i, key in enumerate(self.PANELS):
+            ax = figure.add_subplot(2, 2, i + 1)
+            ax.set_title(self.TITLES[key], fontproperties=font, fontsize=9)
+            ax.tick_params(labelsize=7)
+            ax.set_ylabel("z", fontsize=8)
+            self.axes[key] = ax
+            self.images[key] = ax.imshow(np.zeros((1, 1), dtype=np.float32), cmap='viridis', vmin=0, vmax=1,
+                                         aspect='auto', origin='lower', interpolation='nearest', animated=True)
+            self.z_lines[key] = ax.axhline(0, color='w', lw=0.8, alpha=0.8, animated=True)
+        figure.tight_layout()
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _set(self, kind, sections, vmax):
+        # """更新一行两个切面（形状 (z, 长度)）；返回是否需要整体重绘"""
+        full_redraw = self._background is None
+        for axis, section in enumerate(sections):
+            key = (kind, axis)
+            image = self.images[key]
+            if section is None:
+                image.set_visible(False)
+                continue
+            image.set_visible(True)
+            extent = (-0.5, section.shape[1] - 0.5, -0.5, section.shape[0] - 0.5)
+            if tuple(image.get_extent()) != extent:
+                image.set_extent(extent)
+                self.axes[key].set_xlim(extent[0], extent[1])
+                self.axes[key].set_ylim(extent[2], extent[3])
+                full_redraw = True
+            if image.get_clim() != (0, vmax):
+                image.set_clim(0, vmax)
+                full_redraw = True
+            image.set_data(section)
+        return full_redraw
+
+    def set_psf(self, xz, yz):
+        """PSF切面（跨步视图即可，不复制）"""
+        vmax = float(max(xz.max(), yz.max())) or 1.0
+        self._refresh(self._set('psf', (xz, yz), vmax))
+
+    @traced('render/sections')
+    def set_result(self, xz, yz):
+        """结果切面；未计算完成的一侧传 None"""
+        self._refresh(self._set('result', (xz, yz), 1.0))
+
+    def set_z(self, z):
+        for line in self.z_lines.values():
+            line.set_ydata([z, z])
+        self._refresh(False)
+
+    def _refresh(self, full_redraw):
+        if full_redraw or self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.figure.bbox)
+
+    def _draw_animated(self):
+        for key, ax in self.axes.items():
+            ax.draw_artist(self.images[key])
+            ax.draw_artist(self.z_lines[key])
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
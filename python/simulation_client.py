@@ -0,0 +1,87 @@
+"""本机仿真服务（simulation_service）的客户端
+
+    client = SimulationClient()              # 默认 127.0.0.1:8765，或环境变量 PSF_SIM_SERVICE=主机:端口
+    result = client.simulate(job)            # 结果经共享内存取回为 NumPy 数组
+    client.simulate_to_file(job, 'out.psv')  # 由服务写入其输出目录（serve --output-dir），返回摘要
+    psf = client.psf({'model': 'gaussian', 'size': 128})
+"""
+import http.client
+import json
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+ENV_VAR = 'PSF_SIM_SERVICE'
+DEFAULT_ADDRESS = '127.0.0.1:8765'  # 与 simulation_service 的默认监听地址一致
+
+
+def _read_shared(name, shape, dtype, owner_pid):
+    # """复制共享内存中的数组；服务端负责删除，因此（服务在其他进程时）本进程不登记该段共享内存"""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(tuple(shape), dtype=np.dtype(dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        if os.name == 'posix' and owner_pid != os.getpid():
+            resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+def _absolute_paths(job):
+    # """任务中的文件路径按客户端工作目录解析（服务的工作目录可能不同）"""
+    job = dict(job)
+    for section in ('object', 'psf'):
+        if 'path' in job.get(section, {}):
+            job[section] = dict(job[section], path=os.path.abspath(job[section]['path']))
+    return job
+
+
+class SimulationClient:
+    """仿真服务客户端；参数错误（如未知的PSF模型）抛出 ValueError，服务内部错误抛出 RuntimeError"""
+
+    def __init__(self, address=None, timeout=None):
+        address = address or os.environ.get(ENV_VAR) or DEFAULT_ADDRESS
+        host, _, port = address.rpartition(':')
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            reply = json.loads(response.read() or b'{}')
+        finally:
+            connection.close()
+        if response.status == 400:
+            raise ValueError(reply.get('error', '请求无效'))
+        if response.status != 200:
+            raise RuntimeError(reply.get('error', f"服务返回 {response.status}"))
+        return reply
+
+    def _fetch(self, reply):
+        # """读取共享内存中的结果并通知服务释放"""
+        try:
+            return _read_shared(reply['shm'], reply['shape'], reply['dtype'], reply['pid'])
+        finally:
+            self._request('POST', '/release', {'id': reply['id']})
+
+    def simulate(self, job):
+        """执行仿真任务，返回结果数组（与 simulation_engine.simulate 的结果形状相同）"""
+        return self._fetch(self._request('POST', '/simulate', {'job': _absolute_paths(job)}))
+
+    def simulate_to_file(self, job, name):
+        """执行仿真任务并由服务写入其输出目录中的 name（.psv / .npy / .tif），返回 {path, shape, planes, psf}
+
+        name 按服务的输出目录解析，不能指向目录之外；服务未配置输出目录时抛出 ValueError。
+        """
+        return self._request('POST', '/simulate', {'job': _absolute_paths(job), 'output': name})
+
+    def psf(self, spec):
+        """取得服务缓存中的PSF（未缓存时由服务生成或读取）"""
+        return self._fetch(self._request('POST', '/psf', {'psf': _absolute_paths({'psf': spec})['psf']}))
+
+    def status(self):
+        return self._request('GET', '/status')
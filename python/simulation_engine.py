@@ -0,0 +1,419 @@
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from convolution_handler import ConvolutionHandler
+from profiling import span, describe
+from psf_generator import PSFGenerator
+from psf_support import DEFAULT_FRACTION, border_energy, truncate_psf
+from vector_scene import VectorScene
+from volume_file import EXTENSION as VOLUME_EXTENSION, open_stack, save_volume
+
+# PSF模型：键 -> (PSFGenerator方法, 界面名称, 除 size 外的参数)
+PSF_MODELS = {
+    'bessel': ('generate_bessel', "Bessel 衍射",
+               ('size_z', 'size_dxdy', 'size_dz', 'amplitude', 'wavelength', 'n_bessel', 'phase_shift')),
+    'gaussian': ('generate_gaussian', "Gaussian 衍射",
+                 ('size_z', 'size_dxdy', 'size_dz', 'amplitude', 'wavelength')),
+    'airy': ('generate_airy', "艾里斑",
+             ('size_z', 'size_dxdy', 'size_dz', 'amplitude', 'wavelength', 'D')),
+    'gaussian2d': ('generate_gaussian_old', "高斯", ('sigma',)),
+    'motion_blur': ('generate_motion_blur', "运动模糊", ('length', 'angle')),
+}
+# 支持进度回调与取消的生成方法
+_PROGRESS_METHODS = ('generate_bessel', 'generate_gaussian')
+_INT_PARAMS = ('size', 'size_z', 'length')
+# 加大 size 即扩大横向范围且能量随范围收敛的模型；艾里斑的物理范围固定（size 只改变采样密度），
+# 贝塞尔光束各环能量相近、不随范围收敛，二者只裁剪并标注核尺寸不足
+_EXTENDABLE_MODELS = ('gaussian', 'gaussian2d', 'motion_blur')
+_AXIAL_EXTENDABLE_MODELS = ('gaussian',)
+MAX_AUTO_SIZE = 1024
+
+
+def model_key(model):
+    """接受模型键或界面名称，返回模型键"""
+    if model in PSF_MODELS:
+        return model
+    for key, (_, label, _) in PSF_MODELS.items():
+        if model == label:
+            return key
+    raise ValueError(f"未知的PSF模型: {model}（可选: {', '.join(PSF_MODELS)}）")
+
+
+def model_params(model):
+    """模型接受的参数名（size 为横向尺寸）"""
+    return ('size',) + PSF_MODELS[model_key(model)][2]
+
+
+def psf_call(model, params):
+    """把任务/界面参数映射为 (PSFGenerator方法名, 关键字参数)；size_xy 与 size 等价"""
+    method = PSF_MODELS[model_key(model)][0]
+    params = dict(params)
+    params.pop('model', None)
+    if 'size_xy' in params:
+        params['size'] = params.pop('size_xy')
+    unknown = set(params) - set(model_params(model))
+    if unknown:
+        raise ValueError(f"PSF模型 {model} 不支持参数: {', '.join(sorted(unknown))}")
+    kwargs = {name: int(float(value)) if name in _INT_PARAMS else float(value) for name, value in params.items()}
+    return method, kwargs
+
+
+def generate_psf(model, params, progress_callback=None, cancel_token=None, backend=None, allocate=None):
+    """生成PSF；backend 为进程池后端时在工作进程中生成
+
+    allocate(shape) 为按z分块生成的模型提供输出数组（如磁盘内存映射，见 memory_planner），返回 None 时照常分配。
+    """
+    method, kwargs = psf_call(model, params)
+    with span('generate/' + method, **kwargs) as s:
+        if backend is not None:
+            psf = backend.generate(method, progress_callback=progress_callback, cancel_token=cancel_token, **kwargs)
+        else:
+            if method in _PROGRESS_METHODS:
+                kwargs.update(progress_callback=progress_callback, cancel_token=cancel_token)
+                if allocate is not None:
+                    full = psf_metadata(model, params)['params']
+                    kwargs['out'] = allocate((full['size'], full['size'], full['size_z']))
+            psf = getattr(PSFGenerator, method)(**kwargs)
+        s.set(**describe(psf))
+    return psf
+
+
+def psf_metadata(model, params):
+    """PSF文件的元数据：模型、生成方法、完整参数（含默认值）与体素尺寸 (dx, dy, dz)"""
+    method, kwargs = psf_call(model, params)
+    signature = inspect.signature(getattr(PSFGenerator, method))
+    full = {name: p.default for name, p in signature.parameters.items()
+            if p.default is not inspect.Parameter.empty and name not in ('progress_callback', 'cancel_token', 'out')}
+    full.update(kwargs)
+    metadata = {'kind': 'psf', 'model': model_key(model), 'generator': method, 'params': full}
+    if 'size_dxdy' in full:
+        metadata['voxel_size'] = [full['size_dxdy'], full['size_dxdy'], full['size_dz']]
+    return metadata
+
+
+def auto_size_psf(model, params, fraction=DEFAULT_FRACTION, axial=True, max_size=MAX_AUTO_SIZE, max_size_z=None,
+                  progress_callback=None, cancel_token=None, backend=None, allocate=None):
+    """按能量比例确定PSF尺寸：横向范围超出生成的核时加倍 size（至多 max_size），
+    轴向外推的范围外能量超出容许值时加倍 size_z（至多 max_size_z，默认同 max_size），重新生成后再裁剪到所需范围
+
+    返回 (PSF, SupportReport, 实际生成参数)；报告中的 contained / axial_contained 为 False 表示仍未包含所需能量，
+    extendable 说明该方向能否加大尺寸（艾里斑、贝塞尔光束只裁剪不加大，高斯衍射两个方向都可加大）。
+    核边缘的能量（相对首次生成的核范围内的能量，加大 size_z 时含两端层）连续两次加倍都未减小时停止加倍
+    （核明显小于PSF宽度时边缘能量会先增大，只看一次会过早停止），返回前一次的结果。
+    """
+    params = dict(params)
+    if 'size_xy' in params:
+        params['size'] = params.pop('size_xy')
+    key = model_key(model)
+    defaults = psf_metadata(model, params)['params']
+    max_size_z = max_size if max_size_z is None else max_size_z
+    core = previous = None  # previous: (核, 报告, 参数)
+    borders = []
+    while True:
+        psf = generate_psf(model, params, progress_callback, cancel_token, backend, allocate)
+        with span('generate/support', fraction=fraction):
+            cropped, report = truncate_psf(psf, fraction, axial)
+        report = report._replace(extendable=(report.contained or key in _EXTENDABLE_MODELS)
+                                 and (report.axial_contained or key in _AXIAL_EXTENDABLE_MODELS))
+        wider = not report.contained and key in _EXTENDABLE_MODELS
+        deeper = not report.axial_contained and key in _AXIAL_EXTENDABLE_MODELS
+        if not (wider or deeper):
+            return cropped, report, params
+        size = int(float(params.get('size', defaults['size'])))
+        depth = int(float(params.get('size_z', defaults.get('size_z', 1))))
+        core = core or psf.shape[:3 if key in _AXIAL_EXTENDABLE_MODELS else 2]
+        borders.append(border_energy(psf, core))
+        if len(borders) >= 3 and borders[-1] >= borders[-2] >= borders[-3]:
+            return previous
+        wider, deeper = wider and size < max_size, deeper and depth < max_size_z
+        if not (wider or deeper):
+            return cropped, report, params
+        previous = (cropped, report, dict(params))
+        del psf
+        if wider:
+            params['size'] = min(2 * size, max_size)
+        if deeper:
+            params['size_z'] = min(2 * depth, max_size_z)
+
+
+def support_options(spec):
+    """任务中 psf.support 的取值：true、能量比例，或 {fraction, axial, max_size, max_size_z}"""
+    if spec is True:
+        spec = {}
+    elif not isinstance(spec, dict):
+        spec = {'fraction': spec}
+    unknown = set(spec) - {'fraction', 'axial', 'max_size', 'max_size_z'}
+    if unknown:
+        raise ValueError(f"psf.support 不支持参数: {', '.join(sorted(unknown))}")
+    max_size = int(spec.get('max_size', MAX_AUTO_SIZE))
+    return {'fraction': float(spec.get('fraction', DEFAULT_FRACTION)), 'axial': bool(spec.get('axial', True)),
+            'max_size': max_size, 'max_size_z': int(spec.get('max_size_z', max_size))}
+
+
+def convolve_plane(image, psf, scale_factor=1.0, z_index=None, backend=None, progress_callback=None,
+                   cancel_token=None, tile_rows=None):
+    """计算一个输出层；界面与无界面运行共用（tile_rows 为内存规划给出的卷积行块高度）"""
+    convolve = backend.convolve if backend is not None else ConvolutionHandler.convolve
+    return convolve(image, psf, scale_factor, z_index=z_index, progress_callback=progress_callback,
+                    cancel_token=cancel_token, tile_rows=tile_rows)
+
+
+# ---------- 任务描述 ----------
+def load_job(path):
+    """读取 JSON 或 TOML 任务文件"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        return tomllib.loads(data.decode('utf-8'))
+    return json.loads(data.decode('utf-8'))
+
+
+def load_object(spec):
+    """按任务中的 object 描述载入物体：图像文件（path）或矢量场景（scene）"""
+    if 'path' in spec:
+        stack = open_stack(spec['path'])
+        image = stack if stack.ndim == 3 else stack.page(0)
+    elif 'scene' in spec:
+        image = _render_scene(spec['scene'])
+    else:
+        raise ValueError("object 需要 path 或 scene")
+    depth = int(spec.get('z_depth', 1))
+    if image.ndim == 2 and depth > 1:
+        # 与界面三维模式一致：二维物体沿z广播
+        image = np.broadcast_to(image[:, :, None], image.shape + (depth,))
+    return image
+
+
+def object_shape(spec):
+    """按 object 描述给出物体形状，不读取像素、不栅格化场景（供内存规划）
+
+    图像文件只读取文件头；z_depth 大于1时二维物体沿z广播，与 load_object 一致。
+    """
+    if 'path' in spec:
+        shape = open_stack(spec['path']).shape
+    elif 'scene' in spec:
+        scene, pixel_size = _empty_scene(spec['scene'])
+        shape = scene.raster_shape(pixel_size) if pixel_size is not None else \
+            (int(round(scene.height)), int(round(scene.width)))
+    else:
+        raise ValueError("object 需要 path 或 scene")
+    depth = int(spec.get('z_depth', 1))
+    if len(shape) == 2 and depth > 1:
+        shape = tuple(shape) + (depth,)
+    return tuple(shape)
+
+
+def _empty_scene(spec):
+    # """场景画布（尚无图元）与像素尺寸：size 为 [宽, 高] 或边长"""
+    size = spec.get('size', 512)
+    width, height = (size, size) if np.isscalar(size) else size
+    pixel_size = spec.get('pixel_size')
+    return VectorScene(width, height, unit_size=float(spec.get('unit_size', 1.0))), \
+        float(pixel_size) if pixel_size is not None else None
+
+
+def _render_scene(spec):
+    # """矢量场景：size 为 [宽, 高] 或边长，primitives 为图元列表"""
+    scene, pixel_size = _empty_scene(spec)
+    for item in spec.get('primitives', []):
+        kind, line_width = item['type'], float(item.get('width', 2))
+        if kind == 'segment':
+            scene.add_segment(item['p0'], item['p1'], line_width)
+        elif kind == 'polyline':
+            scene.add_polyline(item['points'], line_width, closed=bool(item.get('closed', False)))
+        elif kind == 'rect':
+            scene.add_rect(item['p0'], item['p1'], line_width)
+        elif kind == 'ellipse':
+            scene.add_ellipse(item['p0'], item['p1'], line_width)
+        elif kind == 'fill':
+            scene.add_fill(item['seed'])
+        else:
+            raise ValueError(f"未知的图元类型: {kind}")
+    return scene.rasterize(pixel_size=pixel_size, supersample=int(spec.get('supersample', 4)))
+
+
+def resolve_planes(spec, psf):
+    """z_planes：'all'、'center'、整数、列表或 {start, stop, step}；二维PSF只有一层（None）"""
+    if psf.ndim == 2:
+        return [None]
+    n = psf.shape[2]
+    if spec is None or spec == 'all':
+        planes = list(range(n))
+    elif spec == 'center':
+        planes = [n // 2]
+    elif isinstance(spec, dict):
+        planes = list(range(int(spec.get('start', 0)), int(spec.get('stop', n)), int(spec.get('step', 1))))
+    elif isinstance(spec, (list, tuple)):
+        planes = [int(z) for z in spec]
+    else:
+        planes = [int(spec)]
+    bad = [z for z in planes if not 0 <= z < n]
+    if bad:
+        raise ValueError(f"z_planes 超出范围 [0, {n}): {bad}")
+    return planes
+
+
+def save_array(array, path, metadata=None):
+    """按扩展名保存：.psv（原生格式，带元数据）、.npy，或 .tif/.tiff（float32，三维按z逐页）"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.lower().endswith(VOLUME_EXTENSION):
+        save_volume(path, array, metadata=metadata)
+        return
+    if path.lower().endswith('.npy'):
+        np.save(path, array)
+        return
+    if not path.lower().endswith(('.tif', '.tiff')):
+        raise ValueError(f"不支持的输出格式: {path}")
+    from PIL import Image
+    array = np.asarray(array, dtype=np.float32)
+    pages = [array] if array.ndim == 2 else [array[:, :, z] for z in range(array.shape[2])]
+    images = [Image.fromarray(np.ascontiguousarray(page), mode='F') for page in pages]
+    images[0].save(path, save_all=True, append_images=images[1:])
+
+
+# ---------- 运行 ----------
+def job_psf(job, progress_callback=None, cancel_token=None, backend=None, allocate=None, max_size=None,
+            max_size_z=None):
+    """按任务中的 psf 描述生成PSF；给出 path 时改为读取已保存的PSF；给出 support 时按能量确定尺寸"""
+    return load_psf(job['psf'], progress_callback, cancel_token, backend, allocate, max_size, max_size_z)[0]
+
+
+def load_psf(spec, progress_callback=None, cancel_token=None, backend=None, allocate=None, max_size=None,
+             max_size_z=None):
+    """按 psf 描述生成或读取PSF，返回 (PSF, 元数据)；按能量裁剪时元数据含 support 报告
+
+    max_size / max_size_z 进一步限定按能量加倍的尺寸上限（内存规划给出的 support_size / support_size_z）。
+    """
+    psf_spec = dict(spec)
+    support = psf_spec.pop('support', None)
+    if 'path' in psf_spec:
+        stack = open_stack(psf_spec['path'])
+        psf = stack if stack.ndim == 3 else stack.page(0)
+        meta = dict(getattr(stack, 'metadata', None) or {'kind': 'psf', 'path': psf_spec['path']})
+        if support:
+            options = support_options(support)
+            options.pop('max_size')
+            options.pop('max_size_z')
+            psf, report = truncate_psf(psf, **options)
+            meta['support'] = report._asdict()
+        return psf, meta
+    model = psf_spec.pop('model')
+    if not support:
+        psf = generate_psf(model, psf_spec, progress_callback, cancel_token, backend, allocate)
+        return psf, psf_metadata(model, psf_spec)
+    options = support_options(support)
+    if max_size is not None:
+        options['max_size'] = min(options['max_size'], int(max_size))
+    if max_size_z is not None:
+        options['max_size_z'] = min(options['max_size_z'], int(max_size_z))
+    psf, report, params = auto_size_psf(model, psf_spec, progress_callback=progress_callback, cancel_token=cancel_token,
+                                        backend=backend, allocate=allocate, **options)
+    meta = psf_metadata(model, params)
+    meta['support'] = report._asdict()
+    return psf, meta
+
+
+def simulate(job, psf=None, progress_callback=None, cancel_token=None, backend=None, workers=1, plan=None):
+    """生成PSF（psf 为 None 时）并卷积所选z层，返回 (PSF, z层列表, 结果)；不写文件
+
+    plan 为 memory_planner.MemoryPlan 时按其选择PSF与结果的存放位置、物体精度、卷积行块与并行层数。
+    """
+    if psf is None:
+        psf = job_psf(job, cancel_token=cancel_token, backend=backend, allocate=plan and plan.allocate_psf,
+                      max_size=plan and plan.support_size, max_size_z=plan and plan.support_size_z)
+    planes = resolve_planes(job.get('z_planes', 'all'), psf)
+    image = load_object(job['object'])
+    scale_factor = float(job.get('scale', 1.0))
+    tile_rows = None
+    if plan is not None:
+        workers, tile_rows = plan.workers, plan.tile_rows
+        if plan.object_dtype and image.dtype != plan.object_dtype:
+            # 沿z广播的物体只转换一层
+            broadcast = image.ndim == 3 and image.strides[2] == 0
+            image = np.broadcast_to(image[:, :, :1].astype(plan.object_dtype), image.shape) if broadcast else \
+                image.astype(plan.object_dtype)
+    if backend is not None:
+        # 图像与PSF只放入共享内存一次，各层任务复用
+        from process_pool import share
+        image, psf_shared = share(image)[1], share(psf)[1]
+    else:
+        psf_shared = psf
+
+    def compute(z_index):
+        return convolve_plane(image, psf_shared, scale_factor, z_index, backend=backend, cancel_token=cancel_token,
+                              tile_rows=tile_rows)
+
+    if plan is not None and plan.result_on_disk and planes != [None]:
+        from memory_planner import disk_array
+        out = disk_array(image.shape[:2] + (len(planes),))
+    else:
+        out = None
+    results = [None] * len(planes)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(compute, z): i for i, z in enumerate(planes)}
+        try:
+            for future in as_completed(futures):
+                if out is not None:
+                    out[:, :, futures[future]] = future.result()
+                else:
+                    results[futures[future]] = np.asarray(future.result())
+                done += 1
+                if progress_callback:
+                    progress_callback(int(100 * done / len(planes)))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    if out is not None:
+        return psf, planes, out
+    result = results[0] if planes == [None] else np.stack(results, axis=2)
+    return psf, planes, result
+
+
+def run_job(job, progress_callback=None, cancel_token=None, backend=None, workers=1, plan=None):
+    """执行任务：生成PSF → 卷积所选z层 → 写出结果，返回摘要字典
+
+    job 字段：psf（model 与生成参数，可选 support 按能量确定尺寸，见 support_options）、
+    object（path / scene / directory，可选 z_depth）、scale（微米/像素）、z_planes、output（path，可选 psf 保存路径）。
+    object 为 directory 时按目录批量处理，output.path 为输出目录。plan 见 simulate。
+    """
+    start = time.perf_counter()
+    psf, meta = load_psf(job['psf'], cancel_token=cancel_token, backend=backend,
+                         allocate=plan and plan.allocate_psf, max_size=plan and plan.support_size,
+                         max_size_z=plan and plan.support_size_z)
+    output = job.get('output', {})
+    if output.get('psf'):
+        save_array(psf, output['psf'], meta)
+
+    object_spec = job['object']
+    if 'directory' in object_spec:
+        from batch_pipeline import BatchPipeline
+        planes = resolve_planes(job.get('z_planes', 'all'), psf)
+        if len(planes) != 1:
+            raise ValueError("目录批量处理只支持单个z层")
+        pipeline = BatchPipeline(psf, z_index=planes[0], workers=plan.workers if plan is not None else workers)
+        report = pipeline.run(BatchPipeline.list_images(object_spec['directory']), output['path'],
+                              progress_callback=lambda done, total, rate: progress_callback and
+                              progress_callback(int(100 * done / max(total, 1))),
+                              cancel_token=cancel_token)
+        return {'psf_shape': psf.shape, 'support': meta.get('support'), 'processed': report.processed,
+                'failed': report.failed, 'output': output['path'], 'elapsed': time.perf_counter() - start}
+
+    _, planes, result = simulate(job, psf, progress_callback, cancel_token, backend, workers, plan)
+    if output.get('path'):
+        save_array(result, output['path'], {'kind': 'result', 'psf': meta, 'planes': planes,
+                                            'scale': float(job.get('scale', 1.0)), 'object': job['object']})
+    return {'psf_shape': psf.shape, 'support': meta.get('support'), 'planes': planes,
+            'result_shape': result.shape, 'output': output.get('path'), 'elapsed': time.perf_counter() - start}
@@ -0,0 +1,374 @@
+"""本机仿真服务：多个脚本/界面实例共用一份PSF与OTF缓存，并把共用PSF的请求合并为批量FFT
+
+    python cli.py serve [--port 8765] [--output-dir results/]
+
+只监听本机地址。协议为 HTTP + JSON（客户端见 simulation_client）：
+    POST /simulate  {"job": 任务, "output": 可选文件名}    结果放入共享内存（或写入输出目录中的文件），返回描述
+    POST /psf       {"psf": psf描述}                      PSF放入共享内存，返回描述
+    POST /release   {"id": 结果编号}                      客户端读取后释放共享内存
+    GET  /status                                          请求、批次与缓存统计
+任务格式同 simulation_engine.run_job（object 与 psf、z_planes），不使用 output 字段。
+服务只把结果写入启动时指定的输出目录（serve --output-dir），未指定时不接受 output，
+以免本机任意进程借服务写入服务用户可写的任意路径。
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import simulation_engine
+from convolution_handler import ConvolutionHandler
+from process_pool import empty_shared
+from profiling import span
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+BATCH_WINDOW = 0.005  # 收集同批请求的等待时间（秒）
+BATCH_BYTES = 256 * 1024 ** 2  # 单次批量FFT的频谱内存上限
+RESULT_TTL = 300  # 未释放的共享内存结果保留时间（秒）
+EXPIRY_INTERVAL = 30  # 空闲时清理过期结果的间隔（秒）
+
+
+class _LRUCache:
+    # """按字节上限淘汰的LRU缓存，记录命中次数"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # 键 -> (值, 字节数)
+        self._lock = threading.Lock()
+
+    def peek(self, key):
+        # """取值但不计入命中统计、不调整淘汰顺序"""
+        with self._lock:
+            item = self._items.get(key)
+            return None if item is None else item[0]
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            if key in self._items:
+                return
+            self._items[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, old) = self._items.popitem(last=False)
+                self.bytes -= old
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+def _psf_key(spec):
+    # """PSF描述的规范化键；读取文件的PSF附带修改时间，文件更新后重新读取"""
+    spec = dict(spec)
+    if 'path' in spec:
+        spec['mtime'] = os.path.getmtime(spec['path'])
+    return json.dumps(spec, sort_keys=True)
+
+
+def _kernel_digest(kernel):
+    # """按内容区分二维核（各层切片与沿z叠加的核都适用）"""
+    kernel = np.ascontiguousarray(kernel)
+    return hashlib.blake2b(kernel.tobytes(), digest_size=16, person=kernel.dtype.str.encode()).hexdigest() + \
+        str(kernel.shape)
+
+
+class _Request:
+    # """一个排队中的仿真请求：(输出层序号, 物体层, 核, 核摘要) 列表与累加结果"""
+    __slots__ = ('items', 'result', 'future')
+
+    def __init__(self, items, shape):
+        self.items = items
+        self.result = np.zeros(shape, dtype=np.float32)
+        self.future = Future()
+
+
+class SimulationService:
+    """仿真服务核心（不含网络部分）：PSF/OTF缓存、请求合批与共享内存结果
+
+    各请求在调用线程中准备（生成或取缓存PSF、读取物体、拆分 (物体层, 核) 对），
+    由单个调度线程在 batch_window 内收集，按 (核内容, 物体尺寸) 分组，每组一次批量FFT。
+    """
+
+    def __init__(self, batch_window=BATCH_WINDOW, psf_cache_bytes=512 * 1024 ** 2,
+                 otf_cache_bytes=512 * 1024 ** 2, batch_bytes=BATCH_BYTES):
+        self.batch_window = batch_window
+        self.batch_bytes = batch_bytes
+        self.psf_cache = _LRUCache(psf_cache_bytes)
+        self.otf_cache = _LRUCache(otf_cache_bytes)
+        self.counters = {'requests': 0, 'batches': 0, 'batched_requests': 0, 'fft_groups': 0, 'max_batch': 0}
+        self._lock = threading.Lock()
+        self._psf_pending = {}  # 正在生成的PSF：键 -> Future，相同PSF只生成一次
+        self._results = {}  # 编号 -> (共享内存数组, 过期时间)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._dispatch, name='simulation-service', daemon=True)
+        self._thread.start()
+
+    # ---------- PSF 与 OTF 缓存 ----------
+    def psf(self, spec):
+        """返回 (PSF, 元数据)；相同描述的并发请求只生成一次"""
+        key = _psf_key(spec)
+        cached = self.psf_cache.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            # 检查缓存与登记生成之间其他线程可能已生成完毕（已放入缓存并撤销登记），持锁再查一次
+            cached = self.psf_cache.peek(key)
+            if cached is not None:
+                return cached
+            future = self._psf_pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._psf_pending[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            psf, meta = simulation_engine.load_psf(spec)
+            psf = np.ascontiguousarray(psf, dtype=np.float32)
+            self.psf_cache.put(key, (psf, meta), psf.nbytes)
+            future.set_result((psf, meta))
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._psf_pending[key]
+        return psf, meta
+
+    def _otf(self, digest, kernel, shape):
+        # """核在给定FFT尺寸下的频谱（复数单精度），按内容缓存"""
+        from scipy import fft as sp_fft
+        key = (digest, shape)
+        otf = self.otf_cache.get(key)
+        if otf is None:
+            with span('service/otf', kernel=kernel.shape, shape=shape):
+                otf = sp_fft.rfft2(np.asarray(kernel, dtype=np.float32), s=shape, workers=-1)
+            self.otf_cache.put(key, otf, otf.nbytes)
+        return otf
+
+    # ---------- 请求 ----------
+    def submit(self, job):
+        """准备并排队一个仿真请求，返回 Future（结果为 (结果数组, z层列表, PSF元数据)）"""
+        psf, meta = self.psf(job['psf'])
+        planes = simulation_engine.resolve_planes(job.get('z_planes', 'all'), psf)
+        image = simulation_engine.load_object(job['object'])
+        items = [(i, np.asarray(obj), kernel, _kernel_digest(kernel))
+                 for i, z in enumerate(planes) for obj, kernel in ConvolutionHandler.plane_pairs(image, psf, z)]
+        shape = image.shape[:2] if planes == [None] else image.shape[:2] + (len(planes),)
+        request = _Request(items, shape)
+        with self._lock:
+            self.counters['requests'] += 1
+        self._queue.put(request)
+        future = Future()
+        request.future.add_done_callback(
+            lambda done: future.set_exception(done.exception()) if done.exception() else
+            future.set_result((done.result(), planes, meta)))
+        return future
+
+    def simulate(self, job):
+        """同步执行：返回 (结果数组, z层列表, PSF元数据)"""
+        return self.submit(job).result()
+
+    # ---------- 调度与批量FFT ----------
+    def _dispatch(self):
+        while True:
+            try:
+                request = self._queue.get(timeout=EXPIRY_INTERVAL)
+            except queue.Empty:
+                # 空闲时清理超时未释放的结果（客户端异常退出时不会调用 release）
+                self._expire()
+                continue
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._queue.put(None)
+                    break
+                batch.append(request)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        # """同一批请求按 (核, 物体尺寸) 分组，每组按内存上限分段做批量FFT，结果累加到各请求"""
+        with self._lock:
+            self.counters['batches'] += 1
+            self.counters['max_batch'] = max(self.counters['max_batch'], len(batch))
+            if len(batch) > 1:
+                self.counters['batched_requests'] += len(batch)
+        groups = OrderedDict()
+        for request in batch:
+            for index, obj, kernel, digest in request.items:
+                groups.setdefault((digest, obj.shape), (kernel, []))[1].append((request, index, obj))
+        try:
+            with span('service/batch', requests=len(batch), groups=len(groups)):
+                for (digest, _), (kernel, members) in groups.items():
+                    self._convolve_group(digest, kernel, members)
+        except BaseException as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        for request in batch:
+            np.clip(request.result, 0, 1, out=request.result)
+            request.future.set_result(request.result)
+
+    def _convolve_group(self, digest, kernel, members):
+        from scipy import fft as sp_fft
+        (kh, kw), (h, w) = kernel.shape, members[0][2].shape
+        shape = (sp_fft.next_fast_len(h + kh - 1, real=True), sp_fft.next_fast_len(w + kw - 1, real=True))
+        otf = self._otf(digest, kernel, shape)
+        # 'same' 输出在完整卷积中的起点，与 fftconvolve 一致
+        r0, c0 = (kh - 1) // 2, (kw - 1) // 2
+        step = max(1, self.batch_bytes // otf.nbytes)
+        with self._lock:
+            self.counters['fft_groups'] += 1
+        for start in range(0, len(members), step):
+            part = members[start:start + step]
+            with span('service/fft', batch=len(part), shape=shape):
+                stack = np.stack([np.asarray(obj, dtype=np.float32) for _, _, obj in part])
+                spectra = sp_fft.rfft2(stack, s=shape, workers=-1)
+                spectra *= otf
+                full = sp_fft.irfft2(spectra, s=shape, workers=-1)
+            for (request, index, _), plane in zip(part, full[:, r0:r0 + h, c0:c0 + w]):
+                if request.result.ndim == 2:
+                    request.result += plane
+                else:
+                    request.result[:, :, index] += plane
+
+    # ---------- 共享内存结果 ----------
+    def publish(self, array):
+        """把数组放入共享内存，返回描述 {id, shm, shape, dtype, pid}；客户端读取后调用 release"""
+        shared = empty_shared(array.shape, array.dtype)
+        shared[...] = array
+        result_id = uuid.uuid4().hex
+        self._expire()
+        with self._lock:
+            self._results[result_id] = (shared, time.monotonic() + RESULT_TTL)
+        name, shape, dtype = shared.descriptor
+        return {'id': result_id, 'shm': name, 'shape': list(shape), 'dtype': dtype, 'pid': os.getpid()}
+
+    def release(self, result_id):
+        with self._lock:
+            self._results.pop(result_id, None)
+
+    def _expire(self):
+        # """释放超时未取回的结果（发布、查询状态时与调度线程空闲时调用）"""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, expiry) in self._results.items() if expiry < now]:
+                del self._results[key]
+
+    def status(self):
+        self._expire()
+        with self._lock:
+            status = dict(self.counters, queued=self._queue.qsize(), results=len(self._results))
+        status.update(psf_cache=self.psf_cache.stats(), otf_cache=self.otf_cache.stats())
+        return status
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._results.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # """HTTP 路由：JSON 请求体与响应，参数错误返回 400"""
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._reply(200, self.server.service.status())
+        else:
+            self._reply(404, {'error': f"未知的路径: {self.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/simulate':
+                result, planes, meta = service.simulate(body['job'])
+                reply = {'planes': planes, 'psf': meta}
+                if body.get('output'):
+                    path = self._output_path(body['output'])
+                    simulation_engine.save_array(result, path, {'kind': 'result', 'psf': meta, 'planes': planes})
+                    reply.update(path=path, shape=list(result.shape))
+                else:
+                    reply.update(service.publish(result))
+            elif self.path == '/psf':
+                psf, meta = service.psf(body['psf'])
+                reply = dict(service.publish(psf), psf=meta)
+            elif self.path == '/release':
+                service.release(body['id'])
+                reply = {}
+            else:
+                self._reply(404, {'error': f"未知的路径: {self.path}"})
+                return
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self._reply(400, {'error': str(e) if not isinstance(e, KeyError) else f"缺少字段: {e}"})
+            return
+        except Exception as e:
+            self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, reply)
+
+    def _output_path(self, name):
+        # """输出文件在服务输出目录中的路径；未配置输出目录或路径（含符号链接）指向目录之外时报错"""
+        directory = self.server.output_dir
+        if directory is None:
+            raise ValueError("服务未配置输出目录（serve --output-dir），结果只能经共享内存取回")
+        directory = os.path.realpath(directory)
+        path = os.path.realpath(os.path.join(directory, name))
+        if os.path.commonpath([directory, path]) != directory or path == directory:
+            raise ValueError(f"输出路径必须位于服务的输出目录 {directory} 之内: {name}")
+        return path
+
+    def _reply(self, code, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=list).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, output_dir=None, **options):
+    """创建 HTTP 服务（port 为 0 时自动分配），service 属性为 SimulationService；调用 serve_forever() 运行
+
+    output_dir 为允许写入结果文件的目录，None 时 /simulate 不接受 output。
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.output_dir = output_dir
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    server.service = SimulationService(**options)
+    return server
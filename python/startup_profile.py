@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+import time
+
+# 启动耗时测量模式：环境变量 PSF_SIM_STARTUP_PROFILE=1 或命令行参数 --startup-profile
+ENV_VAR = 'PSF_SIM_STARTUP_PROFILE'
+FLAG = '--startup-profile'
+
+_start = None
+_records = []  # (模块名, 累计耗时, 自身耗时, 线程名)
+_marks = []  # (阶段, 自测量开始的秒数)
+_local = threading.local()
+
+
+def requested():
+    return bool(os.environ.get(ENV_VAR)) or FLAG in sys.argv
+
+
+def enabled():
+    return _start is not None
+
+
+class _TimedLoader:
+    # """包装模块加载器，记录 exec_module 的耗时；其余属性转发给原加载器"""
+
+    def __init__(self, loader, name):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(0.0)
+        begin = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - begin
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _records.append((self._name, elapsed, elapsed - children, threading.current_thread().name))
+
+
+class _TimingFinder:
+    # """位于 sys.meta_path 首位：委托其余查找器定位模块，再包装其加载器"""
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+            spec.loader = _TimedLoader(spec.loader, name)
+        return spec
+
+
+def install():
+    """开始测量：此后导入的每个模块都记录耗时"""
+    global _start
+    if _start is None:
+        _start = time.perf_counter()
+        sys.meta_path.insert(0, _TimingFinder())
+        mark("开始测量")
+
+
+def mark(label):
+    """记录启动阶段（未启用时不做任何事）"""
+    if _start is not None:
+        _marks.append((label, time.perf_counter() - _start))
+
+
+def report(top=30, file=None):
+    """输出各阶段时间与导入耗时最高的模块（累计耗时含其导入的子模块）"""
+    if _start is None:
+        return
+    file = file or sys.stderr
+    print("==== 启动耗时 ====", file=file)
+    for label, t in _marks:
+        print(f"{t * 1000:9.1f} ms  {label}", file=file)
+    total_self = sum(r[2] for r in _records)
+    print(f"---- 导入耗时（共 {len(_records)} 个模块，自身耗时合计 {total_self * 1000:.1f} ms）----", file=file)
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块 [线程]", file=file)
+    for name, cumulative, own, thread in sorted(_records, key=lambda r: -r[1])[:top]:
+        print(f"{cumulative * 1000:10.1f} {own * 1000:10.1f}  {name} [{thread}]", file=file)
@@ -0,0 +1,265 @@
+import copy
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import simulation_engine
+from cancellation import OperationCancelled
+
+MANIFEST = 'manifest.json'
+INDEX = 'index.jsonl'
+
+
+def expand_axes(sweep):
+    """把 sweep 描述展开为 [(字段路径, 取值列表), ...]
+
+    键为点分字段路径（如 "psf.wavelength"），也可用嵌套表；取值为列表，
+    或 {start, stop, num} 表示等间距取值（含端点）。
+    """
+    axes = []
+    for key, value in sweep.items():
+        if isinstance(value, dict) and 'num' in value:
+            values = np.linspace(float(value['start']), float(value['stop']), int(value['num'])).tolist()
+            axes.append((key, values))
+        elif isinstance(value, dict):
+            axes.extend((f"{key}.{sub}", values) for sub, values in expand_axes(value))
+        elif isinstance(value, (list, tuple)) and len(value) > 0:
+            axes.append((key, list(value)))
+        else:
+            raise ValueError(f"扫描参数 {key} 需要非空列表或 {{start, stop, num}}")
+    return axes
+
+
+def _assign(job, key, value):
+    # """按点分路径写入任务字段"""
+    *parents, leaf = key.split('.')
+    node = job
+    for name in parents:
+        node = node.setdefault(name, {})
+    node[leaf] = value
+
+
+class SweepStore:
+    """参数扫描的分块结果存储（目录）
+
+    manifest.json 记录基础任务、扫描轴与分块大小；第i个任务的结果写入
+    chunk_{i // chunk_size}.npy（内存映射，形状 (chunk_size, 结果形状...)）的第 i % chunk_size 个槽位；
+    index.jsonl 为完成索引，结果落盘之后才追加一行，中断后据此续算，已完成的点不再重算；
+    计算失败的点也登记一行（含 error），不影响其他点，续算时重新尝试。
+    """
+
+    def __init__(self, directory, job=None, chunk_size=64):
+        self.directory = directory
+        manifest_path = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if job is not None and self._manifest(job, manifest['chunk_size']) != manifest:
+                raise ValueError(f"{directory} 中已有不同参数的扫描，请换用新的目录")
+        elif job is None:
+            raise ValueError(f"{directory} 不是扫描结果目录")
+        else:
+            manifest = self._manifest(job, chunk_size)
+            os.makedirs(directory, exist_ok=True)
+            tmp = manifest_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, manifest_path)
+
+        self.base_job = manifest['job']
+        self.axes = [(key, values) for key, values in manifest['axes']]
+        self.chunk_size = manifest['chunk_size']
+        self.grid_shape = tuple(len(values) for _, values in self.axes)
+        self.n_tasks = int(np.prod(self.grid_shape))
+        self._chunks = {}
+        self._lock = threading.Lock()
+        self.completed, self.failed = self._read_index()
+
+    @staticmethod
+    def _manifest(job, chunk_size):
+        job = json.loads(json.dumps(job))  # 统一为 JSON 类型，便于与已有清单比较
+        axes = expand_axes(job.pop('sweep'))
+        job.pop('output', None)
+        return {'job': job, 'axes': [[key, values] for key, values in axes], 'chunk_size': int(chunk_size)}
+
+    def _read_index(self):
+        # """读取完成索引，返回 (已完成, 失败)；崩溃时未写完的最后一行忽略，同一点以最后一行为准"""
+        completed, failed = {}, {}
+        path = os.path.join(self.directory, INDEX)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if 'error' in entry:
+                        failed[entry['task']] = entry
+                    else:
+                        completed[entry['task']] = entry
+                        failed.pop(entry['task'], None)
+        return completed, failed
+
+    def task_params(self, task):
+        """第task个扫描点的 {字段路径: 取值}"""
+        position = np.unravel_index(task, self.grid_shape)
+        return {key: values[i] for (key, values), i in zip(self.axes, position)}
+
+    def task_job(self, task):
+        job = copy.deepcopy(self.base_job)
+        for key, value in self.task_params(task).items():
+            _assign(job, key, value)
+        return job
+
+    def pending(self):
+        return [task for task in range(self.n_tasks) if task not in self.completed]
+
+    def _chunk(self, index, shape=None):
+        # """打开（或按首个结果的形状创建）分块文件"""
+        chunk = self._chunks.get(index)
+        if chunk is None:
+            path = os.path.join(self.directory, f'chunk_{index:05d}.npy')
+            if os.path.exists(path):
+                try:
+                    chunk = np.load(path, mmap_mode='r+')
+                except (ValueError, OSError):
+                    # 创建文件时中断：其中还没有已登记的结果，可以重建
+                    if any(task // self.chunk_size == index for task in self.completed):
+                        raise
+            if chunk is None:
+                if shape is None:
+                    raise KeyError(index)
+                chunk = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                                  shape=(self.chunk_size,) + tuple(shape))
+            self._chunks[index] = chunk
+        return chunk
+
+    def write(self, task, result, elapsed=0.0):
+        """保存一个扫描点的结果并登记完成"""
+        result = np.asarray(result, dtype=np.float32)
+        with self._lock:
+            chunk = self._chunk(task // self.chunk_size, result.shape)
+            if chunk.shape[1:] != result.shape:
+                raise ValueError(f"扫描结果形状不一致: {result.shape}，分块为 {chunk.shape[1:]}")
+            chunk[task % self.chunk_size] = result
+            chunk.flush()
+            entry = {'task': task, 'params': self.task_params(task), 'elapsed': round(elapsed, 4)}
+            self._append(entry)
+            self.completed[task] = entry
+            self.failed.pop(task, None)
+
+    def write_failure(self, task, error, elapsed=0.0):
+        """登记一个计算失败的扫描点（不写结果）"""
+        with self._lock:
+            entry = {'task': task, 'params': self.task_params(task), 'elapsed': round(elapsed, 4), 'error': error}
+            self._append(entry)
+            self.failed[task] = entry
+
+    def _append(self, entry):
+        # """向完成索引追加一行并落盘"""
+        with open(os.path.join(self.directory, INDEX), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, task):
+        """第task个扫描点的结果（内存映射视图）；未完成时报错"""
+        if task not in self.completed:
+            raise KeyError(f"扫描点 {task} 尚未完成")
+        with self._lock:
+            return self._chunk(task // self.chunk_size)[task % self.chunk_size]
+
+    def close(self):
+        with self._lock:
+            for chunk in self._chunks.values():
+                chunk.flush()
+            self._chunks.clear()
+
+
+class SweepRunner:
+    """在进程池上执行扫描：每个扫描点在一个工作进程中完整运行 生成PSF → 卷积，
+    结果由主进程写入 SweepStore；backend 为 None 时在本进程的线程中计算"""
+
+    def __init__(self, store, backend=None, workers=None):
+        self.store = store
+        self.backend = backend
+        self.workers = workers or (backend.max_workers if backend is not None else 1)
+
+    def _compute(self, task, cancel_token):
+        # """计算一个扫描点，返回 (结果, 耗时, 错误信息)；单点出错不中断扫描，取消照常抛出"""
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        start = time.perf_counter()
+        try:
+            job = self.store.task_job(task)
+            if self.backend is not None:
+                result = self.backend.simulate(job, cancel_token=cancel_token)
+            else:
+                _, _, result = simulation_engine.simulate(job, cancel_token=cancel_token)
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            return None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+        return result, time.perf_counter() - start, None
+
+    def _save(self, task, outcome):
+        # """写入一个扫描点的结果；出错或结果形状与已有分块不一致时登记为失败"""
+        result, elapsed, error = outcome
+        if error is None:
+            try:
+                self.store.write(task, result, elapsed)
+                return
+            except ValueError as e:
+                error = f"{type(e).__name__}: {e}"
+        self.store.write_failure(task, error, elapsed)
+
+    def run(self, progress_callback=None, cancel_token=None):
+        """计算所有未完成的扫描点（含上次失败的点）；progress_callback(已处理数, 总数)
+
+        单点失败时登记并继续，汇总中列出失败的点；取消或出错时先保存已算完的结果再抛出。
+        """
+        store = self.store
+        pending = store.pending()
+        start = time.perf_counter()
+        if progress_callback:
+            progress_callback(len(store.completed), store.n_tasks)
+        # 提交数量限制在工作数的两倍，取消时无需撤回大量排队任务
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            queue = iter(pending)
+            running = {}
+            try:
+                while True:
+                    while len(running) < 2 * self.workers:
+                        if cancel_token is not None and cancel_token.cancelled:
+                            break
+                        task = next(queue, None)
+                        if task is None:
+                            break
+                        running[pool.submit(self._compute, task, cancel_token)] = task
+                    if not running:
+                        break
+                    future = next(as_completed(running))
+                    task = running.pop(future)
+                    self._save(task, future.result())
+                    if progress_callback:
+                        progress_callback(len(store.completed) + len(store.failed), store.n_tasks)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                # 已算完的点照常落盘，续算时不再重算
+                for future, task in running.items():
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        self._save(task, future.result())
+                raise
+            finally:
+                store.close()
+        if cancel_token is not None and cancel_token.cancelled:
+            raise OperationCancelled("扫描已取消")
+        failures = [{'task': task, 'params': entry['params'], 'error': entry['error']}
+                    for task, entry in sorted(store.failed.items())]
+        return {'tasks': store.n_tasks, 'computed': len(pending), 'completed': len(store.completed),
+                'failed': len(failures), 'failures': failures, 'elapsed': time.perf_counter() - start}
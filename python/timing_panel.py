@@ -0,0 +1,72 @@
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton,
+                             QHeaderView, QFileDialog, QMessageBox)
+from PyQt5.QtCore import Qt, QTimer
+
+import profiling
+
+
+class TimingPanel(QWidget):
+    """耗时统计面板：按区段名称汇总 profiling 采集的数据，可导出 Chrome Trace"""
+
+    REFRESH_MS = 1000
+    COLUMNS = ("区段", "次数", "总计(ms)", "平均(ms)", "最大(ms)", "最近(ms)")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.export_btn = QPushButton("导出 Chrome Trace…")
+        self.export_btn.clicked.connect(self.exportTrace)
+        self.clear_btn = QPushButton("清空")
+        self.clear_btn.clicked.connect(self.clearStats)
+        buttons.addWidget(self.export_btn)
+        buttons.addWidget(self.clear_btn)
+        layout.addLayout(buttons)
+
+        # 只在面板可见时刷新
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(self.REFRESH_MS)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        # 按总耗时降序
+        rows = sorted(profiling.summary().items(), key=lambda item: -item[1][1])
+        self.table.setRowCount(len(rows))
+        for row, (name, (count, total, longest, last)) in enumerate(rows):
+            values = (name, str(count), f"{total * 1000:.1f}", f"{total / count * 1000:.2f}",
+                      f"{longest * 1000:.2f}", f"{last * 1000:.2f}")
+            for col, text in enumerate(values):
+                item = QTableWidgetItem(text)
+                if col:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+
+    def clearStats(self):
+        profiling.clear()
+        self.refresh()
+
+    def exportTrace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出 Chrome Trace", "trace.json", "JSON (*.json)")
+        if not path:
+            return
+        try:
+            count = profiling.export_chrome_trace(path)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"导出失败: {e}")
+            return
+        QMessageBox.information(self, "导出完成", f"已导出 {count} 个事件，可在 chrome://tracing 或 Perfetto 中打开")
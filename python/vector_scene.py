@@ -0,0 +1,143 @@
+import numpy as np
+
+from profiling import traced
+
+
+class VectorScene:
+    """矢量场景模型
+
+    记录绘制的图元（画笔/直线段、矩形、椭圆、填充），坐标为场景单位（默认与绘图控件像素一致，
+    像素中心位于 i+0.5）。可按任意目标分辨率或物理像素尺寸栅格化为 NumPy 覆盖率图（0~1），
+    采用超采样面积覆盖抗锯齿；合成结果按分辨率缓存，新增图元时只栅格化新图元。
+    """
+
+    MAX_SEGMENT_PIXELS = 64  # 长线段按目标像素长度拆分，限制单块超采样面积
+
+    def __init__(self, width, height, unit_size=1.0):
+        self.width = width
+        self.height = height
+        self.unit_size = unit_size  # 每场景单位对应的物理长度（米）
+        self.primitives = []
+        self._cache = {}  # (rows, cols, supersample) -> 栅格缓存
+
+    # ---------- 图元 ----------
+    def add_segment(self, p0, p1, width):
+        self._append(('polyline', (tuple(p0), tuple(p1)), float(width)))
+
+    def add_polyline(self, points, width, closed=False):
+        points = [tuple(p) for p in points]
+        if closed:
+            points.append(points[0])
+        self._append(('polyline', tuple(points), float(width)))
+
+    def add_rect(self, p0, p1, width):
+        (x0, y0), (x1, y1) = p0, p1
+        self.add_polyline([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], width, closed=True)
+
+    def add_ellipse(self, p0, p1, width):
+        (x0, y0), (x1, y1) = p0, p1
+        cx, cy = (x0 + x1) / 2.0, (y0 + y1) / 2.0
+        rx, ry = abs(x1 - x0) / 2.0, abs(y1 - y0) / 2.0
+        # 折线逼近：段数随周长增加
+        n = int(np.clip(np.pi * (rx + ry) / 2.0, 16, 720))
+        t = np.linspace(0.0, 2.0 * np.pi, n, endpoint=False)
+        self.add_polyline(np.stack([cx + rx * np.cos(t), cy + ry * np.sin(t)], axis=1), width, closed=True)
+
+    def add_fill(self, seed):
+        self._append(('fill', tuple(seed), 0.0))
+
+    def clear(self):
+        self.primitives = []
+        self._cache.clear()
+
+    def _append(self, primitive):
+        self.primitives.append(primitive)
+
+    # ---------- 栅格化 ----------
+    def raster_shape(self, pixel_size):
+        # """按物理像素尺寸计算栅格尺寸 (rows, cols)"""
+        return (max(1, int(round(self.height * self.unit_size / pixel_size))),
+                max(1, int(round(self.width * self.unit_size / pixel_size))))
+
+    @traced('convert/rasterize')
+    def rasterize(self, shape=None, pixel_size=None, supersample=4):
+        """栅格化为 float32 覆盖率图；shape 与 pixel_size 二选一（默认与场景同尺寸）"""
+        if shape is None:
+            shape = self.raster_shape(pixel_size) if pixel_size is not None else \
+                (int(round(self.height)), int(round(self.width)))
+        rows, cols = int(shape[0]), int(shape[1])
+        key = (rows, cols, int(supersample))
+        cache = self._cache.get(key)
+        if cache is None:
+            cache = {'image': np.zeros((rows, cols), dtype=np.float32), 'count': 0}
+            self._cache[key] = cache
+
+        # 只处理上次栅格化之后新增的图元
+        image = cache['image']
+        scale = (rows / self.height, cols / self.width)
+        for primitive in self.primitives[cache['count']:]:
+            kind, geometry, width = primitive
+            if kind == 'polyline':
+                for r0, c0, patch in self._rasterize_polyline(geometry, width, scale, (rows, cols), key[2]):
+                    view = image[r0:r0 + patch.shape[0], c0:c0 + patch.shape[1]]
+                    np.maximum(view, patch, out=view)
+            else:
+                self._apply_fill(image, geometry, scale)
+        cache['count'] = len(self.primitives)
+        return image.copy()
+
+    def _rasterize_polyline(self, points, width, scale, shape, ss):
+        # """逐段栅格化胶囊形线段，返回 [(行起点, 列起点, 覆盖率块)]"""
+        sy, sx = scale
+        pts = np.asarray(points, dtype=np.float64) * np.array([sx, sy])
+        radius = max(width * 0.5 * (sx + sy) / 2.0, 0.5 / ss)
+        patches = []
+        for (x0, y0), (x1, y1) in zip(pts[:-1], pts[1:]):
+            length = np.hypot(x1 - x0, y1 - y0)
+            n = max(1, int(np.ceil(length / self.MAX_SEGMENT_PIXELS)))
+            for i in range(n):
+                a = (x0 + (x1 - x0) * i / n, y0 + (y1 - y0) * i / n)
+                b = (x0 + (x1 - x0) * (i + 1) / n, y0 + (y1 - y0) * (i + 1) / n)
+                patch = self._capsule(a, b, radius, shape, ss)
+                if patch is not None:
+                    patches.append(patch)
+        return patches
+
+    @staticmethod
+    def _capsule(a, b, radius, shape, ss):
+        # """单个胶囊（线段加半径）在其包围盒内的超采样覆盖率"""
+        rows, cols = shape
+        r0 = max(int(np.floor(min(a[1], b[1]) - radius)), 0)
+        r1 = min(int(np.ceil(max(a[1], b[1]) + radius)), rows)
+        c0 = max(int(np.floor(min(a[0], b[0]) - radius)), 0)
+        c1 = min(int(np.ceil(max(a[0], b[0]) + radius)), cols)
+        if r0 >= r1 or c0 >= c1:
+            return None
+
+        # 子采样点位于每个像素内 (k+0.5)/ss 处
+        offsets = (np.arange(ss) + 0.5) / ss
+        ys = (np.arange(r0, r1)[:, None] + offsets[None, :]).ravel()
+        xs = (np.arange(c0, c1)[:, None] + offsets[None, :]).ravel()
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        length2 = dx * dx + dy * dy
+        px = xs[None, :] - a[0]
+        py = ys[:, None] - a[1]
+        if length2 > 0:
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+        else:
+            t = 0.0
+        inside = (px - t * dx) ** 2 + (py - t * dy) ** 2 <= radius * radius
+        coverage = inside.reshape(r1 - r0, ss, c1 - c0, ss).mean(axis=(1, 3), dtype=np.float32)
+        return r0, c0, coverage
+
+    @staticmethod
+    def _apply_fill(image, seed, scale):
+        # """在当前合成结果上填充种子点所在的未覆盖连通区域"""
+        rows, cols = image.shape
+        r = int(seed[1] * scale[0])
+        c = int(seed[0] * scale[1])
+        if not (0 <= r < rows and 0 <= c < cols) or image[r, c] >= 0.5:
+            return
+        from scipy.ndimage import label  # 首次填充时导入
+        labels, _ = label(image < 0.5)
+        image[labels == labels[r, c]] = 1.0
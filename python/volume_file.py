@@ -0,0 +1,251 @@
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from image_stack import ImageStack
+from profiling import span
+
+# 原生体数据格式（.psv）：
+#   MAGIC | 数据块 ... | JSON 头 | 头长度(uint64, 小端) | MAGIC
+# 数据沿z分块，每块为 chunk_depth 个连续存放的二维层 (层, 行, 列)，可压缩；
+# 头记录形状、数据类型、编码、各块 (偏移, 长度) 与元数据（生成方法、参数、体素尺寸等）。
+# 未压缩时各层直接内存映射，压缩时按块读取解码，只读取用到的层。
+EXTENSION = '.psv'
+MAGIC = b'PSFVOL01'
+_FOOTER = struct.Struct('<Q8s')
+CODECS = ('zlib', 'zstd', 'none')
+CHUNK_BYTES = 4 << 20  # 默认每块约 4 MB
+
+
+def _compressor(codec, level):
+    if codec == 'zlib':
+        return lambda data: zlib.compress(data, level)
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd 编码需要安装 zstandard") from None
+        return zstandard.ZstdCompressor(level=level).compress
+    if codec == 'none':
+        return bytes
+    raise ValueError(f"未知的编码: {codec}（可选: {', '.join(CODECS)}）")
+
+
+def _decompressor(codec):
+    if codec == 'zlib':
+        return zlib.decompress
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("读取 zstd 编码的文件需要安装 zstandard") from None
+        return zstandard.ZstdDecompressor().decompress
+    return bytes
+
+
+class VolumeWriter:
+    """逐层写入 .psv 文件（内存占用为一个块）；写到临时文件，close() 时替换目标文件
+
+        with VolumeWriter(path, (rows, cols), metadata={...}) as writer:
+            for z in range(depth):
+                writer.write(plane)
+    """
+
+    def __init__(self, path, plane_shape, dtype=np.float32, ndim=3, chunk_depth=None, codec='zlib', level=1,
+                 shuffle=True, metadata=None, threads=None):
+        self.path = path
+        self.plane_shape = tuple(int(n) for n in plane_shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = ndim
+        self.codec = codec
+        self.shuffle = shuffle and codec != 'none' and self.dtype.itemsize > 1
+        self.metadata = metadata or {}
+        plane_bytes = max(int(np.prod(self.plane_shape)) * self.dtype.itemsize, 1)
+        self.chunk_depth = chunk_depth or max(1, CHUNK_BYTES // plane_bytes)
+        self._compress = _compressor(codec, level)
+        self._chunks = []
+        self._pending = []
+        # 压缩在线程池中并行（zlib/zstd 释放GIL），按提交顺序写出
+        self._threads = threads or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(self._threads) if codec != 'none' else None
+        self._inflight = deque()
+        self._depth = 0
+        self._tmp = path + '.tmp'
+        self._file = open(self._tmp, 'wb')
+        self._file.write(MAGIC)
+
+    def write(self, planes):
+        """追加一层 (行, 列) 或多层 (行, 列, 层数)"""
+        planes = np.asarray(planes)
+        if planes.ndim == 2:
+            planes = planes[:, :, None]
+        if planes.shape[:2] != self.plane_shape:
+            raise ValueError(f"层尺寸 {planes.shape[:2]} 与文件 {self.plane_shape} 不一致")
+        for z in range(planes.shape[2]):
+            self._pending.append(np.asarray(planes[:, :, z], dtype=self.dtype))
+            self._depth += 1
+            if len(self._pending) == self.chunk_depth:
+                self._flush_chunk()
+
+    def _encode(self, data):
+        # """字节重排（按字节位分组，使浮点数据更易压缩）后压缩"""
+        with span('io/encode_chunk', bytes=data.nbytes):
+            raw = data.view(np.uint8).reshape(-1, self.dtype.itemsize).T.tobytes() if self.shuffle else \
+                data.tobytes()
+            return self._compress(raw)
+
+    def _flush_chunk(self):
+        data = np.ascontiguousarray(np.stack(self._pending))
+        self._pending = []
+        if self._executor is None:
+            self._write_payload(data.tobytes())
+            return
+        self._inflight.append(self._executor.submit(self._encode, data))
+        while len(self._inflight) > 2 * self._threads:
+            self._write_payload(self._inflight.popleft().result())
+
+    def _write_payload(self, payload):
+        self._chunks.append([self._file.tell(), len(payload)])
+        self._file.write(payload)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._pending:
+            self._flush_chunk()
+        while self._inflight:
+            self._write_payload(self._inflight.popleft().result())
+        self._shutdown()
+        if self.ndim == 2 and self._depth != 1:
+            raise ValueError("二维数据只能写入一层")
+        shape = list(self.plane_shape) + ([self._depth] if self.ndim == 3 else [])
+        header = json.dumps({
+            'version': 1, 'shape': shape, 'dtype': self.dtype.str, 'chunk_depth': self.chunk_depth,
+            'codec': self.codec, 'shuffle': self.shuffle, 'chunks': self._chunks, 'metadata': self.metadata,
+        }, ensure_ascii=False).encode('utf-8')
+        self._file.write(header)
+        self._file.write(_FOOTER.pack(len(header), MAGIC))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp, self.path)
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self._shutdown()
+        self._inflight.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def save_volume(path, array, metadata=None, codec='zlib', level=1, chunk_depth=None):
+    """保存二维或三维数组（可为惰性图像栈，逐层读取）"""
+    ndim = array.ndim
+    dtype = np.float32 if isinstance(array, ImageStack) else array.dtype
+    with VolumeWriter(path, array.shape[:2], dtype=dtype, ndim=ndim, chunk_depth=chunk_depth, codec=codec,
+                      level=level, metadata=metadata) as writer:
+        if ndim == 2:
+            writer.write(np.asarray(array))
+        else:
+            for z in range(array.shape[2]):
+                writer.write(array[:, :, z])
+
+
+class VolumeFile(ImageStack):
+    """惰性读取 .psv 文件，接口与 ImageStack 相同（page、切片索引、sum、可pickle）
+
+    未压缩文件的各层内存映射；压缩文件按块解码，解码结果按内存上限缓存。
+    """
+
+    def __init__(self, path, cache_bytes=256 * 1024 ** 2):
+        self.path = path
+        self.cache_bytes = cache_bytes
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"不是 {EXTENSION} 文件: {path}")
+            f.seek(-_FOOTER.size, os.SEEK_END)
+            header_len, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} 不完整（缺少文件尾）")
+            f.seek(-_FOOTER.size - header_len, os.SEEK_END)
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        self._shape = tuple(header['shape'])
+        self._size = self._shape[:2]
+        self._source_dtype = np.dtype(header['dtype'])
+        self.codec = header['codec']
+        self.shuffle = header['shuffle']
+        self.chunk_depth = header['chunk_depth']
+        self._chunk_table = header['chunks']
+        self.metadata = header['metadata']
+        depth = self._shape[2] if len(self._shape) == 3 else 1
+        plane_bytes = int(np.prod(self._size)) * self._source_dtype.itemsize
+        if self.codec == 'none':
+            # 未压缩：第z层位于所在块偏移 + 块内序号 × 层字节数
+            self._pages = [(self._source_dtype,
+                            self._chunk_table[z // self.chunk_depth][0] + (z % self.chunk_depth) * plane_bytes)
+                           for z in range(depth)]
+        else:
+            self._pages = [(self._source_dtype, None)] * depth
+        self._init_cache()
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def voxel_size(self):
+        # """元数据中的体素尺寸 (dx, dy, dz)，未记录时为 None"""
+        return self.metadata.get('voxel_size')
+
+    def _raw_page(self, index):
+        dtype, offset = self._pages[index]
+        if offset is not None:
+            return super()._raw_page(index)
+        chunk = self._cached(index // self.chunk_depth)
+        if chunk is None:
+            chunk = self._read_chunk(index // self.chunk_depth)
+        return chunk[index % self.chunk_depth]
+
+    def _read_chunk(self, number):
+        # """读取并解码一块，形状 (层, 行, 列)，按内存上限缓存"""
+        offset, length = self._chunk_table[number]
+        with span('io/read_chunk', chunk=number, bytes=length):
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                raw = _decompressor(self.codec)(f.read(length))
+            itemsize = self._source_dtype.itemsize
+            if self.shuffle:
+                raw = np.frombuffer(raw, dtype=np.uint8).reshape(itemsize, -1).T.copy()
+            chunk = np.frombuffer(raw, dtype=self._source_dtype).reshape((-1,) + self._size)
+        return self._store(number, chunk)
+
+    def __repr__(self):
+        return f"VolumeFile({self.path!r}, shape={self.shape}, codec={self.codec}, chunk_depth={self.chunk_depth})"
+
+
+def open_stack(path):
+    """按扩展名打开惰性图像栈：.psv 为 VolumeFile，其余图像为 ImageStack"""
+    if path.lower().endswith(EXTENSION):
+        return VolumeFile(path)
+    return ImageStack(path)
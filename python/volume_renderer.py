@@ -0,0 +1,155 @@
+import math
+import threading
+
+import numpy as np
+from scipy.ndimage import affine_transform
+
+from profiling import traced
+
+CHUNK_VOXELS = 1 << 22  # 单次重采样的体素数上限（沿视线分块，块间检查取消）
+
+
+def _pool_axis(array, axis):
+    # """沿一个轴两两取最大（奇数长度时最后一层单独保留）"""
+    n = array.shape[axis]
+    if n == 1:
+        return array
+    even = [slice(None)] * 3
+    odd = [slice(None)] * 3
+    even[axis], odd[axis] = slice(0, n - 1, 2), slice(1, n, 2)
+    pooled = np.maximum(array[tuple(even)], array[tuple(odd)])
+    if n % 2:
+        last = [slice(None)] * 3
+        last[axis] = slice(n - 1, n)
+        pooled = np.concatenate([pooled, array[tuple(last)]], axis=axis)
+    return pooled
+
+
+def _pool_volume(volume, chunk_voxels=CHUNK_VOXELS):
+    # """2×2×2 最大池化（尺寸为1的轴不池化）；按z分块读取，惰性图像栈无需整体载入"""
+    rows, cols, depth = volume.shape
+    step = max(2, (chunk_voxels // max(rows * cols, 1)) // 2 * 2)
+    parts = []
+    for z0 in range(0, depth, step):
+        chunk = np.asarray(volume[:, :, z0:z0 + step], dtype=np.float32)
+        for axis in range(3):
+            chunk = _pool_axis(chunk, axis)
+        parts.append(chunk)
+    return np.concatenate(parts, axis=2)
+
+
+class MipPyramid:
+    """体数据的最大值金字塔：第k级为第k-1级的 2×2×2 最大池化，保证各级最大投影一致；
+    各级在首次使用时生成并保留（线程安全）"""
+
+    def __init__(self, volume, min_size=8):
+        self.shape = tuple(volume.shape)
+        self._levels = [volume]
+        self._lock = threading.Lock()
+        n_levels, shape = 1, np.array(self.shape)
+        while shape.max() > min_size:
+            shape = np.where(shape > 1, -(-shape // 2), 1)
+            n_levels += 1
+        self.n_levels = n_levels
+
+    def level(self, k):
+        """第k级体数据（第0级为原始数据，可为惰性图像栈）"""
+        k = min(max(k, 0), self.n_levels - 1)
+        with self._lock:
+            while len(self._levels) <= k:
+                self._levels.append(_pool_volume(self._levels[-1]))
+            return self._levels[k]
+
+    def scale(self, k):
+        # """第k级每个体素对应的第0级体素数（各轴）"""
+        shape = np.array(self.shape, dtype=float)
+        for _ in range(min(max(k, 0), self.n_levels - 1)):
+            shape = np.where(shape > 1, np.ceil(shape / 2), 1)
+        return np.array(self.shape) / shape
+
+
+class VolumeRenderer:
+    """任意视角的最大强度投影（MIP）
+
+    视线方向由方位角（绕z轴）与仰角确定；屏幕横轴在x-y平面内，纵轴在方位角为0时即z轴。
+    按视口像素尺寸选择金字塔级别（缩小时用粗级别，放大到一定程度才用原始分辨率），
+    只读取视窗对应的包围盒区域，沿视线分块重采样取最大值。
+    """
+
+    def __init__(self, volume, min_size=8):
+        self.pyramid = MipPyramid(volume, min_size)
+        self.center = (np.array(self.pyramid.shape) - 1) / 2.0
+
+    @property
+    def radius(self):
+        # """体数据外接球半径（第0级体素单位），即默认视窗半宽"""
+        return 0.5 * float(np.linalg.norm(self.pyramid.shape))
+
+    def default_window(self):
+        r = self.radius
+        return (-r, r, -r, r)
+
+    def choose_level(self, pixel_size):
+        """选择与屏幕像素尺寸最接近（对数意义下）的级别，体素不超过像素的√2倍"""
+        level = 0
+        for k in range(1, self.pyramid.n_levels):
+            if self.pyramid.scale(k).max() > pixel_size * math.sqrt(2):
+                break
+            level = k
+        return level
+
+    @staticmethod
+    def _basis(azimuth, elevation):
+        # """(视线, 屏幕纵轴, 屏幕横轴) 在体数据坐标 (x, y, z) 中的单位向量"""
+        a, e = math.radians(azimuth), math.radians(elevation)
+        depth = np.array([math.cos(a) * math.cos(e), math.sin(a) * math.cos(e), math.sin(e)])
+        up = np.array([-math.cos(a) * math.sin(e), -math.sin(a) * math.sin(e), math.cos(e)])
+        right = np.array([-math.sin(a), math.cos(a), 0.0])
+        return depth, up, right
+
+    @traced('render/volume')
+    def render(self, azimuth=0.0, elevation=0.0, window=None, viewport=(256, 256), level=None, cancel_token=None):
+        """返回 (投影图像, 使用的级别, 视窗)；viewport 为 (高, 宽) 屏幕像素，level 为 None 时自动选择"""
+        u0, u1, v0, v1 = window or self.default_window()
+        pixel_size = max((u1 - u0) / viewport[1], (v1 - v0) / viewport[0])
+        if level is None:
+            level = self.choose_level(pixel_size)
+        scale = self.pyramid.scale(level)
+        volume = self.pyramid.level(level)
+
+        # 输出像素不小于该级体素，避免无意义的上采样
+        step = max(pixel_size, float(scale.min()))
+        n_u = max(1, int(round((u1 - u0) / step)))
+        n_v = max(1, int(round((v1 - v0) / step)))
+        pu, pv = (u1 - u0) / n_u, (v1 - v0) / n_v
+        depth_step = float(scale.max())
+        depth, up, right = self._basis(azimuth, elevation)
+        # 视线方向上只覆盖体数据在该方向的投影范围
+        half_depth = 0.5 * float(np.abs(depth) @ np.array(self.pyramid.shape))
+        n_d = max(1, int(math.ceil(2 * half_depth / depth_step)))
+
+        # 输出索引 (视线, 行, 列) -> 第level级体素索引：q = M @ i + offset
+        matrix = np.stack([depth * depth_step, -up * pv, right * pu], axis=1) / scale[:, None]
+        origin = self.center + depth * (-half_depth + 0.5 * depth_step) + up * (v1 - 0.5 * pv) + \
+            right * (u0 + 0.5 * pu)
+        offset = (origin - (scale - 1) / 2.0) / scale
+
+        image = np.zeros((n_v, n_u), dtype=np.float32)
+        chunk = max(1, CHUNK_VOXELS // (n_v * n_u))
+        for d0 in range(0, n_d, chunk):
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            n = min(chunk, n_d - d0)
+            chunk_offset = offset + matrix[:, 0] * d0
+            # 只读取该块在体数据中的包围盒
+            corners = np.array([[i, j, k] for i in (0, n - 1) for j in (0, n_v - 1) for k in (0, n_u - 1)], float)
+            coords = corners @ matrix.T + chunk_offset
+            lo = np.maximum(np.floor(coords.min(axis=0)).astype(int) - 1, 0)
+            hi = np.minimum(np.ceil(coords.max(axis=0)).astype(int) + 2, volume.shape)
+            if np.any(hi <= lo):
+                continue
+            block = np.asarray(volume[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]], dtype=np.float32)
+            samples = affine_transform(block, matrix, chunk_offset - lo, output_shape=(n, n_v, n_u),
+                                       order=1, mode='constant', cval=0.0)
+            np.maximum(image, samples.max(axis=0), out=image)
+        return image, level, (u0, u1, v0, v1)
@@ -0,0 +1,177 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QSlider, QLabel, QPushButton,
+                             QMessageBox)
+from PyQt5.QtCore import Qt, QTimer
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+import numpy as np
+
+from cancellation import CancellationToken
+from job_scheduler import JobScheduler
+from result_view import cjk_font
+from volume_renderer import VolumeRenderer
+
+
+class VolumeViewDialog(QDialog):
+    """三维体数据显示（任意视角最大强度投影）
+
+    拖动旋转、滚轮缩放；交互过程中以视口 1/DRAG_DOWNSCALE 的分辨率（对应金字塔粗级别）快速投影，
+    停止操作后再按视口分辨率细化。投影在后台线程计算，新的请求取消尚未完成的旧请求。
+    """
+
+    DRAG_DOWNSCALE = 4
+    REFINE_DELAY_MS = 200
+
+    def __init__(self, volumes, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("三维显示")
+        self.resize(640, 680)
+        self.volumes = volumes  # 名称 -> 三维数组或惰性图像栈
+        self.renderers = {}
+        self.renderer = None
+        self.window = None
+        self._drag_origin = None
+        self._token = CancellationToken()
+
+        self.scheduler = JobScheduler(self)
+        self.scheduler.result_ready.connect(self._showProjection)
+        self.scheduler.error_occurred.connect(self._handleError)
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(lambda: self._requestProjection(coarse=False))
+
+        self.initUI()
+        self._selectSource()
+
+    def initUI(self):
+        layout = QVBoxLayout(self)
+
+        controls = QHBoxLayout()
+        self.source_combo = QComboBox()
+        self.source_combo.addItems(list(self.volumes))
+        self.source_combo.currentIndexChanged.connect(self._selectSource)
+        controls.addWidget(QLabel("数据:"))
+        controls.addWidget(self.source_combo)
+        self.reset_btn = QPushButton("重置视图")
+        self.reset_btn.clicked.connect(self._resetView)
+        controls.addWidget(self.reset_btn)
+        self.lod_label = QLabel()
+        controls.addWidget(self.lod_label, 1)
+        layout.addLayout(controls)
+
+        self.figure = Figure(figsize=(6, 6))
+        self.canvas = FigureCanvas(self.figure)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.set_aspect('equal')
+        self.image = self.ax.imshow(np.zeros((1, 1), dtype=np.float32), cmap='inferno', origin='upper',
+                                    interpolation='nearest')
+        self.ax.set_xlabel("屏幕横向 (体素)", fontproperties=cjk_font())
+        self.ax.set_ylabel("屏幕纵向 (体素)", fontproperties=cjk_font())
+        layout.addWidget(self.canvas)
+        self.canvas.mpl_connect('button_press_event', self._onPress)
+        self.canvas.mpl_connect('motion_notify_event', self._onMotion)
+        self.canvas.mpl_connect('button_release_event', self._onRelease)
+        self.canvas.mpl_connect('scroll_event', self._onScroll)
+
+        form = QHBoxLayout()
+        self.azimuth_slider = QSlider(Qt.Horizontal)
+        self.azimuth_slider.setRange(0, 359)
+        self.elevation_slider = QSlider(Qt.Horizontal)
+        self.elevation_slider.setRange(-90, 90)
+        for label, slider in (("方位角", self.azimuth_slider), ("仰角", self.elevation_slider)):
+            form.addWidget(QLabel(label))
+            form.addWidget(slider)
+            slider.valueChanged.connect(self._viewChanged)
+            slider.sliderReleased.connect(lambda: self._requestProjection(coarse=False))
+        layout.addLayout(form)
+
+    # ---------- 数据源与视图 ----------
+    def _selectSource(self):
+        name = self.source_combo.currentText()
+        if name not in self.renderers:
+            self.renderers[name] = VolumeRenderer(self.volumes[name])
+        self.renderer = self.renderers[name]
+        self._resetView()
+
+    def _resetView(self):
+        self.window = self.renderer.default_window()
+        for slider in (self.azimuth_slider, self.elevation_slider):
+            slider.blockSignals(True)
+            slider.setValue(0)
+            slider.blockSignals(False)
+        self._requestProjection(coarse=True)
+
+    def _viewChanged(self):
+        self._requestProjection(coarse=True)
+
+    def _viewport(self, coarse):
+        # """坐标轴的屏幕像素尺寸；交互时按比例缩小"""
+        bbox = self.ax.get_window_extent()
+        scale = self.DRAG_DOWNSCALE if coarse else 1
+        return max(int(bbox.height) // scale, 16), max(int(bbox.width) // scale, 16)
+
+    def _requestProjection(self, coarse):
+        self._token.cancel()
+        self._token = CancellationToken()
+        self.scheduler.submit(self._project, self.azimuth_slider.value(), self.elevation_slider.value(),
+                              self.window, self._viewport(coarse), cancel_token=self._token)
+        if coarse:
+            self.refine_timer.start(self.REFINE_DELAY_MS)
+
+    def _project(self, azimuth, elevation, window, viewport, cancel_token=None):
+        # """后台任务：投影并取显示上限（可能需要生成金字塔的粗级别，不在界面线程中进行）"""
+        image, level, window = self.renderer.render(azimuth, elevation, window, viewport, cancel_token=cancel_token)
+        # 最大值金字塔最粗级别的最大值即全体最大值
+        vmax = float(np.max(self.renderer.pyramid.level(self.renderer.pyramid.n_levels - 1))) or 1.0
+        return image, level, window, vmax
+
+    def _showProjection(self, job_id, payload):
+        image, level, (u0, u1, v0, v1), vmax = payload
+        self.image.set_data(image)
+        self.image.set_extent((u0, u1, v0, v1))
+        self.image.set_clim(0, vmax)
+        self.ax.set_xlim(u0, u1)
+        self.ax.set_ylim(v0, v1)
+        voxel = self.renderer.pyramid.scale(level).max()
+        self.lod_label.setText(f"LOD 第{level}级（体素 {voxel:g}×），投影 {image.shape[1]}×{image.shape[0]}")
+        self.canvas.draw_idle()
+
+    def _handleError(self, job_id, message):
+        QMessageBox.critical(self, "错误", message)
+
+    # ---------- 鼠标交互 ----------
+    def _onPress(self, event):
+        if event.button == 1 and event.inaxes is self.ax:
+            self._drag_origin = (event.x, event.y, self.azimuth_slider.value(), self.elevation_slider.value())
+
+    def _onMotion(self, event):
+        if self._drag_origin is None:
+            return
+        x0, y0, azimuth, elevation = self._drag_origin
+        self.azimuth_slider.blockSignals(True)
+        self.elevation_slider.blockSignals(True)
+        self.azimuth_slider.setValue(int(azimuth - (event.x - x0) * 0.5) % 360)
+        self.elevation_slider.setValue(int(np.clip(elevation - (event.y - y0) * 0.5, -90, 90)))
+        self.azimuth_slider.blockSignals(False)
+        self.elevation_slider.blockSignals(False)
+        self._requestProjection(coarse=True)
+
+    def _onRelease(self, event):
+        if self._drag_origin is not None:
+            self._drag_origin = None
+            self._requestProjection(coarse=False)
+
+    def _onScroll(self, event):
+        # 以光标为中心缩放视窗；放大后自动切换到更细的金字塔级别
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
+        factor = 0.8 if event.button == 'up' else 1.25
+        u0, u1, v0, v1 = self.window
+        cx, cy = event.xdata, event.ydata
+        self.window = (cx + (u0 - cx) * factor, cx + (u1 - cx) * factor,
+                       cy + (v0 - cy) * factor, cy + (v1 - cy) * factor)
+        self._requestProjection(coarse=True)
+
+    def closeEvent(self, event):
+        self._token.cancel()
+        self.refine_timer.stop()
+        super().closeEvent(event)
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from cancellation import CancellationToken, OperationCancelled
+
+
+class ZPlaneCache(QObject):
+    """z层结果缓存
+
+    请求的z层最先计算，随后后台线程按与滑块的距离由近到远预取邻近层；
+    缓存按最近使用顺序（LRU）淘汰，总内存不超过 max_bytes。
+    更换数据源（图像/PSF变化）时取消正在进行的计算并清空缓存。
+    """
+    plane_ready = pyqtSignal(int, int, object)  # 数据源版本, z层, 结果
+    error_occurred = pyqtSignal(int, str)
+
+    def __init__(self, max_bytes=512 * 1024 ** 2, parent=None):
+        super().__init__(parent)
+        self.max_bytes = max_bytes
+        self._planes = OrderedDict()  # z -> 结果（LRU顺序）
+        self._bytes = 0
+        self._compute = None
+        self._n_planes = 0
+        self._version = 0
+        self._focus = 0
+        self._token = CancellationToken()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def version(self):
+        return self._version
+
+    def set_source(self, compute_fn, n_planes, focus=0):
+        """设置新的数据源：compute_fn(z, cancel_token) 返回第z层结果"""
+        with self._cond:
+            self._token.cancel()
+            self._token = CancellationToken()
+            self._version += 1
+            self._compute = compute_fn
+            self._n_planes = n_planes
+            self._planes.clear()
+            self._bytes = 0
+            self._focus = min(max(focus, 0), n_planes - 1)
+            self._cond.notify()
+            return self._version
+
+    def clear(self):
+        with self._cond:
+            self._token.cancel()
+            self._version += 1
+            self._compute = None
+            self._planes.clear()
+            self._bytes = 0
+
+    def get(self, z):
+        """返回已缓存的z层（并标记为最近使用），未缓存时返回 None"""
+        with self._cond:
+            plane = self._planes.get(z)
+            if plane is not None:
+                self._planes.move_to_end(z)
+            return plane
+
+    def peek(self, z):
+        """返回已缓存的z层但不改变淘汰顺序（供其他后台计算复用）"""
+        with self._cond:
+            return self._planes.get(z)
+
+    def request(self, z):
+        """把预取中心移到z层；已缓存时直接返回结果"""
+        with self._cond:
+            self._focus = z
+            plane = self._planes.get(z)
+            if plane is not None:
+                self._planes.move_to_end(z)
+            self._cond.notify()
+            return plane
+
+    def _capacity(self):
+        # """按已缓存层的大小估计可容纳层数"""
+        if not self._planes:
+            return self._n_planes
+        plane_bytes = self._bytes / len(self._planes)
+        return max(1, int(self.max_bytes // max(plane_bytes, 1)))
+
+    def _next_plane(self):
+        # """选择下一个待计算层：请求层优先，然后在容量允许的半径内由近到远"""
+        if self._compute is None:
+            return None
+        radius = min(self._n_planes, max((self._capacity() - 1) // 2, 0))
+        for d in range(radius + 1):
+            for z in (self._focus - d, self._focus + d) if d else (self._focus,):
+                if 0 <= z < self._n_planes and z not in self._planes:
+                    return z
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                z = self._next_plane()
+                while z is None:
+                    self._cond.wait()
+                    z = self._next_plane()
+                compute, token, version = self._compute, self._token, self._version
+
+            try:
+                plane = compute(z, token)
+            except OperationCancelled:
+                continue
+            except Exception as e:
+                # 出错时停止预取该数据源，等待新的数据源
+                with self._cond:
+                    if version != self._version:
+                        continue
+                    self._compute = None
+                self.error_occurred.emit(version, str(e))
+                continue
+
+            with self._cond:
+                if version != self._version:
+                    continue
+                self._planes[z] = plane
+                self._bytes += plane.nbytes
+                # LRU淘汰（保留刚写入的层）
+                while self._bytes > self.max_bytes and len(self._planes) > 1:
+                    _, old = self._planes.popitem(last=False)
+                    self._bytes -= old.nbytes
+            self.plane_ready.emit(version, z, plane)
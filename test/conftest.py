@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 被测模块位于 python/ 目录（平铺模块，无包结构）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
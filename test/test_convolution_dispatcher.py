@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from scipy.signal import fftconvolve
+
+from convolution_dispatcher import ConvolutionDispatcher
+
+
+@pytest.fixture
+def dispatcher(tmp_path):
+    return ConvolutionDispatcher(calibration_path=str(tmp_path / 'calibration.json'))
+
+
+@pytest.mark.parametrize('method', ConvolutionDispatcher.METHODS)
+@pytest.mark.parametrize('kernel_shape', [(7, 7), (8, 6), (9, 4)])
+def test_methods_match_fftconvolve(dispatcher, method, kernel_shape):
+    rng = np.random.default_rng(0)
+    image = rng.random((61, 53))
+    image[image < 0.9] = 0  # 稀疏物体，覆盖 sparse 方法的两种遍历方向
+    # 可分离核（外积），所有方法都适用
+    kernel = np.outer(rng.random(kernel_shape[0]), rng.random(kernel_shape[1]))
+    result = dispatcher.convolve(image, kernel, method)
+    assert result.shape == image.shape
+    np.testing.assert_allclose(result, fftconvolve(image, kernel, mode='same'), atol=1e-10)
+    assert dispatcher.last_method == method
+
+
+def test_auto_matches_fftconvolve(dispatcher):
+    rng = np.random.default_rng(1)
+    image, kernel = rng.random((40, 40)), rng.random((5, 5))
+    np.testing.assert_allclose(dispatcher.convolve(image, kernel), fftconvolve(image, kernel, mode='same'),
+                               atol=1e-10)
+    assert dispatcher.last_method in ConvolutionDispatcher.METHODS
+
+
+def test_separable_rejects_non_separable_kernel(dispatcher):
+    kernel = np.random.default_rng(2).random((5, 5))
+    with pytest.raises(ValueError):
+        dispatcher.convolve(np.ones((16, 16)), kernel, 'separable')
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from scipy.signal import fftconvolve
+
+from convolution_handler import ConvolutionHandler
+
+
+def _volume(shape, seed):
+    # 取值较小，避免结果截断到 [0, 1]
+    return (np.random.default_rng(seed).random(shape) * 0.05).astype(np.float32)
+
+
+@pytest.mark.parametrize('depth, psf_depth', [(5, 9), (6, 7), (9, 4), (1, 5)])
+def test_three_dimensional_plane_matches_scipy_same(depth, psf_depth):
+    # 输出第z层 = 三维 'same' 卷积的第 z + depth//2 - (kz-1)//2 层（物体第j层位于焦面偏移 j - depth//2 处）
+    image, psf = _volume((40, 36, depth), 0), _volume((9, 8, psf_depth), 1)
+    full = fftconvolve(image, psf, mode='full')
+    offset = (psf_depth - 1) // 2
+    for z in range(psf_depth):
+        # 'same' 各轴取完整卷积的 [(k-1)//2, (k-1)//2 + n)，z轴换用PSF层索引
+        expected = full[4:44, 3:39, z + depth // 2]
+        result = ConvolutionHandler.convolve(image, psf, z_index=z)
+        np.testing.assert_allclose(result, expected, atol=1e-6)
+        if 0 <= z + depth // 2 - offset < depth:
+            same = fftconvolve(image, psf, mode='same')[:, :, z + depth // 2 - offset]
+            np.testing.assert_allclose(result, same, atol=1e-6)
+
+
+def test_two_dimensional_psf_projects_object():
+    image, psf = _volume((32, 32, 4), 2), _volume((7, 7), 3)
+    expected = fftconvolve(image.sum(axis=2), psf, mode='same')
+    np.testing.assert_allclose(ConvolutionHandler.convolve(image, psf), expected, atol=1e-6)
+
+
+def test_broadcast_object_uses_single_convolution():
+    plane, psf = _volume((32, 30), 4), _volume((7, 7, 5), 5)
+    image = np.broadcast_to(plane[:, :, None], plane.shape + (6,))
+    pairs = ConvolutionHandler.plane_pairs(image, psf, 2)
+    assert len(pairs) == 1
+    expected = ConvolutionHandler.convolve(np.ascontiguousarray(image), psf, z_index=2)
+    np.testing.assert_allclose(ConvolutionHandler.convolve(image, psf, z_index=2), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('tile_rows', [None, 1, 7, 50])
+def test_row_tiles_do_not_change_result(tile_rows):
+    image, psf = _volume((300, 280, 3), 6), _volume((15, 12, 5), 7)
+    reference = ConvolutionHandler.convolve(np.asarray(image), psf, z_index=1, tile_rows=10 ** 6)
+    np.testing.assert_allclose(ConvolutionHandler.convolve(image, psf, z_index=1, tile_rows=tile_rows), reference,
+                               atol=1e-6)
+
+
+def test_progress_reported_per_tile():
+    progress = []
+    ConvolutionHandler.convolve(_volume((512, 512), 8), _volume((31, 31), 9), progress_callback=progress.append)
+    assert len(progress) >= ConvolutionHandler.MIN_TILES and progress[-1] == 100
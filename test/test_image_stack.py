@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_stack import ImageStack
+
+
+def _save_tiff(path, pages, **options):
+    images = [Image.fromarray(page) for page in pages]
+    images[0].save(path, save_all=True, append_images=images[1:], **options)
+
+
+@pytest.fixture
+def pages():
+    return [np.random.default_rng(z).integers(0, 256, (24, 32), dtype=np.uint8) for z in range(12)]
+
+
+def test_uncompressed_tiff_is_memory_mapped(tmp_path, pages):
+    path = str(tmp_path / 'stack.tif')
+    _save_tiff(path, pages)
+    stack = ImageStack(path)
+    assert stack.memory_mapped and stack.shape == (24, 32, 12)
+    np.testing.assert_allclose(stack.page(5), pages[5] / 255, rtol=1e-6)
+
+
+def test_bottom_up_bmp_is_not_flipped(tmp_path):
+    # BMP 自下而上存放各行，不能按文件顺序内存映射
+    array = np.zeros((8, 64), dtype=np.uint8)
+    array[0] = 255
+    path = str(tmp_path / 'rows.bmp')
+    Image.fromarray(array).save(path)
+    page = ImageStack(path).page(0)
+    assert page[0, 0] == 1.0 and page[-1, 0] == 0.0
+
+
+def test_concurrent_decoding_keeps_cache_accounting(tmp_path, pages):
+    path = str(tmp_path / 'deflate.tif')
+    _save_tiff(path, pages, compression='tiff_deflate')
+    page_bytes = pages[0].nbytes
+    stack = ImageStack(path, cache_bytes=4 * page_bytes)
+    assert not stack.memory_mapped
+
+    def read(z):
+        return stack.page(z % 12)
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(read, range(12 * 20)))
+    for z, page in enumerate(results):
+        np.testing.assert_allclose(page, pages[z % 12] / 255, rtol=1e-6)
+    assert stack._decoded_bytes == sum(page.nbytes for page in stack._decoded.values())
+    assert len(stack._decoded) == 4
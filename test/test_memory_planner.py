@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import simulation_engine
+from memory_planner import object_footprint, plan_job, spec_footprint
+
+SCENE = {'size': [96, 80], 'primitives': [{'type': 'rect', 'p0': [20, 20], 'p1': [60, 50]}]}
+
+
+def _save_tiff(path, pages):
+    images = [Image.fromarray(page) for page in pages]
+    images[0].save(path, save_all=True, append_images=images[1:])
+
+
+@pytest.fixture
+def tiffs(tmp_path):
+    rng = np.random.default_rng(0)
+    single, stack = str(tmp_path / 'single.tif'), str(tmp_path / 'stack.tif')
+    _save_tiff(single, [rng.integers(0, 255, (40, 56), dtype=np.uint8)])
+    _save_tiff(stack, [rng.integers(0, 255, (40, 56), dtype=np.uint8) for _ in range(5)])
+    return single, stack
+
+
+def test_spec_footprint_matches_loaded_object(tiffs):
+    single, stack = tiffs
+    specs = [{'scene': SCENE}, {'scene': dict(SCENE, unit_size=1e-6, pixel_size=0.5e-6), 'z_depth': 4},
+             {'path': single}, {'path': single, 'z_depth': 3}, {'path': stack}]
+    for spec in specs:
+        assert spec_footprint(spec) == object_footprint(simulation_engine.load_object(spec)), spec
+
+
+def test_plan_job_does_not_load_object(tiffs, monkeypatch):
+    monkeypatch.setattr(simulation_engine, 'load_object', lambda spec: pytest.fail("规划时载入了物体"))
+    for spec in ({'scene': SCENE}, {'path': tiffs[1]}):
+        plan = plan_job({'psf': {'model': 'gaussian', 'size': 32, 'size_z': 8}, 'object': spec}, budget=1 << 30)
+        assert plan.fits and 'convolve' in plan.stages
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from convolution_handler import ConvolutionHandler
+from preview_pipeline import OTFPyramid, PreviewPipeline
+
+
+def _scene(shape=(256, 256)):
+    image = np.zeros(shape, dtype=np.float32)
+    image[shape[0] // 3:shape[0] // 2, 60:shape[1] // 2 + 20] = 1
+    image[shape[0] * 2 // 3, 30:shape[1] - 30] = 1
+    return image
+
+
+def _gaussian(shape, sigma):
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    kernel = np.exp(-((y - (shape[0] - 1) // 2) ** 2 + (x - (shape[1] - 1) // 2) ** 2) / (2 * sigma ** 2))
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def _centroid(image):
+    rows, cols = np.mgrid[:image.shape[0], :image.shape[1]]
+    return (image * rows).sum() / image.sum(), (image * cols).sum() / image.sum()
+
+
+def test_full_resolution_matches_convolve():
+    image, kernel = _scene(), _gaussian((31, 31), 3.0)
+    result = OTFPyramid().convolve(image, kernel, factor=1)
+    np.testing.assert_allclose(np.clip(result, 0, 1), ConvolutionHandler.convolve(image, kernel), atol=1e-5)
+
+
+@pytest.mark.parametrize('factor, tolerance', [(2, 0.03), (4, 0.08)])
+@pytest.mark.parametrize('kernel_shape', [(31, 31), (32, 32), (33, 30)])
+def test_preview_error_bounds(factor, tolerance, kernel_shape):
+    # 核明显宽于降采样块时，预览与完整结果的最大误差受块尺寸限制；质心偏差只来自物体按块量化（远小于一个块）
+    image, kernel = _scene(), _gaussian(kernel_shape, 4.0)
+    full = ConvolutionHandler.convolve(image, kernel)
+    preview = PreviewPipeline().preview(image, kernel, factor=factor)
+    assert preview.shape == full.shape
+    assert np.abs(preview - full).max() < tolerance
+    np.testing.assert_allclose(_centroid(preview), _centroid(full), atol=0.05 * factor)
+
+
+def test_preview_of_three_dimensional_psf_uses_plane():
+    image = _scene((128, 128))
+    psf = np.stack([_gaussian((21, 21), s) for s in (2.0, 3.0, 4.0)], axis=2)
+    full = ConvolutionHandler.convolve(image, psf, z_index=2)
+    preview = PreviewPipeline().preview(image, psf, z_index=2, factor=2)
+    assert np.abs(preview - full).max() < 0.03
+
+
+def test_otf_cache_reuses_entries():
+    pyramid = OTFPyramid(max_entries=2)
+    kernel = _gaussian((15, 15), 2.0)
+    first = pyramid.otf(kernel, 2, (64, 64))[0]
+    assert pyramid.otf(kernel, 2, (64, 64))[0] is first
+    pyramid.otf(kernel, 4, (32, 32))
+    pyramid.otf(kernel, 2, (128, 128))
+    assert pyramid.otf(kernel, 2, (64, 64))[0] is not first  # 超出条目上限后淘汰最久未用的
@@ -0,0 +1,51 @@
+import numpy as np
+
+import simulation_engine
+from memory_planner import plan_memory
+from psf_support import axial_tail, describe_report, truncate_psf
+
+
+def test_axial_truncation_is_detected():
+    psf = simulation_engine.generate_psf('gaussian', {'size': 64, 'size_z': 4})
+    _, report = truncate_psf(psf)
+    assert report.contained and not report.axial_contained
+    assert report.axial_tail > 1e-3
+    assert "轴向层数不足" in describe_report(report)
+
+
+def test_axial_tail_extrapolates_geometric_falloff():
+    totals = 0.5 ** np.abs(np.arange(-5, 6))
+    expected = 2 * 0.5 ** 5 / totals.sum()  # 每侧 0.5**6 + 0.5**7 + ... = 0.5**5
+    assert np.isclose(axial_tail(totals), expected)
+    assert axial_tail(np.ones(8)) is None
+
+
+def test_auto_size_extends_size_z():
+    psf, report, params = simulation_engine.auto_size_psf('gaussian', {'size': 64, 'size_z': 4})
+    assert params['size_z'] > 4
+    assert report.contained and report.axial_contained and report.extendable
+    # 扩展后的结果与一次生成足够大的核再裁剪一致
+    reference, _ = truncate_psf(simulation_engine.generate_psf('gaussian', {'size': 64, 'size_z': 64}))
+    assert psf.shape == reference.shape
+    np.testing.assert_allclose(psf, reference, rtol=1e-6)
+
+
+def test_size_z_respects_cap():
+    _, report, params = simulation_engine.auto_size_psf('gaussian', {'size': 64, 'size_z': 4}, max_size_z=8)
+    assert params['size_z'] == 8
+    assert not report.axial_contained and report.extendable
+    assert "尺寸上限" in describe_report(report)
+
+
+def test_crop_only_models_say_so():
+    _, report, params = simulation_engine.auto_size_psf('airy', {'size': 64})
+    assert params == {'size': 64}
+    assert not report.contained and report.extendable is False
+    assert "只在生成的核内裁剪" in describe_report(report)
+
+
+def test_plan_doubles_size_z_within_budget():
+    plan = plan_memory((64, 64, 4), 'gaussian', support=True, max_size=128, max_size_z=64, budget=1 << 30)
+    assert plan.support_size == 128 and plan.support_size_z == 64
+    plan = plan_memory((64, 64, 4), 'gaussian', support=True, max_size=128, budget=1 << 30)
+    assert plan.support_size_z is None
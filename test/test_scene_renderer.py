@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from scene_renderer import SceneRenderer
+
+
+def _gaussian_psf(size=21, depth=5):
+    y, x = np.mgrid[:size, :size] - (size - 1) / 2
+    planes = [np.exp(-(x ** 2 + y ** 2) / (2 * (1.5 + 0.3 * z) ** 2)) for z in range(depth)]
+    psf = np.stack(planes, axis=2)
+    return psf / psf.sum(axis=(0, 1))
+
+
+@pytest.mark.parametrize('z', [0.0, 2.0])
+def test_stamps_agree_with_fft_on_integer_positions(z):
+    rng = np.random.default_rng(0)
+    n = 40
+    emitters = np.column_stack([rng.integers(5, 95, n), rng.integers(5, 75, n), np.full(n, z), rng.random(n) + 0.5])
+    psf = _gaussian_psf()
+    stamp = SceneRenderer(psf, density_threshold=np.inf).render(emitters, (80, 100))
+    fft = SceneRenderer(psf, density_threshold=0).render(emitters, (80, 100))
+    assert np.abs(stamp - fft).max() < 1e-4 * fft.max()
+
+
+def test_stamps_agree_with_fft_in_energy_on_subpixel_positions():
+    # 亚像素位置：FFT路径为双线性散点（会展宽），只比较总能量
+    rng = np.random.default_rng(1)
+    n = 40
+    emitters = np.column_stack([rng.uniform(5, 95, n), rng.uniform(5, 75, n), np.zeros(n), np.ones(n)])
+    psf = _gaussian_psf()
+    stamp_renderer = SceneRenderer(psf, oversample=8, density_threshold=np.inf)
+    stamp = stamp_renderer.render(emitters, (80, 100))
+    fft = SceneRenderer(psf, density_threshold=0).render(emitters, (80, 100))
+    assert stamp_renderer.last_method == 'stamp'
+    np.testing.assert_allclose(stamp.sum(), fft.sum(), rtol=1e-3)
+
+
+@pytest.mark.parametrize('x, y', [(40.25, 30.5), (40.75, 30.125)])
+def test_stamp_centroid_at_subpixel_position(x, y):
+    renderer = SceneRenderer(_gaussian_psf(), oversample=8, density_threshold=np.inf)
+    image = renderer.render([[x, y, 0.0, 1.0]], (64, 80)).astype(np.float64)
+    rows, cols = np.mgrid[:64, :80]
+    assert abs((image * cols).sum() / image.sum() - x) < 1 / 16
+    assert abs((image * rows).sum() / image.sum() - y) < 1 / 16
@@ -0,0 +1,106 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import simulation_engine
+from simulation_client import SimulationClient
+import simulation_service
+from simulation_service import SimulationService, make_server
+
+SCENE = {'size': [96, 80], 'primitives': [{'type': 'rect', 'p0': [20, 20], 'p1': [60, 50], 'width': 3},
+                                          {'type': 'segment', 'p0': [10, 70], 'p1': [85, 15]}]}
+
+
+def _job(z_planes='all', **psf):
+    return {'psf': psf or {'model': 'gaussian', 'size': 32, 'size_z': 6}, 'object': {'scene': SCENE},
+            'z_planes': z_planes}
+
+
+@pytest.fixture
+def service():
+    service = SimulationService(batch_window=0.02)
+    yield service
+    service.close()
+
+
+@pytest.mark.parametrize('job', [_job(), _job('center'), _job(model='gaussian2d', size=15, sigma=2.0),
+                                 dict(_job([1, 4]), object={'scene': SCENE, 'z_depth': 5})])
+def test_matches_engine(service, job):
+    result, planes, _ = service.simulate(job)
+    _, expected_planes, expected = simulation_engine.simulate(job)
+    assert planes == expected_planes
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+
+
+def test_concurrent_requests_share_psf_and_batch(service):
+    jobs = [_job(z) for z in range(6)]
+    with ThreadPoolExecutor(len(jobs)) as pool:
+        results = list(pool.map(service.simulate, jobs))
+    for job, (result, _, _) in zip(jobs, results):
+        np.testing.assert_allclose(result, simulation_engine.simulate(job)[2], atol=1e-5)
+    status = service.status()
+    assert status['requests'] == len(jobs)
+    assert status['psf_cache']['entries'] == 1
+    assert status['batches'] < len(jobs)
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(**options):
+        server = make_server(port=0, batch_window=0.001, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return SimulationClient(f"127.0.0.1:{server.server_address[1]}")
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.service.close()
+
+
+def test_client_round_trip(serve):
+    client = serve()
+    job = _job('center')
+    np.testing.assert_allclose(client.simulate(job), simulation_engine.simulate(job)[2], atol=1e-5)
+    psf = client.psf(job['psf'])
+    np.testing.assert_allclose(psf, simulation_engine.job_psf(job), rtol=1e-6)
+    assert client.status()['results'] == 0  # 客户端读取后已释放
+    with pytest.raises(ValueError):
+        client.simulate(_job(model='unknown', size=8))
+
+
+def test_output_only_inside_output_dir(serve, tmp_path):
+    job = _job('center')
+    with pytest.raises(ValueError):
+        serve().simulate_to_file(job, str(tmp_path / 'out.npy'))
+    assert not (tmp_path / 'out.npy').exists()
+
+    client = serve(output_dir=str(tmp_path / 'results'))
+    for name in ('../escape.npy', str(tmp_path / 'escape.npy'), '.'):
+        with pytest.raises(ValueError):
+            client.simulate_to_file(job, name)
+    assert not (tmp_path / 'escape.npy').exists()
+    reply = client.simulate_to_file(job, 'out.npy')
+    assert reply['path'] == os.path.realpath(tmp_path / 'results' / 'out.npy')
+    np.testing.assert_allclose(np.load(reply['path']), simulation_engine.simulate(job)[2], atol=1e-5)
+
+
+def test_status_releases_expired_results(service, monkeypatch):
+    monkeypatch.setattr(simulation_service, 'RESULT_TTL', -1)
+    service.publish(np.zeros((4, 4), dtype=np.float32))
+    assert service.status()['results'] == 0
+
+
+
+def test_psf_finished_by_another_thread_is_not_regenerated(service, monkeypatch):
+    spec = {'model': 'gaussian2d', 'size': 15, 'sigma': 2.0}
+    psf, _ = service.psf(spec)
+    # 模拟另一线程在本线程查缓存之后才生成完毕：首次查缓存未命中，持锁复查时应取到缓存
+    monkeypatch.setattr(service.psf_cache, 'get', lambda key: None)
+    monkeypatch.setattr(simulation_engine, 'load_psf', lambda spec: pytest.fail("PSF 被重复生成"))
+    assert service.psf(spec)[0] is psf
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import simulation_engine
+from cancellation import CancellationToken, OperationCancelled
+from sweep_runner import SweepRunner, SweepStore
+
+
+def _job(sizes):
+    return {'psf': {'model': 'gaussian2d', 'size': 15, 'sigma': 1.0},
+            'object': {'scene': {'size': [48, 40], 'primitives': [{'type': 'rect', 'p0': [10, 10], 'p1': [30, 25]}]}},
+            'sweep': {'psf.sigma': [1.0, 2.0, 3.0], 'psf.size': sizes}}
+
+
+def test_failed_points_are_recorded_and_do_not_stop_the_sweep(tmp_path):
+    store = SweepStore(str(tmp_path), _job([15, -5]))
+    summary = SweepRunner(store, workers=2).run()
+    assert summary['completed'] == 3 and summary['failed'] == 3
+    assert sorted(f['task'] for f in summary['failures']) == [1, 3, 5]
+    assert all('negative' in f['error'] for f in summary['failures'])
+    job = store.task_job(2)
+    np.testing.assert_allclose(store.read(2), simulation_engine.simulate(job)[2], atol=1e-6)
+
+    # 续算：只重试失败的点，失败仍登记在索引中
+    reopened = SweepStore(str(tmp_path))
+    assert sorted(reopened.failed) == [1, 3, 5] and len(reopened.completed) == 3
+    assert reopened.pending() == [1, 3, 5]
+    summary = SweepRunner(reopened).run()
+    assert summary['computed'] == 3 and summary['failed'] == 3
+
+
+def test_cancel_keeps_finished_points(tmp_path):
+    store = SweepStore(str(tmp_path), _job([15, 17]))
+    token = CancellationToken()
+
+    def progress(done, total):
+        if done >= 2:
+            token.cancel()
+
+    with pytest.raises(OperationCancelled):
+        SweepRunner(store, workers=2).run(progress, token)
+    finished = set(SweepStore(str(tmp_path)).completed)
+    assert len(finished) >= 2
+
+    resumed = SweepStore(str(tmp_path))
+    summary = SweepRunner(resumed, workers=2).run()
+    assert summary['computed'] == 6 - len(finished)
+    assert summary['completed'] == 6 and summary['failed'] == 0
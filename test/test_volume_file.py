@@ -0,0 +1,81 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from volume_file import VolumeFile, open_stack, save_volume
+
+
+@pytest.fixture
+def volume():
+    return np.random.default_rng(0).random((33, 47, 11)).astype(np.float32)
+
+
+@pytest.mark.parametrize('codec', ['zlib', 'none'])
+def test_round_trip(tmp_path, volume, codec):
+    path = str(tmp_path / 'volume.psv')
+    metadata = {'kind': 'psf', 'voxel_size': [0.1, 0.1, 0.2]}
+    save_volume(path, volume, metadata, codec=codec, chunk_depth=4)
+    stack = open_stack(path)
+    assert isinstance(stack, VolumeFile)
+    assert stack.shape == volume.shape
+    assert stack.metadata == metadata
+    assert stack.voxel_size == [0.1, 0.1, 0.2]
+    np.testing.assert_array_equal(np.asarray(stack), volume)
+    np.testing.assert_array_equal(stack[5:9, :, 7], volume[5:9, :, 7])
+    np.testing.assert_allclose(stack.sum(axis=2), volume.sum(axis=2), rtol=1e-6)
+
+
+def test_uncompressed_pages_are_memory_mapped(tmp_path, volume):
+    path = str(tmp_path / 'volume.psv')
+    save_volume(path, volume, codec='none', chunk_depth=4)
+    stack = VolumeFile(path)
+    assert stack.memory_mapped
+    assert isinstance(stack._raw_page(6), np.memmap)
+    np.testing.assert_array_equal(stack.page(6), volume[:, :, 6])
+
+
+def test_compressed_chunks_respect_cache_limit(tmp_path, volume):
+    path = str(tmp_path / 'volume.psv')
+    save_volume(path, volume, codec='zlib', chunk_depth=2)
+    chunk_bytes = 2 * volume[:, :, 0].nbytes
+    stack = VolumeFile(path, cache_bytes=2 * chunk_bytes)
+    assert not stack.memory_mapped
+    for z in range(volume.shape[2]):
+        np.testing.assert_array_equal(stack.page(z), volume[:, :, z])
+    assert stack._decoded_bytes == sum(chunk.nbytes for chunk in stack._decoded.values()) <= 2 * chunk_bytes
+
+
+def test_pickle_reopens_lazily(tmp_path, volume):
+    path = str(tmp_path / 'volume.psv')
+    save_volume(path, volume)
+    stack = pickle.loads(pickle.dumps(VolumeFile(path)))
+    np.testing.assert_array_equal(stack.page(3), volume[:, :, 3])
+
+
+def test_two_dimensional_round_trip(tmp_path, volume):
+    path = str(tmp_path / 'plane.psv')
+    save_volume(path, volume[:, :, 0])
+    stack = open_stack(path)
+    assert stack.shape == volume.shape[:2]
+    np.testing.assert_array_equal(np.asarray(stack), volume[:, :, 0])
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'bad.psv'
+    path.write_bytes(b'not a volume')
+    with pytest.raises(ValueError):
+        VolumeFile(str(path))
+
+
+def test_concurrent_chunk_reads_keep_cache_accounting(tmp_path, volume):
+    from concurrent.futures import ThreadPoolExecutor
+    path = str(tmp_path / 'volume.psv')
+    save_volume(path, volume, codec='zlib', chunk_depth=1)
+    stack = VolumeFile(path, cache_bytes=3 * volume[:, :, 0].nbytes)
+    with ThreadPoolExecutor(4) as pool:
+        pages = list(pool.map(lambda i: stack.page(i % 11), range(11 * 20)))
+    for i, page in enumerate(pages):
+        np.testing.assert_array_equal(page, volume[:, :, i % 11])
+    assert stack._decoded_bytes == sum(chunk.nbytes for chunk in stack._decoded.values())
+    assert len(stack._decoded) == 3